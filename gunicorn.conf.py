@@ -0,0 +1,33 @@
+# gunicorn.conf.py - loaded automatically by gunicorn from the working directory
+
+import os
+import shutil
+import tempfile
+
+# Workers share Prometheus metrics through files in this directory (see
+# movies/metrics.py). It must be set before the app is imported in the workers.
+os.environ.setdefault(
+    'PROMETHEUS_MULTIPROC_DIR', os.path.join(tempfile.gettempdir(), 'movie_recommendation_metrics')
+)
+
+
+def on_starting(server):
+    # Start every deployment from zeroed counters
+    metrics_dir = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
+
+
+def post_worker_init(worker):
+    # Warm each worker up before it accepts requests. A failure is logged and
+    # retried by the readiness probe (/ready/) rather than failing the boot.
+    from movies.warmup import warm_up
+    try:
+        warm_up()
+    except Exception:
+        worker.log.exception("Warm-up failed")
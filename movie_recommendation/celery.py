@@ -0,0 +1,18 @@
+"""
+Celery config for movie_recommendation project.
+
+Background jobs (cache warming) live in each app's ``tasks.py`` and are
+discovered automatically. Run a worker with the beat scheduler embedded:
+
+    celery -A movie_recommendation worker -B --loglevel=info
+"""
+
+import os
+
+from celery import Celery
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'movie_recommendation.settings')
+
+app = Celery('movie_recommendation')
+app.config_from_object('django.conf:settings', namespace='CELERY')
+app.autodiscover_tasks()
@@ -3,6 +3,8 @@ from django.urls import path, include
 from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
 from rest_framework import permissions
+from movies.metrics import metrics_view
+from movies.warmup import readiness_view
 
 # Swagger schema view
 schema_view = get_schema_view(
@@ -21,6 +23,8 @@ schema_view = get_schema_view(
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('movies/', include('movies.urls')),
+    path('metrics/', metrics_view, name='metrics'),
+    path('ready/', readiness_view, name='readiness'),
     
     # Swagger endpoints
     path('api/docs/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
@@ -0,0 +1,67 @@
+# movies/authentication.py
+
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.settings import api_settings
+from .models import CachedUser
+
+try:
+    from rest_framework_simplejwt.utils import get_md5_hash_password
+except ImportError:  # simplejwt releases before the revoke-token check
+    get_md5_hash_password = None
+
+# Seconds a user resolved from a token is reused by later requests
+USER_CACHE_TIMEOUT = 60 * 5
+# User fields kept in the cache; the request path needs nothing else
+CACHED_FIELDS = ('id', 'username', 'is_active', 'is_staff', 'is_superuser')
+# Seconds a dropped entry stays blocked, so that a request which read the
+# user before the change cannot cache the old state again
+TOMBSTONE_TIMEOUT = 60
+_TOMBSTONE = 'forgotten'
+
+
+def user_cache_key(user_id):
+    return f'auth:user:{user_id}'
+
+
+def forget_user(user_id):
+    key = user_cache_key(user_id)
+    cache.set(key, _TOMBSTONE, TOMBSTONE_TIMEOUT)
+    # Again once the change is visible to other connections
+    transaction.on_commit(lambda: cache.set(key, _TOMBSTONE, TOMBSTONE_TIMEOUT))
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that resolves the token's user through the cache
+    instead of querying the database on every request.
+
+    Only active users are cached, as CACHED_FIELDS and a hash of their
+    password hash (for the revoke-token check); cached users come back as
+    read-only CachedUser instances holding just those fields. Entries are only added, never overwritten, and any save or
+    deletion of a user (which includes deactivating them or changing
+    their password) replaces the entry with a short-lived tombstone (see
+    signals.py). Updates made with QuerySet.update() bypass those signals;
+    call forget_user() after them.
+    """
+
+    def get_user(self, validated_token):
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        entry = None if user_id is None else cache.get(user_cache_key(user_id))
+        if not isinstance(entry, dict):
+            # Raises for unknown or inactive users and revoked tokens
+            user = super().get_user(validated_token)
+            entry = {field: getattr(user, field) for field in CACHED_FIELDS}
+            if get_md5_hash_password is not None:
+                entry['password_hash'] = get_md5_hash_password(user.password)
+            cache.add(user_cache_key(user_id), entry, USER_CACHE_TIMEOUT)
+            return user
+
+        if getattr(api_settings, 'CHECK_REVOKE_TOKEN', False) and (
+            validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != entry.get('password_hash')
+        ):
+            raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+        return CachedUser(**{field: entry[field] for field in CACHED_FIELDS})
@@ -0,0 +1,157 @@
+# movies/cache_warmer.py
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.cache import cache
+from . import rate_limiter, tmdb_api
+
+logger = logging.getLogger(__name__)
+
+TIME_WINDOWS = ('day', 'week')
+
+
+class RateBudget:
+    """
+    Thread-safe budget for upstream TMDb calls made during a single warm-up.
+    Caps both the total number of calls and the rate at which they start.
+    """
+
+    def __init__(self, max_calls, calls_per_second):
+        self.max_calls = max_calls
+        self.interval = 1.0 / calls_per_second if calls_per_second else 0
+        self.calls = 0
+        self._next_slot = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Reserve one call. Returns False once the budget is spent, otherwise
+        sleeps until the call's slot comes up and returns True.
+        """
+        with self._lock:
+            if self.calls >= self.max_calls:
+                return False
+            self.calls += 1
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+        return True
+
+
+class CacheWarmer:
+    """
+    Pre-fetches the TMDb payloads behind /movies/trending/ and
+    /movies/details/<id>/ so the first users after a deploy or a Redis
+    flush are served from cache.
+
+    Trending pages are always re-fetched. Details and recommendations are only
+    re-fetched when missing or when they would expire before the next run.
+    """
+
+    def __init__(self, pages=None, max_workers=None, max_calls=None,
+                 calls_per_second=None, interval=None):
+        self.pages = pages or settings.CACHE_WARMER_TRENDING_PAGES
+        self.max_workers = max_workers or settings.CACHE_WARMER_MAX_WORKERS
+        self.interval = interval or settings.CACHE_WARMER_INTERVAL
+        self.budget = RateBudget(
+            max_calls or settings.CACHE_WARMER_MAX_CALLS,
+            calls_per_second or settings.CACHE_WARMER_CALLS_PER_SECOND,
+        )
+        self.warmed = 0
+        self.failed = 0
+        self.skipped = 0
+        self._lock = threading.Lock()
+
+    def run(self):
+        """
+        Warm trending pages for every time window, then the details and
+        recommendations of every movie they contain.
+
+        Returns:
+            Dict report with the number of keys warmed, failed and skipped
+            plus the elapsed time in seconds.
+        """
+        started = time.monotonic()
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            pages = list(executor.map(
+                lambda job: self._warm(
+                    tmdb_api.get_trending_movies, job[0], job[1], refresh=True
+                ),
+                [(window, page) for window in TIME_WINDOWS
+                 for page in range(1, self.pages + 1)],
+            ))
+
+            movie_ids = []
+            for data in pages:
+                for movie in (data or {}).get('results', []):
+                    if movie.get('id') not in movie_ids:
+                        movie_ids.append(movie.get('id'))
+
+            jobs = []
+            for movie_id in movie_ids:
+                if self._needs_refresh(tmdb_api.details_cache_key(movie_id)):
+                    jobs.append((tmdb_api.get_movie_details, (movie_id,)))
+                else:
+                    self.skipped += 1
+                if self._needs_refresh(tmdb_api.recommendations_cache_key(movie_id, 1)):
+                    jobs.append((tmdb_api.get_movie_recommendations, (movie_id, 1)))
+                else:
+                    self.skipped += 1
+            list(executor.map(
+                lambda job: self._warm(job[0], *job[1], refresh=True), jobs
+            ))
+
+        report = {
+            'keys_warmed': self.warmed,
+            'keys_failed': self.failed,
+            'keys_skipped': self.skipped,
+            'upstream_calls': self.budget.calls,
+            'duration': round(time.monotonic() - started, 3),
+        }
+        logger.info(
+            "Cache warm-up finished: %(keys_warmed)d warmed, %(keys_failed)d failed, "
+            "%(keys_skipped)d still fresh in %(duration).3fs", report
+        )
+        return report
+
+    def _warm(self, fetch, *args, **kwargs):
+        """
+        Call one tmdb_api function within the rate budget and record the outcome.
+        """
+        if not self.budget.acquire():
+            with self._lock:
+                self.skipped += 1
+            return None
+
+        with rate_limiter.lane(rate_limiter.BACKGROUND):
+            data = fetch(*args, **kwargs)
+        with self._lock:
+            if 'error' in data:
+                self.failed += 1
+            else:
+                self.warmed += 1
+        return data
+
+    def _needs_refresh(self, cache_key):
+        """
+        A key needs warming if it is missing or expires before the next run.
+        Backends without TTL introspection are always refreshed.
+        """
+        if not hasattr(cache, 'ttl'):
+            return True
+        ttl = cache.ttl(cache_key)
+        # django-redis: 0 means missing, None means no expiry
+        return ttl is not None and ttl <= self.interval
+
+
+def warm_cache(**options):
+    """
+    Run a full warm-up with settings defaults overridden by ``options``.
+    """
+    return CacheWarmer(**options).run()
@@ -0,0 +1,44 @@
+# movies/conditional.py
+
+import hashlib
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+
+def make_etag(*parts):
+    """
+    Strong ETag (quoted, as sent in headers) for a representation described by ``parts``.
+    """
+    digest = hashlib.md5(repr(parts).encode(), usedforsecurity=False).hexdigest()
+    return f'"{digest}"'
+
+
+def not_modified(request, etag=None, last_modified=None):
+    """
+    A 304 Not Modified response if the request's If-None-Match or
+    If-Modified-Since validators still match, otherwise None.
+
+    Args:
+        request: The incoming request
+        etag: Quoted ETag of the current representation
+        last_modified: Aware datetime the representation last changed
+    """
+    response = get_conditional_response(
+        request,
+        etag=etag,
+        last_modified=int(last_modified.timestamp()) if last_modified else None,
+    )
+    if response is not None:
+        set_validators(response, etag, last_modified)
+    return response
+
+
+def set_validators(response, etag=None, last_modified=None):
+    """
+    Add ETag and Last-Modified headers to a response.
+    """
+    if etag:
+        response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    return response
@@ -0,0 +1,148 @@
+# movies/db_router.py
+
+import hashlib
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+# Monotonic time until which reads in the current context stay on the
+# primary. Set by writes (read-your-writes) and by ReplicaPinningMiddleware
+# for clients that wrote in a recent request.
+_pinned_until = ContextVar('replica_pinned_until', default=0.0)
+# Whether the current request wrote to the primary
+_wrote = ContextVar('replica_wrote', default=False)
+# Whether writes in the current context only copy data from elsewhere
+_writing_through = ContextVar('replica_writing_through', default=False)
+
+
+def pin_to_primary(seconds=None):
+    """
+    Route this context's reads to the primary for the sticky window
+    (REPLICA_STICKY_SECONDS by default).
+    """
+    seconds = settings.REPLICA_STICKY_SECONDS if seconds is None else seconds
+    _pinned_until.set(max(_pinned_until.get(), time.monotonic() + seconds))
+
+
+def is_pinned():
+    return _pinned_until.get() > time.monotonic()
+
+
+@contextmanager
+def use_primary():
+    """
+    Read from the primary inside the block, whatever the sticky window.
+    """
+    token = _pinned_until.set(float('inf'))
+    try:
+        yield
+    finally:
+        _pinned_until.reset(token)
+
+
+def _replicated(model):
+    # Historical models (loaded by migrations) are left to the database being
+    # migrated; replicas may not have the schema they expect yet
+    return (
+        bool(settings.DATABASE_REPLICAS)
+        and model._meta.app_label == 'movies'
+        and model.__module__ != '__fake__'
+    )
+
+
+@contextmanager
+def write_through():
+    """
+    Writes inside the block only store data that came from elsewhere (such
+    as TMDb payloads), not changes the client made, so they pin neither this
+    context nor the client's next requests. Read back what they wrote with
+    .using(DEFAULT_DB_ALIAS).
+    """
+    token = _writing_through.set(True)
+    try:
+        yield
+    finally:
+        _writing_through.reset(token)
+
+
+class ReplicaRouter:
+    """
+    Send reads of the movies app (catalog, listings, ratings and everything
+    the recommender scans) to a random replica from DATABASE_REPLICAS, and
+    all writes to the primary. Every write (but those in write_through())
+    pins the current context, so reads that follow it (in the same request or transaction) stay on the
+    primary for the sticky window. Other apps, such as auth, and migrations
+    always use the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        if not _replicated(model):
+            return None
+
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            # Follow relations on the database the instance came from
+            return instance._state.db
+
+        if is_pinned():
+            return DEFAULT_DB_ALIAS
+        return random.choice(settings.DATABASE_REPLICAS)
+
+    def db_for_write(self, model, **hints):
+        if _replicated(model) and not _writing_through.get():
+            _wrote.set(True)
+            pin_to_primary()
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+
+class ReplicaPinningMiddleware:
+    """
+    Carry the sticky-after-write window across requests: a client that wrote
+    is kept on the primary for its next requests within REPLICA_STICKY_SECONDS,
+    so e.g. a favorite it just added shows up in its next listing. Clients
+    are told apart by their Authorization header (or session cookie) without
+    authenticating them here; the pin is shared by all workers through the
+    cache.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.DATABASE_REPLICAS:
+            return self.get_response(request)
+
+        pin_key = self._pin_key(request)
+        pinned_token, wrote_token = _pinned_until.set(0.0), _wrote.set(False)
+        try:
+            if pin_key and cache.get(pin_key):
+                pin_to_primary()
+
+            response = self.get_response(request)
+
+            # Extend the window of this request's writes to the client's next requests
+            if pin_key and _wrote.get():
+                cache.set(pin_key, True, settings.REPLICA_STICKY_SECONDS)
+            return response
+        finally:
+            _pinned_until.reset(pinned_token)
+            _wrote.reset(wrote_token)
+
+    def _pin_key(self, request):
+        credentials = (
+            request.META.get('HTTP_AUTHORIZATION')
+            or request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+        )
+        if not credentials:
+            return None
+        return 'db_pinned:' + hashlib.sha256(credentials.encode()).hexdigest()
@@ -0,0 +1,302 @@
+# movies/evaluation.py
+
+import time
+import numpy as np # type: ignore
+from scipy import sparse # type: ignore
+from .models import Movie, Rating
+from .recommendation import genre_bits
+from .similarity import LocalRunner, normalize_rows, top_k_similarities
+
+# Offline evaluation of recommender engines on a time-based holdout: every
+# engine learns from the ratings made before a cutoff and is scored on how
+# well it predicts the movies users rated highly after it. Engines score
+# users a batch at a time as dense NumPy arrays, and the metrics of a batch
+# are computed on those arrays at once, never user by user.
+
+# Users scored per batch; bounds memory to EVALUATION_BATCH_USERS x movies floats
+EVALUATION_BATCH_USERS = 1024
+
+# Held-out ratings at or above this count as movies the user liked
+RELEVANCE_THRESHOLD = 4.0
+
+
+class Holdout:
+    """
+    Ratings split at a point in time, indexed by user and movie position.
+
+    Attributes:
+        train: users x movies CSR matrix of the ratings made before the cutoff
+        test: users x movies CSR matrix marking the movies rated at least
+            the relevance threshold from the cutoff on
+        user_ids, item_ids: User and movie ID of each row and column
+        item_masks: Movie.genre_mask of each column
+        users: Rows evaluated, i.e. users with ratings on both sides of the cutoff
+        cutoff: The cutoff, in seconds since the epoch
+    """
+
+    def __init__(self, train, test, user_ids, item_ids, cutoff, item_masks=None):
+        self.train = train
+        self.test = test
+        self.user_ids = user_ids
+        self.item_ids = item_ids
+        self.cutoff = cutoff
+        self.item_masks = np.zeros(len(item_ids), dtype=np.int64) if item_masks is None else item_masks
+        self.users = np.flatnonzero((np.diff(train.indptr) > 0) & (np.diff(test.indptr) > 0))
+
+
+def temporal_split(user_ids, movie_ids, ratings, times, test_fraction=0.2,
+                   relevance_threshold=RELEVANCE_THRESHOLD):
+    """
+    Split aligned rating arrays so that the latest test_fraction of the
+    ratings are held out. The cutoff is the same for every user, so no
+    engine learns from ratings made after the ones it is asked to predict.
+
+    Raises:
+        ValueError: If no rating falls before the cutoff, or none from it
+            on (e.g. when all ratings share one time)
+    """
+    times = np.asarray(times, dtype=np.float64)
+    if not len(times):
+        raise ValueError("There are no ratings to split")
+    cutoff = float(np.quantile(times, 1 - test_fraction))
+    row_ids, rows = np.unique(np.asarray(user_ids, dtype=np.int64), return_inverse=True)
+    item_ids, columns = np.unique(np.asarray(movie_ids, dtype=np.int64), return_inverse=True)
+    ratings = np.asarray(ratings, dtype=np.float32)
+    shape = (len(row_ids), len(item_ids))
+
+    before = times < cutoff
+    if before.all() or not before.any():
+        raise ValueError(
+            f"The cutoff leaves {int(before.sum())} of {len(times)} ratings for training; "
+            "the ratings need distinct times on both sides of it"
+        )
+    train = sparse.csr_matrix((ratings[before], (rows[before], columns[before])), shape=shape)
+    liked = ~before & (ratings >= relevance_threshold)
+    test = sparse.csr_matrix(
+        (np.ones(liked.sum(), dtype=np.float32), (rows[liked], columns[liked])), shape=shape
+    )
+    return Holdout(train, test, row_ids, item_ids, cutoff)
+
+
+def load_holdout(test_fraction=0.2, relevance_threshold=RELEVANCE_THRESHOLD):
+    """
+    Time-based holdout of every stored Rating with a known time (see
+    temporal_split), with the genre masks of the rated movies.
+    """
+    rows = Rating.objects.filter(rated_at__isnull=False).values_list('user_id', 'movie_id', 'rating', 'rated_at').iterator(chunk_size=10000)
+    user_ids, movie_ids, ratings, times = [], [], [], []
+    for user_id, movie_id, rating, rated_at in rows:
+        user_ids.append(user_id)
+        movie_ids.append(movie_id)
+        ratings.append(rating)
+        times.append(rated_at.timestamp())
+    holdout = temporal_split(user_ids, movie_ids, ratings, times, test_fraction, relevance_threshold)
+
+    masks = dict(Movie.objects.filter(id__in=holdout.item_ids.tolist()).values_list('id', 'genre_mask'))
+    holdout.item_masks = np.array([masks.get(movie_id, 0) for movie_id in holdout.item_ids], dtype=np.int64)
+    return holdout
+
+
+class PopularityEngine:
+    """
+    Highest average rating among movies with at least min_ratings ratings,
+    the same for everyone (MovieRecommender's fallback for new users).
+    """
+    name = 'popular'
+
+    def __init__(self, min_ratings=5):
+        self.min_ratings = min_ratings
+
+    def fit(self, holdout):
+        counts = np.diff(holdout.train.tocsc().indptr)
+        sums = np.asarray(holdout.train.sum(axis=0)).ravel()
+        means = sums / np.maximum(counts, 1)
+        self.scores = np.where(counts >= self.min_ratings, means, -np.inf).astype(np.float32)
+
+    def score(self, train_rows):
+        return np.broadcast_to(self.scores, (train_rows.shape[0], len(self.scores))).copy()
+
+
+class GenreEngine:
+    """
+    Content-based scoring as in MovieRecommender.content_based_recommendations:
+    genre preferences from the movies a user rated 4 or more, weighted by
+    rating, matched against each movie's genres normalized by their number.
+    """
+    name = 'genre'
+
+    def fit(self, holdout):
+        bits = genre_bits(holdout.item_masks).astype(np.float32)
+        self.item_bits = sparse.csr_matrix(bits)
+        self.normalized_bits = (bits / np.maximum(bits.sum(axis=1, keepdims=True), 1)).T
+
+    def score(self, train_rows):
+        liked = train_rows.multiply(train_rows >= 4).tocsr()
+        weights = np.asarray((liked @ self.item_bits).todense(), dtype=np.float32)
+        weights /= np.maximum(weights.sum(axis=1, keepdims=True), 1e-9)
+        return weights @ self.normalized_bits
+
+
+class ItemNeighborEngine:
+    """
+    Item-based collaborative filtering: a movie scores the sum of the user's
+    ratings of the movies it is among the `neighbors` most similar of, each
+    weighted by that similarity (centered cosine over users' ratings, the
+    measure of the batch similarity engine).
+    """
+    name = 'item_knn'
+
+    def __init__(self, neighbors=40, workers=1):
+        self.neighbors = neighbors
+        self.workers = workers
+
+    def fit(self, holdout):
+        n_items = holdout.train.shape[1]
+        neighbors, scores = top_k_similarities(
+            normalize_rows(holdout.train.T.tocsr()), self.neighbors, LocalRunner(self.workers)
+        )
+        found = neighbors >= 0
+        self.similarities = sparse.csr_matrix(
+            (scores[found], (np.nonzero(found)[0], neighbors[found])), shape=(n_items, n_items)
+        )
+
+    def score(self, train_rows):
+        return (train_rows @ self.similarities).toarray()
+
+
+class UserNeighborEngine:
+    """
+    User-based collaborative filtering as in
+    MovieRecommender.collaborative_filtering_recommendations: users are
+    compared by the Pearson correlation of their ratings of the movies both
+    rated (at least two), only positively correlated users count, and a
+    movie scores the similarity-weighted average of their ratings of it.
+    Movies none of them rated come after, in ID order.
+
+    The correlation over each pair's common movies is built from sparse
+    products of the rating and rated-or-not matrices (counts, sums, sums of
+    squares and cross products), so no pair is visited in Python.
+    """
+    name = 'user_pearson'
+
+    MIN_COMMON_MOVIES = 2
+
+    def fit(self, holdout):
+        self.ratings = holdout.train.astype(np.float64).tocsr()
+        self.rated = (self.ratings != 0).astype(np.float64)
+        self.ratings_t = self.ratings.T.tocsr()
+        self.rated_t = self.rated.T.tocsr()
+        self.squares_t = self.ratings.power(2).T.tocsr()
+        n_items = self.ratings.shape[1]
+        self.unpredicted = -1 - np.arange(n_items, dtype=np.float64) / max(n_items, 1)
+
+    def score(self, train_rows):
+        x = train_rows.astype(np.float64).tocsr()
+        b = (x != 0).astype(np.float64)
+        common = b @ self.rated_t
+        inverse_common = common.power(-1)
+        sum_x, sum_y = x @ self.rated_t, b @ self.ratings_t
+
+        covariance = x @ self.ratings_t - sum_x.multiply(sum_y).multiply(inverse_common)
+        variance_x = x.power(2) @ self.rated_t - sum_x.power(2).multiply(inverse_common)
+        variance_y = b @ self.squares_t - sum_y.power(2).multiply(inverse_common)
+        # Users whose common ratings do not vary correlate 0, as in _pearson_correlation;
+        # the tolerance keeps rounding error from standing in for variance
+        variance = variance_x.multiply(variance_x > 1e-9).multiply(variance_y.multiply(variance_y > 1e-9))
+        similarity = covariance.multiply(variance.power(-0.5)).tocsr()
+        similarity = similarity.multiply(common >= self.MIN_COMMON_MOVIES).multiply(similarity > 0).tocsr()
+
+        weighted = (similarity @ self.ratings).toarray()
+        weights = (similarity @ self.rated).toarray()
+        return np.where(weights > 0, weighted / np.where(weights > 0, weights, 1), self.unpredicted)
+
+
+ENGINES = {
+    engine.name: engine
+    for engine in (PopularityEngine, GenreEngine, ItemNeighborEngine, UserNeighborEngine)
+}
+
+
+def top_k_items(scores, k):
+    """
+    Column indices of the k best scores of each row, best first; -1 where
+    a row has fewer than k finite scores.
+    """
+    k = min(k, scores.shape[1])
+    best = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    best_scores = np.take_along_axis(scores, best, axis=1)
+    order = np.lexsort((best, -best_scores), axis=1)
+    best = np.take_along_axis(best, order, axis=1)
+    best[~np.isfinite(np.take_along_axis(best_scores, order, axis=1))] = -1
+    return best
+
+
+def ranking_metrics(recommended, relevant):
+    """
+    Per-user precision@k, recall@k and NDCG@k of a batch.
+
+    Args:
+        recommended: (users, k) column indices, best first, -1 for none
+        relevant: users x movies CSR matrix marking the held-out liked movies
+
+    Returns:
+        (precision, recall, ndcg) arrays with one value per user
+    """
+    k = recommended.shape[1]
+    hits = relevant.toarray()[np.arange(len(recommended))[:, None], recommended] > 0
+    hits &= recommended >= 0
+    n_relevant = np.diff(relevant.indptr)
+
+    discounts = 1 / np.log2(np.arange(k) + 2)
+    ideal = np.cumsum(discounts)[np.minimum(n_relevant, k) - 1]
+    found = hits.sum(axis=1)
+    return found / k, found / n_relevant, (hits @ discounts) / ideal
+
+
+def evaluate(engine, holdout, k=10, batch_users=EVALUATION_BATCH_USERS):
+    """
+    Fit an engine on the holdout's training ratings and score its top-k
+    recommendations (excluding movies the user already rated) for every
+    evaluated user.
+
+    Returns:
+        Dict of the mean precision, recall and NDCG at k, catalog coverage
+        (share of movies recommended to anyone) and timings: seconds to fit
+        and to recommend, and the recommendation latency per user.
+    """
+    started = time.perf_counter()
+    engine.fit(holdout)
+    fit_seconds = time.perf_counter() - started
+
+    users = holdout.users
+    totals = np.zeros(3)
+    recommended_items = np.zeros(holdout.train.shape[1], dtype=bool)
+    recommend_seconds = 0.0
+    for start in range(0, len(users), batch_users):
+        batch = users[start:start + batch_users]
+        train_rows = holdout.train[batch]
+
+        started = time.perf_counter()
+        scores = np.asarray(engine.score(train_rows), dtype=np.float32)
+        seen_rows, seen_columns = train_rows.nonzero()
+        scores[seen_rows, seen_columns] = -np.inf
+        recommended = top_k_items(scores, k)
+        recommend_seconds += time.perf_counter() - started
+
+        recommended_items[recommended[recommended >= 0]] = True
+        totals += [values.sum() for values in ranking_metrics(recommended, holdout.test[batch])]
+
+    evaluated = max(len(users), 1)
+    precision, recall, ndcg = totals / evaluated
+    return {
+        'engine': engine.name,
+        'k': k,
+        'users': len(users),
+        f'precision@{k}': round(float(precision), 4),
+        f'recall@{k}': round(float(recall), 4),
+        f'ndcg@{k}': round(float(ndcg), 4),
+        'coverage': round(float(recommended_items.mean()) if len(recommended_items) else 0.0, 4),
+        'fit_seconds': round(fit_seconds, 3),
+        'recommend_seconds': round(recommend_seconds, 3),
+        'ms_per_user': round(recommend_seconds * 1000 / evaluated, 4),
+    }
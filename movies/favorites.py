@@ -0,0 +1,47 @@
+# movies/favorites.py
+
+from django.core.cache import cache
+from django.db import transaction
+from .models import FavoriteMovie
+
+# Seconds a user's first page of favorites and their favorite IDs stay cached;
+# adding or removing a favorite drops both (see signals.py)
+FAVORITES_CACHE_TIMEOUT = 60 * 10
+# After a change, entries stay blocked this long: a listing read from the
+# database just before the change must not be cached in its place
+TOMBSTONE_TIMEOUT = 60
+_TOMBSTONE = 'forgotten'
+
+
+def first_page_cache_key(user_id):
+    return f'favorites:first_page:{user_id}'
+
+
+def ids_cache_key(user_id):
+    return f'favorites:ids:{user_id}'
+
+
+def favorite_tmdb_ids(user_id):
+    """
+    TMDb IDs of all the user's favorite movies, newest first, for clients
+    that only need to know which movies are favorited.
+    """
+    key = ids_cache_key(user_id)
+    ids = cache.get(key)
+    if not isinstance(ids, list):
+        ids = list(FavoriteMovie.objects.filter(user_id=user_id).order_by(
+            '-added_at', '-id'
+        ).values_list('movie__tmdb_id', flat=True))
+        cache.add(key, ids, FAVORITES_CACHE_TIMEOUT)
+    return ids
+
+
+def forget_favorites(user_id):
+    """
+    Replace the user's cached listings with tombstones, which cache.add()
+    (the only way they are written) will not overwrite.
+    """
+    tombstones = dict.fromkeys([first_page_cache_key(user_id), ids_cache_key(user_id)], _TOMBSTONE)
+    cache.set_many(tombstones, TOMBSTONE_TIMEOUT)
+    # Again once the change is visible to other connections
+    transaction.on_commit(lambda: cache.set_many(tombstones, TOMBSTONE_TIMEOUT))
@@ -0,0 +1,154 @@
+# movies/loadtest/fake_tmdb.py
+
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+from zlib import crc32
+
+PAGE_SIZE = 20
+TOTAL_PAGES = 500
+
+_WORDS = (
+    'love war space detective family heist robot island winter city secret '
+    'king ocean night storm dragon ghost summer journey revenge dream school '
+    'music empire desert shadow train prison forest planet queen'
+).split()
+
+
+def fake_movie(tmdb_id):
+    """
+    The same made-up TMDb movie for a given ID on every call.
+    """
+    rng = random.Random(tmdb_id)
+    words = rng.sample(_WORDS, 8)
+    return {
+        'id': tmdb_id,
+        'title': f"{words[0].title()} {words[1].title()} {tmdb_id}",
+        'overview': f"A story of {words[2]}, {words[3]} and {words[4]} in a {words[5]} of {words[6]} and {words[7]}.",
+        'poster_path': f'/fake/{tmdb_id}.jpg',
+        'release_date': f"{rng.randint(1950, 2024)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+        'vote_average': round(rng.uniform(3, 9), 1),
+        'genre_ids': rng.sample(range(1, 20), 2),
+    }
+
+
+class FakeTMDb:
+    """
+    Local HTTP server answering the TMDb endpoints used by movies.tmdb_api
+    with deterministic fake data, for load tests that must not reach the
+    real TMDb. Point the app at it with TMDB_BASE_URL=<server.url>.
+
+    Args:
+        host, port: Address to listen on (port 0 picks a free port)
+        latency: Seconds added to every response
+        jitter: Extra random latency, up to this many seconds
+        error_rate: Share of requests answered with HTTP 500
+        catalog_size: Movie IDs above this are unknown (404)
+        seed: Seed of the latency and error draws
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, jitter=0.0,
+                 error_rate=0.0, catalog_size=100000, seed=0):
+        self.latency, self.jitter, self.error_rate = latency, jitter, error_rate
+        self.catalog_size = catalog_size
+        self.requests = Counter()
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._thread = None
+        self.server = ThreadingHTTPServer((host, port), self._handler_class())
+        self.server.daemon_threads = True
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        """
+        Serve from a background thread.
+        """
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        self.server.serve_forever()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _draw(self):
+        with self._lock:
+            delay = self.latency + self._rng.uniform(0, self.jitter)
+            failed = self._rng.random() < self.error_rate
+        return delay, failed
+
+    def _page(self, seed, page):
+        # TMDb-shaped page of PAGE_SIZE movies picked by a seed
+        rng = random.Random(f'{seed}:{page}')
+        return {
+            'page': page,
+            'results': [fake_movie(rng.randint(1, self.catalog_size)) for _ in range(PAGE_SIZE)],
+            'total_pages': TOTAL_PAGES,
+            'total_results': TOTAL_PAGES * PAGE_SIZE,
+        }
+
+    def route(self, path, params):
+        """
+        (endpoint name, status, payload) for a TMDb API path and its query parameters.
+        """
+        page = int(params.get('page', ['1'])[0] or 1)
+        if match := re.fullmatch(r'/trending/movie/(day|week)', path):
+            return 'trending', 200, self._page(f'trending:{match[1]}', page)
+        if path == '/search/movie':
+            query = params.get('query', [''])[0]
+            return 'search', 200, self._page(f'search:{crc32(query.encode())}', page)
+        if match := re.fullmatch(r'/movie/(\d+)/recommendations', path):
+            return 'recommendations', 200, self._page(f'recommendations:{match[1]}', page)
+        if match := re.fullmatch(r'/movie/(\d+)', path):
+            tmdb_id = int(match[1])
+            if 0 < tmdb_id <= self.catalog_size:
+                return 'details', 200, fake_movie(tmdb_id)
+            return 'details', 404, {'status_code': 34, 'status_message': 'The resource you requested could not be found.'}
+        return 'unknown', 404, {'status_code': 34, 'status_message': 'Invalid path.'}
+
+    def _handler_class(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                url = urlsplit(self.path)
+                name, status, payload = fake.route(url.path.removeprefix('/3'), parse_qs(url.query))
+                delay, failed = fake._draw()
+                if failed:
+                    status, payload = 500, {'status_code': 11, 'status_message': 'Internal error.'}
+                with fake._lock:
+                    fake.requests[name, status] += 1
+                if delay:
+                    time.sleep(delay)
+
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json;charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
@@ -0,0 +1,180 @@
+# movies/loadtest/runner.py
+
+import os
+import platform
+import socket
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from .fake_tmdb import FakeTMDb
+from .workloads import DEFAULT_MIX, VirtualUser
+
+PERCENTILES = (50, 90, 95, 99)
+
+
+def percentile(sorted_values, q):
+    """
+    Nearest-rank q-th percentile of an ascending list.
+    """
+    if not sorted_values:
+        return None
+    rank = max(int(-(-q * len(sorted_values) // 100)), 1)
+    return sorted_values[rank - 1]
+
+
+def summarize(samples, elapsed):
+    """
+    Throughput and latency percentiles (in milliseconds) of
+    (action, status, seconds) samples collected over `elapsed` seconds,
+    per action and for all of them ('all'). Connection failures (status 0)
+    and 5xx responses count as errors.
+    """
+    by_action = defaultdict(list)
+    for sample in samples:
+        by_action[sample[0]].append(sample)
+        by_action['all'].append(sample)
+
+    summary = {}
+    for action, action_samples in sorted(by_action.items()):
+        latencies = sorted(seconds * 1000 for _, _, seconds in action_samples)
+        statuses = Counter(status for _, status, _ in action_samples)
+        summary[action] = {
+            'requests': len(action_samples),
+            'errors': sum(count for status, count in statuses.items() if status == 0 or status >= 500),
+            'statuses': {str(status): count for status, count in sorted(statuses.items())},
+            'throughput': round(len(action_samples) / elapsed, 2),
+            'mean_ms': round(sum(latencies) / len(latencies), 2),
+            **{f'p{q}_ms': round(percentile(latencies, q), 2) for q in PERCENTILES},
+            'max_ms': round(latencies[-1], 2),
+        }
+    return summary
+
+
+def run_load(base_url, users=10, duration=30, warmup=5, seed=0, mix=None, catalog_size=10000):
+    """
+    Run `users` closed-loop virtual users (each sends its next request as
+    soon as the previous one is answered) against base_url for warmup +
+    duration seconds, and report on the requests that started after the
+    warm-up. With the same seed and mix, every run replays the same
+    sequence of actions per user.
+    """
+    virtual_users = [
+        VirtualUser(base_url, f'loadtest{index}', seed=seed * 1000 + index, mix=mix, catalog_size=catalog_size)
+        for index in range(users)
+    ]
+    for user in virtual_users:
+        user.log_in()
+
+    started = time.monotonic()
+    measure_from, stop_at = started + warmup, started + warmup + duration
+    samples, lock = [], threading.Lock()
+
+    def drive(user):
+        while True:
+            step_started = time.monotonic()
+            if step_started >= stop_at:
+                return
+            results = user.step()
+            if step_started >= measure_from:
+                with lock:
+                    samples.extend(results)
+
+    threads = [threading.Thread(target=drive, args=(user,)) for user in virtual_users]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return {
+        'meta': run_metadata(),
+        'parameters': {
+            'base_url': base_url, 'users': users, 'duration': duration, 'warmup': warmup,
+            'seed': seed, 'mix': mix or DEFAULT_MIX, 'catalog_size': catalog_size,
+        },
+        'results': summarize(samples, duration),
+    }
+
+
+def run_metadata():
+    """
+    What a run should be compared on: the commit under test and the machine.
+    """
+    def git(*args):
+        try:
+            return subprocess.run(
+                ['git', *args], capture_output=True, text=True, check=True, timeout=10
+            ).stdout.strip()
+        except (OSError, subprocess.SubprocessError):
+            return None
+
+    return {
+        'commit': git('rev-parse', 'HEAD'),
+        'dirty': bool(git('status', '--porcelain', '--untracked-files=no')),
+        'started_at': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def compare(report, baseline):
+    """
+    Lines comparing a report's throughput and latency percentiles with a
+    baseline report's, action by action.
+    """
+    lines = [f"Baseline: {baseline['meta'].get('commit')}  Current: {report['meta'].get('commit')}"]
+    if baseline['parameters'] != report['parameters']:
+        lines.append("Warning: the runs used different parameters")
+    for action, current in report['results'].items():
+        previous = baseline['results'].get(action)
+        if previous is None:
+            continue
+        changes = []
+        for metric in ('throughput', *(f'p{q}_ms' for q in PERCENTILES)):
+            before, after = previous[metric], current[metric]
+            change = f"{(after - before) / before * 100:+.1f}%" if before else 'n/a'
+            changes.append(f"{metric} {before} -> {after} ({change})")
+        lines.append(f"{action:>16}  " + ', '.join(changes))
+    return lines
+
+
+def _wait_for_port(host, port, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection((host, port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise TimeoutError(f"Nothing is listening on {host}:{port} after {timeout}s")
+
+
+@contextmanager
+def local_stack(port=8000, workers=4, fake_options=None, env=None):
+    """
+    Start a fake TMDb and the app under gunicorn pointed at it, for the
+    duration of the block; yields the API base URL. The app uses the
+    database and Redis configured in the environment, and the outbound
+    rate limit is lifted so the fake TMDb is never throttled.
+    """
+    with FakeTMDb(**(fake_options or {})) as fake:
+        server = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', 'movie_recommendation.wsgi',
+             '--workers', str(workers), '--bind', f'127.0.0.1:{port}', '--log-level', 'warning'],
+            env={
+                **os.environ,
+                'TMDB_BASE_URL': fake.url,
+                'TMDB_RATE_LIMIT': '100000',
+                'TMDB_RATE_BURST': '100000',
+                **(env or {}),
+            },
+        )
+        try:
+            _wait_for_port('127.0.0.1', port, timeout=30)
+            yield f'http://127.0.0.1:{port}/movies/'
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
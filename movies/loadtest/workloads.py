@@ -0,0 +1,107 @@
+# movies/loadtest/workloads.py
+
+import random
+import time
+import requests
+
+# Share of each user action in the default mix: mostly browsing and
+# searching, with fewer personalized and write requests
+DEFAULT_MIX = {
+    'trending': 30,
+    'search': 20,
+    'details': 25,
+    'favorites': 10,
+    'recommendations': 15,
+}
+
+SEARCH_TERMS = (
+    'love', 'war', 'space', 'detective', 'heist', 'robot', 'winter', 'dragon',
+    'ghost', 'summer', 'revenge', 'empire', 'planet', 'queen', 'night train',
+)
+
+# Popular movies get most of the traffic; the rest is spread over the catalog
+POPULAR_MOVIES = 200
+POPULAR_SHARE = 0.8
+
+
+class VirtualUser:
+    """
+    One scripted API user with its own account, session and random stream.
+    Each step performs one action drawn from the mix and returns
+    (action, status, seconds) for every request it made.
+
+    Args:
+        base_url: URL of the movies API, e.g. http://127.0.0.1:8000/movies/
+        name: Username, created on first use
+        seed: Seed of this user's choices, so runs replay the same requests
+        mix: Action weights (DEFAULT_MIX by default)
+        catalog_size: TMDb IDs are drawn from 1..catalog_size
+    """
+
+    def __init__(self, base_url, name, seed, mix=None, catalog_size=10000):
+        self.base_url = base_url.rstrip('/') + '/'
+        self.name = name
+        self.rng = random.Random(seed)
+        self.mix = mix or DEFAULT_MIX
+        self.catalog_size = catalog_size
+        self.session = requests.Session()
+        self.favorite_ids = []
+
+    def log_in(self):
+        """
+        Register the user (if needed) and authenticate the session with a JWT.
+        """
+        credentials = {'username': self.name, 'password': f'{self.name}-password'}
+        self.session.post(self._url('register/'), json={**credentials, 'email': f'{self.name}@example.com'})
+        response = self.session.post(self._url('token/'), json=credentials)
+        response.raise_for_status()
+        self.session.headers['Authorization'] = f"Bearer {response.json()['access']}"
+
+    def step(self):
+        action = self.rng.choices(list(self.mix), weights=list(self.mix.values()))[0]
+        return getattr(self, action)()
+
+    def trending(self):
+        window = self.rng.choice(['day', 'week'])
+        page = self.rng.choices([1, 2, 3], weights=[70, 20, 10])[0]
+        return [self._get('trending', 'trending/', time_window=window, page=page)]
+
+    def search(self):
+        return [self._get('search', 'search/', query=self.rng.choice(SEARCH_TERMS))]
+
+    def details(self):
+        return [self._get('details', f'details/{self._movie_id()}/')]
+
+    def favorites(self):
+        # Mostly add favorites, sometimes drop one again
+        if self.favorite_ids and self.rng.random() < 0.3:
+            movie_id = self.favorite_ids.pop(self.rng.randrange(len(self.favorite_ids)))
+            return [self._request('favorites', 'delete', f'favorites/{movie_id}/')]
+        movie_id = self._movie_id()
+        self.favorite_ids.append(movie_id)
+        return [self._request('favorites', 'post', f'favorites/{movie_id}/')]
+
+    def recommendations(self):
+        if self.rng.random() < 0.5:
+            return [self._get('recommendations', 'recommendations/', count=10)]
+        mode = self.rng.choice(['tmdb', 'local'])
+        return [self._get('recommendations', f'recommendations/{self._movie_id()}/', mode=mode)]
+
+    def _movie_id(self):
+        if self.rng.random() < POPULAR_SHARE:
+            return self.rng.randint(1, POPULAR_MOVIES)
+        return self.rng.randint(1, self.catalog_size)
+
+    def _url(self, path):
+        return self.base_url + path
+
+    def _get(self, action, path, **params):
+        return self._request(action, 'get', path, params=params)
+
+    def _request(self, action, method, path, **kwargs):
+        started = time.perf_counter()
+        try:
+            status = self.session.request(method, self._url(path), timeout=30, **kwargs).status_code
+        except requests.RequestException:
+            status = 0  # Connection errors and timeouts
+        return action, status, time.perf_counter() - started
@@ -0,0 +1,25 @@
+import time
+from django.core.management.base import BaseCommand
+from movies.models import Genre, Movie
+
+
+class Command(BaseCommand):
+    help = "Assign bits to genres that lack one and recompute every movie's genre_mask"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help="Movies updated per query")
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        genres = Genre.objects.assign_bits()
+        unassigned = Genre.objects.filter(bit=None).count()
+        if unassigned:
+            self.stderr.write(self.style.WARNING(
+                f"{unassigned} genres have no free bit left and are not part of movie masks"
+            ))
+
+        movies = Movie.objects.all().update_genre_masks(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Assigned {genres} genre bits and updated {movies} movie masks "
+            f"in {time.monotonic() - started:.2f}s"
+        ))
@@ -0,0 +1,55 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+from movies.models import Movie
+from movies.renderers import ORJSONRenderer
+from movies.serializers import MovieSerializer, movie_dicts, movie_values
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare MovieSerializer + JSONRenderer with the .values() + orjson fast path "
+        "on stored movies, reporting milliseconds per 1,000 movies"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--movies', type=int, default=1000, help="Movies per run")
+        parser.add_argument('--repeat', type=int, default=20, help="Runs per measurement (best is kept)")
+
+    def handle(self, *args, **options):
+        count, repeat = options['movies'], options['repeat']
+        queryset = Movie.objects.order_by('id')[:count]
+        movies = list(queryset)
+        if len(movies) < count:
+            raise CommandError(
+                f"Only {len(movies)} movies are stored; import some first or pass --movies {len(movies)}"
+            )
+
+        drf_renderer, fast_renderer = JSONRenderer(), ORJSONRenderer()
+        drf_data = MovieSerializer(movies, many=True).data
+        if drf_renderer.render(drf_data) != fast_renderer.render(movie_values(queryset)):
+            raise CommandError("The fast path output differs from MovieSerializer's")
+
+        results = [
+            ('serializer', 'MovieSerializer', lambda: MovieSerializer(movies, many=True).data),
+            ('serializer', 'movie_dicts', lambda: movie_dicts(movies)),
+            ('renderer', 'JSONRenderer', lambda: drf_renderer.render(drf_data)),
+            ('renderer', 'ORJSONRenderer', lambda: fast_renderer.render(drf_data)),
+            ('end to end', 'query + MovieSerializer + JSONRenderer', lambda: drf_renderer.render(
+                MovieSerializer(list(queryset), many=True).data
+            )),
+            ('end to end', 'values() + ORJSONRenderer', lambda: fast_renderer.render(
+                movie_values(queryset)
+            )),
+        ]
+        for stage, name, run in results:
+            per_thousand = self._best_of(run, repeat) * 1000 / count * 1000
+            self.stdout.write(f"{stage:>10}  {name:<40} {per_thousand:8.2f} ms / 1,000 movies")
+
+    def _best_of(self, run, repeat):
+        best = float('inf')
+        for _ in range(repeat):
+            started = time.perf_counter()
+            run()
+            best = min(best, time.perf_counter() - started)
+        return best
@@ -0,0 +1,57 @@
+import os
+import time
+import numpy as np # type: ignore
+from django.core.management.base import BaseCommand, CommandError
+from movies.recommendation import rating_matrix
+from movies.similarity import DEFAULT_BLOCK_ROWS, LocalRunner, normalize_rows, top_k_similarities
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the sharded top-K similarity computation over all stored ratings "
+        "at several worker counts and report the speedup over one worker"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--kind', choices=['item', 'user'], default='item',
+                            help="Compare movies (item) or users (user)")
+        parser.add_argument('--top-k', type=int, default=20, help="Neighbors kept per row")
+        parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8],
+                            help="Worker counts to measure")
+        parser.add_argument('--block-rows', type=int, default=DEFAULT_BLOCK_ROWS, help="Rows per shard")
+        parser.add_argument('--repeat', type=int, default=3, help="Runs per measurement (best is kept)")
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        matrix, row_ids = rating_matrix(options['kind'])
+        if not matrix.nnz:
+            raise CommandError("No ratings are stored; import some first")
+        matrix = normalize_rows(matrix)
+        self.stdout.write(
+            f"Loaded a {matrix.shape[0]:,} x {matrix.shape[1]:,} matrix with {matrix.nnz:,} ratings "
+            f"in {time.monotonic() - started:.2f}s ({os.cpu_count()} CPUs)"
+        )
+
+        baseline = expected = None
+        for workers in options['workers']:
+            elapsed, result = self._best_of(
+                lambda: top_k_similarities(
+                    matrix, options['top_k'], LocalRunner(workers), options['block_rows']
+                ),
+                options['repeat'],
+            )
+            if expected is None:
+                baseline, expected = elapsed, result
+            elif not all(np.array_equal(a, b) for a, b in zip(result, expected)):
+                raise CommandError(f"{workers} workers produced different neighbors")
+            self.stdout.write(
+                f"{workers:>3} workers  {elapsed:8.2f}s  {baseline / elapsed:5.2f}x"
+            )
+
+    def _best_of(self, run, repeat):
+        best, result = float('inf'), None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            result = run()
+            best = min(best, time.perf_counter() - started)
+        return best, result
@@ -0,0 +1,52 @@
+import json
+import time
+from django.core.management.base import BaseCommand, CommandError
+from movies import evaluation
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare recommender engines offline: train on the ratings before a cutoff "
+        "and report precision, recall, NDCG and coverage at k on the later ratings, "
+        "with each engine's fit time and latency per user"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--engines', nargs='+', choices=sorted(evaluation.ENGINES),
+                            default=['popular', 'item_knn'], help="Engines to compare")
+        parser.add_argument('--k', type=int, default=10, help="Recommendations scored per user")
+        parser.add_argument('--test-fraction', type=float, default=0.2,
+                            help="Share of the latest ratings held out")
+        parser.add_argument('--relevance-threshold', type=float, default=evaluation.RELEVANCE_THRESHOLD,
+                            help="Held-out ratings at or above this count as liked")
+        parser.add_argument('--output', help="Also write the results to this JSON file")
+
+    def handle(self, *args, **options):
+        if not 0 < options['test_fraction'] < 1:
+            raise CommandError("--test-fraction must be between 0 and 1")
+
+        started = time.monotonic()
+        try:
+            holdout = evaluation.load_holdout(options['test_fraction'], options['relevance_threshold'])
+        except ValueError as error:
+            raise CommandError(str(error))
+        if not len(holdout.users):
+            raise CommandError("No user has ratings on both sides of the cutoff")
+        self.stdout.write(
+            f"Loaded {holdout.train.nnz:,} training ratings and {holdout.test.nnz:,} held-out likes; "
+            f"evaluating {len(holdout.users):,} users ({time.monotonic() - started:.2f}s)"
+        )
+
+        results = [
+            evaluation.evaluate(evaluation.ENGINES[name](), holdout, options['k'])
+            for name in options['engines']
+        ]
+        metrics = [key for key in results[0] if key not in ('engine', 'k', 'users')]
+        self.stdout.write(f"{'':>18}" + ''.join(f"{result['engine']:>14}" for result in results))
+        for metric in metrics:
+            self.stdout.write(f"{metric:>18}" + ''.join(f"{result[metric]:>14}" for result in results))
+
+        if options['output']:
+            parameters = {key: options[key] for key in ('engines', 'k', 'test_fraction', 'relevance_threshold')}
+            with open(options['output'], 'w') as output:
+                json.dump({'parameters': {**parameters, 'cutoff': holdout.cutoff}, 'results': results}, output, indent=2)
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from movies.loadtest.fake_tmdb import FakeTMDb
+
+
+class Command(BaseCommand):
+    help = (
+        "Serve a fake TMDb API with deterministic data for load tests; "
+        "start the app with TMDB_BASE_URL pointing at it"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--latency-ms', type=float, default=0, help="Latency added to every response")
+        parser.add_argument('--jitter-ms', type=float, default=0, help="Extra random latency, up to this much")
+        parser.add_argument('--error-rate', type=float, default=0, help="Share of requests failing with HTTP 500")
+        parser.add_argument('--catalog-size', type=int, default=100000, help="Number of known movie IDs")
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        fake = FakeTMDb(
+            host=options['host'], port=options['port'],
+            latency=options['latency_ms'] / 1000, jitter=options['jitter_ms'] / 1000,
+            error_rate=options['error_rate'], catalog_size=options['catalog_size'], seed=options['seed'],
+        )
+        self.stdout.write(f"Fake TMDb listening on {fake.url} (TMDB_BASE_URL={fake.url})")
+        try:
+            fake.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            fake.server.server_close()
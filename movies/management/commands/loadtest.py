@@ -0,0 +1,72 @@
+import json
+from contextlib import nullcontext
+from django.core.management.base import BaseCommand, CommandError
+from movies.loadtest.runner import compare, local_stack, run_load
+from movies.loadtest.workloads import DEFAULT_MIX
+
+
+class Command(BaseCommand):
+    help = (
+        "Drive the API with scripted users (trending, search, details, favorites, "
+        "recommendations) and report throughput and latency percentiles"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', help="Base URL of a running movies API, e.g. http://127.0.0.1:8000/movies/")
+        parser.add_argument('--start-server', action='store_true',
+                            help="Start a fake TMDb and the app under gunicorn instead of using --url")
+        parser.add_argument('--port', type=int, default=8000, help="Port of the started app")
+        parser.add_argument('--server-workers', type=int, default=4, help="Gunicorn workers of the started app")
+        parser.add_argument('--tmdb-latency-ms', type=float, default=50, help="Fake TMDb latency")
+        parser.add_argument('--tmdb-jitter-ms', type=float, default=50, help="Fake TMDb extra random latency")
+        parser.add_argument('--tmdb-error-rate', type=float, default=0.0, help="Fake TMDb share of HTTP 500s")
+        parser.add_argument('--users', type=int, default=10, help="Concurrent virtual users")
+        parser.add_argument('--duration', type=float, default=30, help="Measured seconds")
+        parser.add_argument('--warmup', type=float, default=5, help="Seconds run before measuring")
+        parser.add_argument('--seed', type=int, default=0, help="Seed of the users' actions")
+        parser.add_argument('--catalog-size', type=int, default=10000, help="TMDb IDs drawn from 1..N")
+        parser.add_argument('--mix', type=json.loads, default=None,
+                            help=f"Action weights as JSON (default: {json.dumps(DEFAULT_MIX)})")
+        parser.add_argument('--output', help="Write the JSON report to this file")
+        parser.add_argument('--compare', help="JSON report of an earlier run to compare with")
+
+    def handle(self, *args, **options):
+        if not options['url'] and not options['start_server']:
+            raise CommandError("Pass --url of a running API or --start-server")
+        if options['mix'] and set(options['mix']) - set(DEFAULT_MIX):
+            raise CommandError(f"Unknown actions in --mix; expected some of {', '.join(DEFAULT_MIX)}")
+
+        stack = nullcontext(options['url'])
+        if options['start_server']:
+            stack = local_stack(
+                port=options['port'],
+                workers=options['server_workers'],
+                fake_options={
+                    'latency': options['tmdb_latency_ms'] / 1000,
+                    'jitter': options['tmdb_jitter_ms'] / 1000,
+                    'error_rate': options['tmdb_error_rate'],
+                    'seed': options['seed'],
+                },
+            )
+        with stack as base_url:
+            report = run_load(
+                base_url, users=options['users'], duration=options['duration'], warmup=options['warmup'],
+                seed=options['seed'], mix=options['mix'], catalog_size=options['catalog_size'],
+            )
+
+        self.stdout.write(f"{'action':>16}  {'requests':>8} {'errors':>6} {'req/s':>8} "
+                          f"{'p50':>8} {'p90':>8} {'p95':>8} {'p99':>8} {'max':>8}  (ms)")
+        for action, row in report['results'].items():
+            self.stdout.write(
+                f"{action:>16}  {row['requests']:>8} {row['errors']:>6} {row['throughput']:>8.1f} "
+                f"{row['p50_ms']:>8.1f} {row['p90_ms']:>8.1f} {row['p95_ms']:>8.1f} "
+                f"{row['p99_ms']:>8.1f} {row['max_ms']:>8.1f}"
+            )
+
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(report, output, indent=2)
+        if options['compare']:
+            with open(options['compare']) as baseline:
+                for line in compare(report, json.load(baseline)):
+                    self.stdout.write(line)
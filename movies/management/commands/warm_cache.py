@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from movies.cache_warmer import warm_cache
+
+
+class Command(BaseCommand):
+    help = "Pre-fetch trending pages and their movies' details and recommendations into the cache"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pages', type=int, help="Trending pages to warm per time window")
+        parser.add_argument('--workers', type=int, help="Maximum concurrent TMDb requests")
+        parser.add_argument('--max-calls', type=int, help="Upper bound on TMDb calls for this run")
+
+    def handle(self, *args, **options):
+        report = warm_cache(
+            pages=options['pages'],
+            max_workers=options['workers'],
+            max_calls=options['max_calls'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Warmed {report['keys_warmed']} keys in {report['duration']}s "
+            f"({report['keys_failed']} failed, {report['keys_skipped']} skipped, "
+            f"{report['upstream_calls']} TMDb calls)"
+        ))
@@ -0,0 +1,139 @@
+# movies/metrics.py
+
+import os
+import re
+import time
+from contextlib import ExitStack
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse, HttpResponseForbidden
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess,
+)
+from prometheus_client.core import GaugeMetricFamily
+
+# With PROMETHEUS_MULTIPROC_DIR set (see gunicorn.conf.py), every process
+# writes its samples to memory-mapped files in that directory and a scrape
+# aggregates the files of all workers. Otherwise metrics are per process.
+
+TMDB_CACHE = Counter(
+    'tmdb_cache_requests', "TMDb payload cache lookups by tmdb_api function and result "
+    "(hit, miss, or stale when the cached copy is deliberately refreshed)",
+    ['function', 'result'],
+)
+TMDB_REQUEST_DURATION = Histogram(
+    'tmdb_request_duration_seconds', "Duration of TMDb API calls by endpoint and HTTP status",
+    ['endpoint', 'status'],
+    buckets=(0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+RECOMMENDER_STAGE_DURATION = Histogram(
+    'recommender_stage_duration_seconds', "Duration of each stage of personalized recommendations",
+    ['stage'],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+VIEW_DB_QUERIES = Histogram(
+    'http_request_db_queries', "Database queries run per request, by view",
+    ['view'],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89),
+)
+VIEW_DURATION = Histogram(
+    'http_request_duration_seconds', "Duration of requests by view, method and status",
+    ['view', 'method', 'status'],
+)
+
+_NUMERIC_SEGMENT = re.compile(r'/\d+')
+
+
+def tmdb_endpoint(path):
+    """
+    TMDb path with its IDs replaced, e.g. /movie/{id}/recommendations, so
+    that endpoints make a bounded set of label values.
+    """
+    return _NUMERIC_SEGMENT.sub('/{id}', path)
+
+
+def record_cache(function, result, count=1):
+    if count:
+        TMDB_CACHE.labels(function, result).inc(count)
+
+
+class ArtifactCollector:
+    """
+    Version and age of the precomputed recommender state, read when
+    metrics are scraped rather than tracked on the request path.
+    """
+
+    def collect(self):
+        from . import recommendation, similar_movies
+
+        info = GaugeMetricFamily(
+            'model_artifact_info', "Version of each precomputed model artifact", labels=['artifact', 'version']
+        )
+        age = GaugeMetricFamily(
+            'model_artifact_age_seconds', "Seconds since each model artifact was built", labels=['artifact']
+        )
+        info.add_metric(['ratings', str(recommendation.ratings_version())], 1)
+
+        store = similar_movies.current_store()
+        if store['version'] is not None:
+            info.add_metric(['similar_movies', store['version']], 1)
+            age.add_metric(['similar_movies'], time.time() - store['built_at'])
+        yield info
+        yield age
+
+
+_artifact_registry = CollectorRegistry(auto_describe=False)
+_artifact_registry.register(ArtifactCollector())
+
+
+def exposition():
+    """
+    All metrics in the Prometheus text format, aggregated over every worker
+    process in multiprocess mode.
+    """
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry) + generate_latest(_artifact_registry)
+
+
+def metrics_view(request):
+    """
+    Prometheus scrape endpoint. When METRICS_TOKEN is set, scrapers must
+    send it as a bearer token.
+    """
+    if settings.METRICS_TOKEN and request.META.get('HTTP_AUTHORIZATION') != f'Bearer {settings.METRICS_TOKEN}':
+        return HttpResponseForbidden()
+    return HttpResponse(exposition(), content_type=CONTENT_TYPE_LATEST)
+
+
+class MetricsMiddleware:
+    """
+    Record the duration and database query count of every request, labeled
+    with the name of the view that handled it.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        queries = 0
+
+        def count_query(execute, sql, params, many, context):
+            nonlocal queries
+            queries += 1
+            return execute(sql, params, many, context)
+
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(count_query))
+            response = self.get_response(request)
+
+        match = request.resolver_match
+        view = match.view_name if match is not None else 'unresolved'
+        VIEW_DURATION.labels(view, request.method, response.status_code).observe(time.perf_counter() - started)
+        VIEW_DB_QUERIES.labels(view).observe(queries)
+        return response
@@ -0,0 +1,70 @@
+# Generated by Django 4.2.10 on 2026-10-19 08:01
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+SEARCH_VECTOR_SQL = """
+    setweight(to_tsvector('english', coalesce({table}.title, '')), 'A') ||
+    setweight(to_tsvector('english', coalesce({table}.overview, '')), 'B')
+"""
+
+CREATE_SEARCH_INDEX_SQL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    """
+    CREATE OR REPLACE FUNCTION movies_movie_search_vector_update() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector := {vector};
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """.format(vector=SEARCH_VECTOR_SQL.format(table='NEW')),
+    """
+    CREATE TRIGGER movies_movie_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF title, overview ON movies_movie
+    FOR EACH ROW EXECUTE FUNCTION movies_movie_search_vector_update()
+    """,
+    "UPDATE movies_movie SET search_vector = {vector}".format(
+        vector=SEARCH_VECTOR_SQL.format(table='movies_movie')
+    ),
+    "CREATE INDEX movies_movie_search_vector_gin ON movies_movie USING gin (search_vector)",
+    "CREATE INDEX movies_movie_title_trgm ON movies_movie USING gin (title gin_trgm_ops)",
+]
+
+DROP_SEARCH_INDEX_SQL = [
+    "DROP INDEX IF EXISTS movies_movie_title_trgm",
+    "DROP INDEX IF EXISTS movies_movie_search_vector_gin",
+    "DROP TRIGGER IF EXISTS movies_movie_search_vector_trigger ON movies_movie",
+    "DROP FUNCTION IF EXISTS movies_movie_search_vector_update()",
+]
+
+
+def run_on_postgres(statements):
+    """
+    Full-text and trigram indexes are Postgres features; other backends
+    (e.g. SQLite in local tests) fall back to icontains in movies/search.py.
+    """
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0002_apilog_favoritemovie_movie_genres_rating_user_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movie',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(
+            run_on_postgres(CREATE_SEARCH_INDEX_SQL),
+            run_on_postgres(DROP_SEARCH_INDEX_SQL),
+        ),
+    ]
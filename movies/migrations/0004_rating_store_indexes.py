@@ -0,0 +1,165 @@
+# Generated by Django 4.2.10 on 2026-10-19 08:03
+
+from django.conf import settings
+from django.db import IntegrityError, migrations, models
+from django.db.models import Count, Max, Min
+import django.db.models.deletion
+
+# Safe to run against large, live tables: duplicates are removed first, the
+# new indexes are built CONCURRENTLY on Postgres (no write lock) and the
+# unique constraints are attached to those prebuilt indexes. Only then are
+# the now redundant single-column FK indexes dropped.
+#
+# Writes keep coming in during the builds, so a duplicate can land between
+# the cleanup and a unique index build. That build then fails and leaves an
+# INVALID index behind, which IF NOT EXISTS would skip on the next attempt.
+# Invalid leftovers are dropped before every build, and each unique index is
+# built right after another cleanup, retrying a few times if it still fails.
+
+RATING_MOVIE_USER_INDEX = models.Index(
+    fields=['movie', 'user'], include=('rating',), name='movies_rating_movie_user_idx'
+)
+RATING_USER_MOVIE_UNIQUE = models.UniqueConstraint(
+    fields=('user', 'movie'), name='movies_rating_user_movie_uniq'
+)
+FAVORITE_USER_MOVIE_UNIQUE = models.UniqueConstraint(
+    fields=('user', 'movie'), name='movies_favorite_user_movie_uniq'
+)
+
+POSTGRES_MOVIE_USER_INDEX_SQL = (
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS movies_rating_movie_user_idx "
+    "ON movies_rating (movie_id, user_id) INCLUDE (rating)"
+)
+# (model, row kept per pair, table, constraint and index name)
+POSTGRES_UNIQUE_INDEXES = [
+    ('Rating', Max('id'), 'movies_rating', 'movies_rating_user_movie_uniq'),
+    ('FavoriteMovie', Min('id'), 'movies_favoritemovie', 'movies_favorite_user_movie_uniq'),
+]
+UNIQUE_INDEX_ATTEMPTS = 3
+
+
+def delete_duplicates(model, keep, db_alias):
+    duplicates = model.objects.using(db_alias).values('user_id', 'movie_id').annotate(
+        count=Count('id'), keep=keep
+    ).filter(count__gt=1)
+    for row in duplicates.iterator():
+        model.objects.using(db_alias).filter(
+            user_id=row['user_id'], movie_id=row['movie_id']
+        ).exclude(id=row['keep']).delete()
+
+
+def remove_duplicates(apps, schema_editor):
+    """
+    Keep the latest rating and the earliest favorite for each (user, movie).
+    """
+    db_alias = schema_editor.connection.alias
+    for model_name, keep in (('Rating', Max('id')), ('FavoriteMovie', Min('id'))):
+        delete_duplicates(apps.get_model('movies', model_name), keep, db_alias)
+
+
+def drop_invalid_index(schema_editor, name):
+    """
+    Drop an index left INVALID by a failed concurrent build.
+    """
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT NOT i.indisvalid FROM pg_index i "
+            "JOIN pg_class c ON c.oid = i.indexrelid WHERE c.relname = %s",
+            [name],
+        )
+        row = cursor.fetchone()
+    if row and row[0]:
+        schema_editor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+
+
+def constraint_exists(schema_editor, name):
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_constraint WHERE conname = %s", [name])
+        return cursor.fetchone() is not None
+
+
+def create_unique_index(apps, schema_editor, model_name, keep, table, name):
+    """
+    Build the unique index concurrently and attach it as a constraint.
+    """
+    if constraint_exists(schema_editor, name):
+        return
+    
+    model = apps.get_model('movies', model_name)
+    for attempt in range(1, UNIQUE_INDEX_ATTEMPTS + 1):
+        # Duplicates written since the last cleanup would fail the build
+        delete_duplicates(model, keep, schema_editor.connection.alias)
+        drop_invalid_index(schema_editor, name)
+        try:
+            schema_editor.execute(
+                f"CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} (user_id, movie_id)"
+            )
+            break
+        except IntegrityError:
+            drop_invalid_index(schema_editor, name)
+            if attempt == UNIQUE_INDEX_ATTEMPTS:
+                raise
+    
+    # Once valid, the index rejects new duplicates, so none can appear here
+    schema_editor.execute(f"ALTER TABLE {table} ADD CONSTRAINT {name} UNIQUE USING INDEX {name}")
+
+
+def create_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        drop_invalid_index(schema_editor, RATING_MOVIE_USER_INDEX.name)
+        schema_editor.execute(POSTGRES_MOVIE_USER_INDEX_SQL)
+        for model_name, keep, table, name in POSTGRES_UNIQUE_INDEXES:
+            create_unique_index(apps, schema_editor, model_name, keep, table, name)
+        return
+
+    rating = apps.get_model('movies', 'Rating')
+    schema_editor.add_index(rating, RATING_MOVIE_USER_INDEX)
+    schema_editor.add_constraint(rating, RATING_USER_MOVIE_UNIQUE)
+    schema_editor.add_constraint(apps.get_model('movies', 'FavoriteMovie'), FAVORITE_USER_MOVIE_UNIQUE)
+
+
+def drop_indexes(apps, schema_editor):
+    rating = apps.get_model('movies', 'Rating')
+    schema_editor.remove_index(rating, RATING_MOVIE_USER_INDEX)
+    schema_editor.remove_constraint(rating, RATING_USER_MOVIE_UNIQUE)
+    schema_editor.remove_constraint(apps.get_model('movies', 'FavoriteMovie'), FAVORITE_USER_MOVIE_UNIQUE)
+
+
+class Migration(migrations.Migration):
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('movies', '0003_movie_search_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicates, migrations.RunPython.noop, atomic=True),
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddIndex(model_name='rating', index=RATING_MOVIE_USER_INDEX),
+                migrations.AddConstraint(model_name='rating', constraint=RATING_USER_MOVIE_UNIQUE),
+                migrations.AddConstraint(model_name='favoritemovie', constraint=FAVORITE_USER_MOVIE_UNIQUE),
+            ],
+            database_operations=[
+                migrations.RunPython(create_indexes, drop_indexes),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='favoritemovie',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='favorites', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='rating',
+            name='movie',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='ratings', to='movies.movie'),
+        ),
+        migrations.AlterField(
+            model_name='rating',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='ratings', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
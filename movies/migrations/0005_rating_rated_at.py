@@ -0,0 +1,26 @@
+# Generated by Django 4.2.10 on 2026-10-19 08:06
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0004_rating_store_indexes'),
+    ]
+
+    # Ratings stored before this have no known time and are left NULL;
+    # only ratings made from now on get a default
+    operations = [
+        migrations.AddField(
+            model_name='rating',
+            name='rated_at',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.AlterField(
+            model_name='rating',
+            name='rated_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, null=True),
+        ),
+    ]
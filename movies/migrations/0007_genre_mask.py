@@ -0,0 +1,39 @@
+# Generated by Django 4.2.10 on 2026-10-19 08:27
+
+from django.db import migrations, models
+
+# Movie masks are filled by `manage.py backfill_genre_masks`, which can run
+# in batches against a live table; here only the (small) genre table is updated
+
+
+def assign_genre_bits(apps, schema_editor):
+    """
+    Number existing genres in creation order, up to the 63 bits of the mask.
+    """
+    Genre = apps.get_model('movies', 'Genre')
+    db_alias = schema_editor.connection.alias
+    genres = list(Genre.objects.using(db_alias).order_by('id')[:63])
+    for bit, genre in enumerate(genres):
+        genre.bit = bit
+    Genre.objects.using(db_alias).bulk_update(genres, ['bit'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0006_movie_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='genre',
+            name='bit',
+            field=models.PositiveSmallIntegerField(blank=True, editable=False, null=True, unique=True),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='genre_mask',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(assign_genre_bits, migrations.RunPython.noop),
+    ]
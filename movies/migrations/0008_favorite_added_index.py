@@ -0,0 +1,40 @@
+# Generated by Django 4.2.10 on 2026-10-19 08:56
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+FAVORITE_USER_ADDED_INDEX = models.Index(
+    fields=['user', '-added_at', '-id'], name='movies_favorite_user_added_idx'
+)
+
+
+class AddIndexConcurrentlyOnPostgres(AddIndexConcurrently):
+    """
+    Builds the index without locking writes on Postgres; other databases
+    (e.g. SQLite in tests) have no CONCURRENTLY and get a plain index.
+    """
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            return super().database_forwards(app_label, schema_editor, from_state, to_state)
+        return migrations.AddIndex.database_forwards(self, app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            return super().database_backwards(app_label, schema_editor, from_state, to_state)
+        return migrations.AddIndex.database_backwards(self, app_label, schema_editor, from_state, to_state)
+
+
+class Migration(migrations.Migration):
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction, and does not
+    # lock writes to FavoriteMovie while it builds (as in 0004)
+    atomic = False
+
+    dependencies = [
+        ('movies', '0007_genre_mask'),
+    ]
+
+    operations = [
+        AddIndexConcurrentlyOnPostgres(model_name='favoritemovie', index=FAVORITE_USER_ADDED_INDEX),
+    ]
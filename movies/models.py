@@ -1,12 +1,94 @@
-from django.db import models
+from django.db import IntegrityError, models, transaction
 from django.contrib.auth.models import User
+from django.contrib.postgres.search import SearchVectorField
+from django.utils import timezone
+
+
+# Bits available in Movie.genre_mask, a signed 64-bit column
+GENRE_MASK_BITS = 63
+# Attempts at claiming a free bit for a new genre when concurrent saves pick the same one
+GENRE_BIT_ATTEMPTS = 5
+
+
+class GenreQuerySet(models.QuerySet):
+    def free_bits(self):
+        """
+        Mask bits not taken by any genre, lowest first.
+        """
+        used = set(self.model.objects.exclude(bit=None).values_list('bit', flat=True))
+        return [bit for bit in range(GENRE_MASK_BITS) if bit not in used]
+
+    def assign_bits(self):
+        """
+        Give the genres that have no bit yet the lowest free ones, oldest
+        genre first. Once all GENRE_MASK_BITS are taken, further genres stay
+        without a bit and are left out of movie genre masks.
+        """
+        free = self.free_bits()
+        genres = list(self.filter(bit=None).order_by('id')[:len(free)])
+        for genre, bit in zip(genres, free):
+            genre.bit = bit
+        self.model.objects.bulk_update(genres, ['bit'])
+        return len(genres)
 
 
 class Genre(models.Model):
     name = models.CharField(max_length=100)
+    # Position of this genre in Movie.genre_mask; assigned once and never reused while the genre exists
+    bit = models.PositiveSmallIntegerField(unique=True, null=True, blank=True, editable=False)
+
+    objects = GenreQuerySet.as_manager()
+
+    def save(self, *args, **kwargs):
+        if self.bit is not None:
+            return super().save(*args, **kwargs)
+        for attempt in range(GENRE_BIT_ATTEMPTS):
+            free = Genre.objects.free_bits()
+            self.bit = free[0] if free else None
+            try:
+                with transaction.atomic():
+                    return super().save(*args, **kwargs)
+            except IntegrityError:
+                # Another genre saved at the same time took the bit; pick again
+                if self.bit is None or attempt == GENRE_BIT_ATTEMPTS - 1:
+                    raise
+                self.bit = None
+
     def __str__(self):
         return self.name
- 
+
+
+class MovieQuerySet(models.QuerySet):
+    def update_genre_masks(self, batch_size=1000):
+        """
+        Recompute genre_mask from the genres of these movies, in batches of
+        batch_size movies. Returns the number of movies whose mask changed.
+        """
+        through = self.model.genres.through
+        updated = 0
+        last_id = 0
+        while True:
+            current = dict(
+                self.filter(id__gt=last_id).order_by('id').values_list('id', 'genre_mask')[:batch_size]
+            )
+            if not current:
+                return updated
+            last_id = max(current)
+
+            masks = dict.fromkeys(current, 0)
+            for movie_id, bit in through.objects.filter(
+                movie_id__in=list(current), genre__bit__isnull=False
+            ).values_list('movie_id', 'genre__bit'):
+                masks[movie_id] |= 1 << bit
+
+            changed = [
+                self.model(id=movie_id, genre_mask=mask)
+                for movie_id, mask in masks.items() if mask != current[movie_id]
+            ]
+            self.model.objects.bulk_update(changed, ['genre_mask'])
+            updated += len(changed)
+
+
 class Movie(models.Model):
     tmdb_id = models.IntegerField(unique=True)
     title = models.CharField(max_length=255)
@@ -15,20 +97,92 @@ class Movie(models.Model):
     release_date = models.DateField(null=True, blank=True)
     vote_average = models.FloatField(default=0.0)
     genres = models.ManyToManyField(Genre, related_name="movies")  
+    # Weighted title/overview tsvector, kept up to date by a database trigger
+    # and GIN indexed alongside a trigram index on title (see migration 0003)
+    search_vector = SearchVectorField(null=True, editable=False)
+    # Drives the ETag/Last-Modified validators of the movie API
+    updated_at = models.DateTimeField(auto_now=True)
+    # Bitwise OR of 1 << Genre.bit over the movie's genres, kept in sync on
+    # m2m_changed (movies/signals.py) so genre matching needs no join
+    genre_mask = models.BigIntegerField(default=0, editable=False)
+
+    objects = MovieQuerySet.as_manager()
+
+    def save(self, *args, **kwargs):
+        # genre_mask belongs to the m2m_changed handler; saving an instance
+        # loaded before its genres changed must not write the old mask back
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.attname for field in self._meta.concrete_fields
+                if not field.primary_key and field.attname != 'genre_mask'
+            ]
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return self.title
 
+class RatingQuerySet(models.QuerySet):
+    def upsert(self, user_id, movie_id, rating):
+        """
+        Insert or overwrite a single rating in one statement.
+        """
+        return self.upsert_many([(user_id, movie_id, rating)])
+
+    def upsert_many(self, rows, batch_size=1000):
+        """
+        Insert or overwrite (user_id, movie_id, rating) rows with
+        INSERT ... ON CONFLICT (user_id, movie_id) DO UPDATE.
+        """
+        now = timezone.now()
+        return self.bulk_create(
+            [
+                Rating(user_id=user_id, movie_id=movie_id, rating=rating, rated_at=now)
+                for user_id, movie_id, rating in rows
+            ],
+            batch_size=batch_size,
+            update_conflicts=True,
+            unique_fields=['user', 'movie'],
+            update_fields=['rating', 'rated_at'],
+        )
+
+
 class Rating(models.Model):  
-    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="ratings")  # Link to user
-    movie = models.ForeignKey(Movie, on_delete=models.CASCADE, related_name="ratings")  # Link to movie
+    # The (user, movie) unique constraint and the (movie, user) index below
+    # cover lookups by user and by movie, so the FKs need no indexes of their own
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="ratings", db_index=False)  # Link to user
+    movie = models.ForeignKey(Movie, on_delete=models.CASCADE, related_name="ratings", db_index=False)  # Link to movie
     rating = models.FloatField()
+    rated_at = models.DateTimeField(default=timezone.now, null=True)  # NULL for ratings older than the field
+
+    objects = RatingQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'movie'], name='movies_rating_user_movie_uniq'),
+        ]
+        indexes = [
+            # Covers "who rated this movie, and how" for collaborative filtering
+            models.Index(fields=['movie', 'user'], include=['rating'], name='movies_rating_movie_user_idx'),
+        ]
+
     def __str__(self):
         return f"{self.user.username} rated {self.movie.title} - {self.rating}"
 
 class FavoriteMovie(models.Model):
-    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="favorites")
+    # Lookups by user go through the (user, movie) unique constraint
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="favorites", db_index=False)
     movie = models.ForeignKey(Movie, on_delete=models.CASCADE, related_name="favorited_by")
     added_at = models.DateTimeField(auto_now_add=True)  # Track when the user favorited 
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'movie'], name='movies_favorite_user_movie_uniq'),
+        ]
+        indexes = [
+            # Serves the newest-first, keyset-paginated favorites listing
+            models.Index(fields=['user', '-added_at', '-id'], name='movies_favorite_user_added_idx'),
+        ]
+
     def __str__(self):
         return f"{self.user.username} favorited {self.movie.title}"
 
@@ -40,3 +194,18 @@ class APILog(models.Model):
     def __str__(self):
         return f"API call to {self.endpoint} at {self.timestamp}"
 
+
+class CachedUser(User):
+    """
+    A user rebuilt from the authentication cache (see authentication.py).
+    It holds only the cached fields, so the rest (password, email, names)
+    are blank and saving it would overwrite the user's row with them.
+    """
+    class Meta:
+        proxy = True
+
+    def save(self, *args, **kwargs):
+        raise NotImplementedError("Cached users are read-only; load the User to change it.")
+
+    def delete(self, *args, **kwargs):
+        raise NotImplementedError("Cached users are read-only; load the User to delete it.")
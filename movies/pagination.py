@@ -0,0 +1,26 @@
+# movies/pagination.py
+
+from rest_framework.pagination import CursorPagination
+
+
+class MovieCursorPagination(CursorPagination):
+    """
+    Keyset pagination on the primary key: each page is an index range scan
+    (WHERE id > cursor ORDER BY id LIMIT n), so its cost does not depend on
+    how deep into the catalog it is.
+    """
+    ordering = 'id'
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+
+class FavoriteCursorPagination(CursorPagination):
+    """
+    Keyset pagination of a user's favorites, newest first, on their
+    (user, added_at, id) index.
+    """
+    ordering = ('-added_at', '-id')
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
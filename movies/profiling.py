@@ -0,0 +1,129 @@
+# movies/profiling.py
+
+import cProfile
+import io
+import logging
+import marshal
+import pstats
+import random
+import re
+import time
+import uuid
+from contextlib import ExitStack
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from rest_framework.exceptions import AuthenticationFailed
+from .authentication import CachedJWTAuthentication
+
+logger = logging.getLogger(__name__)
+
+# Request header asking for a profile of the request (honored for staff only)
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+# Lines of the text summary kept with each profile
+SUMMARY_LINES = 40
+_REQUEST_ID = re.compile(r'^[A-Za-z0-9-]{1,64}$')
+
+
+def profile_cache_key(request_id):
+    return f'profile:{request_id}'
+
+
+def get_profile(request_id):
+    """
+    Stored profile of a request, or None if there is none (or it expired).
+    """
+    if not _REQUEST_ID.match(request_id):
+        return None
+    return cache.get(profile_cache_key(request_id))
+
+
+class ProfilingMiddleware:
+    """
+    Profile individual requests on demand: those sent by staff with an
+    "X-Profile: 1" header, and a random PROFILING_SAMPLE_RATE share of all
+    requests. The view runs under cProfile while every database query is
+    timed; the result is stored in the cache for PROFILING_TTL seconds under
+    the request id, returned in the X-Profile-Id response header, and can be
+    downloaded by admins from /movies/profiles/<request id>/.
+
+    Requests that are not profiled only pay for a header lookup (and a
+    random draw when sampling is on).
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = settings.PROFILING_SAMPLE_RATE
+
+    def __call__(self, request):
+        requested = request.META.get(PROFILE_HEADER) == '1'
+        if not requested and not (self.sample_rate and random.random() < self.sample_rate):
+            return self.get_response(request)
+        if requested and not self._is_staff(request):
+            return self.get_response(request)
+        return self._profile(request, 'header' if requested else 'sample')
+
+    def _is_staff(self, request):
+        # Runs before DRF authenticates the request, so check the JWT here
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            return user.is_staff
+        try:
+            authenticated = CachedJWTAuthentication().authenticate(request)
+        except AuthenticationFailed:
+            return False
+        return authenticated is not None and authenticated[0].is_staff
+
+    def _profile(self, request, trigger):
+        request_id = request.META.get('HTTP_X_REQUEST_ID', '')
+        if not _REQUEST_ID.match(request_id):
+            request_id = uuid.uuid4().hex
+
+        queries = []
+
+        def time_query(execute, sql, params, many, context):
+            started = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                queries.append({
+                    'alias': context['connection'].alias,
+                    'sql': sql,
+                    'duration_ms': round((time.perf_counter() - started) * 1000, 3),
+                })
+
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(time_query))
+            profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                profiler.disable()
+        duration = time.perf_counter() - started
+
+        summary = io.StringIO()
+        stats = pstats.Stats(profiler, stream=summary)
+        stats.sort_stats('cumulative').print_stats(SUMMARY_LINES)
+        user = getattr(request, 'user', None)
+        cache.set(profile_cache_key(request_id), {
+            'request_id': request_id,
+            'method': request.method,
+            'path': request.get_full_path(),
+            'user': user.username if user is not None and user.is_authenticated else None,
+            'trigger': trigger,
+            'status': response.status_code,
+            'duration_ms': round(duration * 1000, 3),
+            'query_count': len(queries),
+            'query_duration_ms': round(sum(query['duration_ms'] for query in queries), 3),
+            'queries': queries,
+            'summary': summary.getvalue(),
+            # Same format as cProfile's dump_stats, readable by pstats and snakeviz
+            'stats': marshal.dumps(stats.stats),
+        }, settings.PROFILING_TTL)
+
+        logger.info("Profiled %s %s as %s (%.1f ms)", request.method, request.path, request_id, duration * 1000)
+        response['X-Profile-Id'] = request_id
+        return response
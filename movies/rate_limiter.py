@@ -0,0 +1,144 @@
+# movies/rate_limiter.py
+
+import contextvars
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from django.conf import settings
+from django_redis import get_redis_connection
+from redis.exceptions import RedisError
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = 'interactive'
+BACKGROUND = 'background'
+
+_lane = contextvars.ContextVar('tmdb_rate_lane', default=INTERACTIVE)
+
+# Token bucket refilled continuously at `rate` tokens/sec up to `capacity`.
+# A caller may only take a token if at least `reserve` remain afterwards,
+# which is how the background lane leaves headroom for user-facing requests.
+# Returns 0 when a token was taken, otherwise the seconds until one frees up.
+TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local reserve = tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+
+local wait = 0
+if tokens - 1 >= reserve then
+    tokens = tokens - 1
+else
+    wait = (reserve + 1 - tokens) / rate
+end
+
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return tostring(wait)
+"""
+
+
+class RateLimitExceeded(Exception):
+    """
+    Raised when no TMDb token could be obtained within the lane's wait budget.
+    """
+
+
+class TokenBucketLimiter:
+    """
+    Outbound rate limiter for TMDb shared by every gunicorn and Celery worker
+    through Redis. Falls back to a per-process bucket when the default cache
+    is not Redis (e.g. in tests).
+    """
+
+    def __init__(self, key='tmdb_rate_limit'):
+        self.key = key
+        self.rate = settings.TMDB_RATE_LIMIT
+        self.capacity = settings.TMDB_RATE_BURST
+        self.lanes = {
+            INTERACTIVE: {'reserve': 0, 'max_wait': settings.TMDB_RATE_MAX_WAIT},
+            BACKGROUND: {
+                'reserve': settings.TMDB_RATE_BACKGROUND_RESERVE,
+                'max_wait': settings.TMDB_RATE_BACKGROUND_MAX_WAIT,
+            },
+        }
+        self._script = None
+        self._local_tokens = float(self.capacity)
+        self._local_ts = time.monotonic()
+        self._local_lock = threading.Lock()
+
+    def acquire(self, lane=None):
+        """
+        Take one token for the given lane (defaults to the current lane),
+        queueing for up to the lane's max_wait seconds.
+
+        Raises:
+            RateLimitExceeded: if the wait budget runs out first
+        """
+        lane = self.lanes[lane or _lane.get()]
+        deadline = time.monotonic() + lane['max_wait']
+
+        while True:
+            wait = self._take(lane['reserve'])
+            if wait == 0:
+                return
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise RateLimitExceeded("TMDb rate limit exceeded")
+            time.sleep(min(wait, remaining))
+
+    def _take(self, reserve):
+        if self._script is None:
+            try:
+                self._script = get_redis_connection('default').register_script(TOKEN_BUCKET_SCRIPT)
+            except NotImplementedError:
+                # Default cache is not django-redis
+                self._script = False
+        if self._script is False:
+            return self._take_local(reserve)
+
+        try:
+            return float(self._script(keys=[self.key], args=[self.rate, self.capacity, reserve]))
+        except RedisError as e:
+            logger.warning(f"TMDb rate limiter falling back to per-process bucket: {e}")
+            return self._take_local(reserve)
+
+    def _take_local(self, reserve):
+        with self._local_lock:
+            now = time.monotonic()
+            tokens = min(self.capacity, self._local_tokens + (now - self._local_ts) * self.rate)
+            self._local_ts = now
+            if tokens - 1 >= reserve:
+                self._local_tokens = tokens - 1
+                return 0
+            self._local_tokens = tokens
+            return (reserve + 1 - tokens) / self.rate
+
+
+def current_lane():
+    return _lane.get()
+
+
+@contextmanager
+def lane(name):
+    """
+    Run TMDb calls made inside the block in the given priority lane, e.g.
+
+        with rate_limiter.lane(rate_limiter.BACKGROUND):
+            tmdb_api.get_movie_details(550)
+    """
+    token = _lane.set(name)
+    try:
+        yield
+    finally:
+        _lane.reset(token)
+
+
+limiter = TokenBucketLimiter()
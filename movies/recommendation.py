@@ -1,9 +1,197 @@
 # movies/recommendation.py
 
-import numpy as np # type: ignore
-from sklearn.metrics.pairwise import cosine_similarity # type: ignore
-from django.db.models import Avg, Count
-from .models import Movie, Rating, Genre
+import heapq
+import uuid
+from functools import reduce
+from itertools import groupby, islice
+from operator import itemgetter, or_
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Avg, Count, F
+from .metrics import RECOMMENDER_STAGE_DURATION
+from .models import GENRE_MASK_BITS, FavoriteMovie, Movie, Rating, Genre
+
+# NumPy and SciPy are imported where they are used, so that importing this
+# module (which every worker and management command does through signals
+# and views) stays cheap; movies.warmup loads them before the first request.
+
+# Candidate movies scored per NumPy batch
+SCORING_CHUNK_SIZE = 2000
+
+# Replaced whenever ratings change, and reported as the version of the
+# rating data. Versions are random, so a lost key never brings back an old one.
+RATINGS_VERSION_KEY = 'recommender:ratings_version'
+
+# Cached user contexts are keyed by a generation that is only replaced by
+# changes not attributed to particular users (bulk imports); otherwise just
+# the users whose ratings or favorites changed are forgotten
+USER_CONTEXTS_GENERATION_KEY = 'recommender:user_contexts_generation'
+# Seconds a user's context may be reused by later requests
+USER_CONTEXT_TIMEOUT = 60 * 5
+# Seconds a forgotten context stays uncached, so that one loaded before
+# the user's favorites changed is not stored after them
+USER_CONTEXT_TOMBSTONE_TIMEOUT = 60
+_TOMBSTONE = 'forgotten'
+
+
+def _new_ratings_version():
+    return uuid.uuid4().hex
+
+
+_new_user_contexts_generation = _new_ratings_version
+
+
+def ratings_version():
+    """
+    Current version of the rating data seen by the recommender.
+    """
+    return cache.get_or_set(RATINGS_VERSION_KEY, _new_ratings_version, None)
+
+
+def genre_bits(masks):
+    """
+    Expand genre masks into a (len(masks), GENRE_MASK_BITS) 0/1 float matrix.
+    """
+    import numpy as np
+    masks = np.asarray(masks, dtype=np.int64)
+    return ((masks[:, None] >> np.arange(GENRE_MASK_BITS)) & 1).astype(float)
+
+
+def rating_matrix(kind='item'):
+    """
+    All ratings as a sparse matrix for batch similarity jobs (see
+    movies.similarity).
+
+    Args:
+        kind: 'item' for a movies x users matrix, 'user' for users x movies
+
+    Returns:
+        (matrix, row_ids): a CSR matrix and the movie or user ID of each row
+    """
+    import numpy as np
+    from scipy import sparse
+    fields = ('movie_id', 'user_id') if kind == 'item' else ('user_id', 'movie_id')
+    rows = Rating.objects.values_list(*fields, 'rating').iterator(chunk_size=10000)
+    triples = np.array(list(rows), dtype=np.float64).reshape(-1, 3)
+
+    row_ids, row_index = np.unique(triples[:, 0].astype(np.int64), return_inverse=True)
+    column_ids, column_index = np.unique(triples[:, 1].astype(np.int64), return_inverse=True)
+    matrix = sparse.csr_matrix(
+        (triples[:, 2].astype(np.float32), (row_index, column_index)),
+        shape=(len(row_ids), len(column_ids)),
+    )
+    return matrix, row_ids
+
+
+def invalidate_rating_state():
+    """
+    Mark recommender state derived from ratings as stale. Collaborative
+    filtering depends on every user's ratings, so any change bumps the
+    global version rather than just the affected users.
+    """
+    cache.set(RATINGS_VERSION_KEY, _new_ratings_version(), None)
+
+
+def user_context_key(user_id):
+    generation = cache.get_or_set(USER_CONTEXTS_GENERATION_KEY, _new_user_contexts_generation, None)
+    return f'recommender:user_context:{generation}:{user_id}'
+
+
+class UserContext:
+    """
+    What the recommender stages need to know about one user, loaded with
+    two queries however long their history: their ratings (as aligned
+    arrays of movie IDs, genre masks and ratings), the rated and favorite
+    movie IDs, and their genre preferences.
+    
+    Nothing in it depends on how many recommendations are asked for, so
+    cached() shares one copy between requests. A cached context is
+    dropped when the user's ratings or favorites change (see signals.py);
+    for a minute after that, it is loaded per request. Bulk rating imports
+    drop every context at once (forget_all).
+    """
+    
+    # Ratings at or above this count as liked for genre preferences
+    LIKED_RATING = 4
+    
+    def __init__(self, user_id, ratings, favorite_ids):
+        """
+        Args:
+            user_id: ID of the user
+            ratings: (movie_id, genre_mask, rating) of each of their ratings
+            favorite_ids: IDs of their favorite movies
+        """
+        import numpy as np
+        
+        self.user_id = user_id
+        movie_ids, masks, values = zip(*ratings) if ratings else ((), (), ())
+        self.movie_ids = np.array(movie_ids, dtype=np.int64)
+        self.genre_masks = np.array(masks, dtype=np.int64)
+        self.ratings = np.array(values, dtype=float)
+        self.rated_ids = frozenset(movie_ids)
+        self.ratings_by_movie = dict(zip(movie_ids, values))
+        self.favorite_ids = frozenset(favorite_ids)
+        
+        liked = self.ratings >= self.LIKED_RATING
+        self.liked_count = int(liked.sum())
+        self.liked_mask = reduce(or_, self.genre_masks[liked].tolist(), 0)
+        # Genre preferences indexed by Genre.bit, normalized to sum to 1
+        self.genre_weights = (genre_bits(self.genre_masks[liked]) * self.ratings[liked][:, None]).sum(axis=0)
+        total_score = self.genre_weights.sum()
+        if total_score > 0:
+            self.genre_weights /= total_score
+    
+    @property
+    def known_ids(self):
+        """
+        Movies the user already knows (rated or favorited), which are never recommended.
+        """
+        return self.rated_ids | self.favorite_ids
+    
+    @classmethod
+    def load(cls, user_id):
+        ratings = list(Rating.objects.filter(user_id=user_id).values_list('movie_id', 'movie__genre_mask', 'rating'))
+        favorite_ids = FavoriteMovie.objects.filter(user_id=user_id).values_list('movie_id', flat=True)
+        return cls(user_id, ratings, list(favorite_ids))
+    
+    @classmethod
+    def cached(cls, user_id):
+        """
+        The user's context from the cache, loading and caching it if needed.
+        """
+        # The key (and so the generation) is read before the context is
+        # loaded: a bulk import made meanwhile replaces the generation,
+        # leaving what is stored here under an outdated key
+        key = user_context_key(user_id)
+        context = cache.get(key)
+        if not isinstance(context, cls):
+            context = cls.load(user_id)
+            cache.add(key, context, USER_CONTEXT_TIMEOUT)
+        return context
+    
+    @staticmethod
+    def forget(user_id):
+        """
+        Replace the user's cached context with a tombstone, which cached()
+        does not overwrite.
+        """
+        def bury():
+            cache.set(user_context_key(user_id), _TOMBSTONE, USER_CONTEXT_TOMBSTONE_TIMEOUT)
+        bury()
+        # Again once the change is visible to other connections
+        transaction.on_commit(bury)
+    
+    @staticmethod
+    def forget_all():
+        """
+        Drop every user's cached context, for rating changes not attributed
+        to particular users.
+        """
+        def replace_generation():
+            cache.set(USER_CONTEXTS_GENERATION_KEY, _new_user_contexts_generation(), None)
+        replace_generation()
+        transaction.on_commit(replace_generation)
+
 
 class MovieRecommender:
     """
@@ -15,138 +203,158 @@ class MovieRecommender:
         self.content_weight = 0.4  # Weight for content-based recommendations
         self.collab_weight = 0.6   # Weight for collaborative filtering recommendations
     
-    def get_recommendations(self, user_id, num_recommendations=10):
+    def get_recommendations(self, user_id, num_recommendations=10, context=None):
         """
         Get personalized movie recommendations for a user.
         
+        Scoring works on movie IDs only; callers hydrate the final list
+        (see resolver.hydrate_movies), so no Movie instances are built for
+        the candidates that are thrown away.
+        
         Args:
             user_id: ID of the user to get recommendations for
             num_recommendations: Number of recommendations to return
+            context: The user's UserContext (e.g. UserContext.cached), loaded if not given
             
         Returns:
-            List of recommended Movie objects
+            List of recommended movie IDs, best first
         """
+        if context is None:
+            with RECOMMENDER_STAGE_DURATION.labels('user_context').time():
+                context = UserContext.load(user_id)
+        
         # Get both types of recommendations
-        content_based_recs = self.content_based_recommendations(user_id, num_recommendations * 2)
-        collab_recs = self.collaborative_filtering_recommendations(user_id, num_recommendations * 2)
+        with RECOMMENDER_STAGE_DURATION.labels('content_based').time():
+            content_based_recs = self.content_based_recommendations(context, num_recommendations * 2)
+        with RECOMMENDER_STAGE_DURATION.labels('collaborative').time():
+            collab_recs = self.collaborative_filtering_recommendations(context, num_recommendations * 2)
         
         # Combine and weight recommendations
-        combined_recs = self._combine_recommendations(content_based_recs, collab_recs)
+        with RECOMMENDER_STAGE_DURATION.labels('combine').time():
+            combined_recs = self._combine_recommendations(content_based_recs, collab_recs)
         
         # Return top N recommendations
         return combined_recs[:num_recommendations]
     
-    def content_based_recommendations(self, user_id, num_recommendations=20):
+    def content_based_recommendations(self, context, num_recommendations=20):
         """
         Generate content-based recommendations based on movie genres and attributes
         that the user has highly rated.
+        
+        Genres are compared through Movie.genre_mask: candidates sharing a
+        liked genre are selected with a bitwise AND in SQL and scored in
+        NumPy, a chunk at a time, without joining the genre tables.
+        
+        Args:
+            context: The user's UserContext, or their ID to load it
         """
-        # Get movies the user has rated highly
-        user_ratings = Rating.objects.filter(user_id=user_id, rating__gte=4)
+        import numpy as np
         
-        if not user_ratings.exists():
+        context = self._context(context)
+        if not context.liked_count:
             # If user has no ratings, return popular movies
             return self._get_popular_movies(num_recommendations)
         
-        # Get the genres of movies the user likes
-        liked_genres = {}
-        for rating in user_ratings:
-            for genre in rating.movie.genres.all():
-                if genre.id in liked_genres:
-                    liked_genres[genre.id] += rating.rating
-                else:
-                    liked_genres[genre.id] = rating.rating
-        
-        # Normalize genre preferences
-        total_score = sum(liked_genres.values())
-        if total_score > 0:
-            for genre_id in liked_genres:
-                liked_genres[genre_id] /= total_score
-        
-        # Get all movies the user hasn't rated yet
-        rated_movie_ids = user_ratings.values_list('movie_id', flat=True)
-        unwatched_movies = Movie.objects.exclude(id__in=rated_movie_ids)
-        
-        # Score each movie based on genre match
-        movie_scores = []
-        for movie in unwatched_movies:
-            score = 0
-            for genre in movie.genres.all():
-                score += liked_genres.get(genre.id, 0)
-            
+        known_ids = list(context.known_ids)
+        genre_weights = context.genre_weights
+        
+        # Only movies sharing a liked genre can score above 0
+        candidates = Movie.objects.exclude(
+            id__in=known_ids
+        ).annotate(
+            liked_genres=F('genre_mask').bitand(context.liked_mask)
+        ).exclude(liked_genres=0).order_by('id').values_list('id', 'genre_mask').iterator()
+        
+        top_ids, top_scores = np.empty(0, dtype=np.int64), np.empty(0)
+        while chunk := list(islice(candidates, SCORING_CHUNK_SIZE)):
+            movie_ids, masks = zip(*chunk)
+            bits = genre_bits(masks)
             # Normalize by number of genres to prevent bias towards movies with many genres
-            num_genres = movie.genres.count()
-            if num_genres > 0:
-                score /= num_genres
-                
-            movie_scores.append((movie, score))
+            scores = bits @ genre_weights / bits.sum(axis=1)
+            
+            # Keep only the top recommendations in memory, ties going to the lower ID
+            movie_ids = np.concatenate([top_ids, np.array(movie_ids, dtype=np.int64)])
+            scores = np.concatenate([top_scores, scores])
+            best = np.lexsort((movie_ids, -scores))[:num_recommendations]
+            top_ids, top_scores = movie_ids[best], scores[best]
         
-        # Sort movies by score and return top recommendations
-        movie_scores.sort(key=lambda x: x[1], reverse=True)
-        return [movie for movie, score in movie_scores[:num_recommendations]]
+        recommended = top_ids.tolist()
+        
+        # Movies with none of the liked genres all score 0 and come after the rest
+        if len(recommended) < num_recommendations:
+            recommended += Movie.objects.exclude(
+                id__in=known_ids + recommended
+            ).order_by('id').values_list('id', flat=True)[:num_recommendations - len(recommended)]
+        return recommended
     
-    def collaborative_filtering_recommendations(self, user_id, num_recommendations=20):
+    def collaborative_filtering_recommendations(self, context, num_recommendations=20):
         """
         Generate collaborative filtering recommendations based on
         similar users' ratings.
+        
+        Args:
+            context: The user's UserContext, or their ID to load it
         """
-        # Get all users who have rated at least one movie in common with the target user
-        user_ratings = Rating.objects.filter(user_id=user_id)
+        context = self._context(context)
+        target_ratings = context.ratings_by_movie
         
-        if not user_ratings.exists():
+        if not target_ratings:
             # If user has no ratings, return popular movies
             return self._get_popular_movies(num_recommendations)
         
-        # Find movies rated by the user
-        rated_movie_ids = user_ratings.values_list('movie_id', flat=True)
+        # Calculate similarity scores with users who rated the same movies
+        user_similarities = self._calculate_user_similarities(context.user_id, target_ratings)
         
-        # Find users who rated the same movies
-        similar_users = Rating.objects.filter(
-            movie_id__in=rated_movie_ids
+        # Stream similar users' ratings of movies the target user doesn't know
+        known_ids = list(context.known_ids)
+        similar_ratings = Rating.objects.filter(
+            user_id__in=list(user_similarities)
         ).exclude(
-            user_id=user_id
-        ).values_list('user_id', flat=True).distinct()
-        
-        # Calculate user similarity scores
-        user_similarities = self._calculate_user_similarities(user_id, similar_users)
+            movie_id__in=known_ids
+        ).order_by('movie_id').values_list('movie_id', 'user_id', 'rating').iterator()
         
-        # Get movies rated highly by similar users that the target user hasn't rated
-        unwatched_movies = Movie.objects.exclude(id__in=rated_movie_ids)
+        def scores():
+            for movie_id, ratings in groupby(similar_ratings, key=itemgetter(0)):
+                yield movie_id, self._predict_rating(
+                    [(user_id, rating) for _, user_id, rating in ratings], user_similarities
+                )
         
-        # Score each unwatched movie based on similar users' ratings
-        movie_scores = []
-        for movie in unwatched_movies:
-            score = self._predict_rating(movie.id, user_id, user_similarities)
-            movie_scores.append((movie, score))
+        top = heapq.nlargest(num_recommendations, scores(), key=itemgetter(1))
+        recommended = [movie_id for movie_id, score in top if score > 0]
         
-        # Sort by predicted rating and return top recommendations
-        movie_scores.sort(key=lambda x: x[1], reverse=True)
-        return [movie for movie, score in movie_scores[:num_recommendations]]
+        # Movies nobody similar has rated all predict 0 and come after the rest
+        if len(recommended) < num_recommendations:
+            recommended += Movie.objects.exclude(
+                id__in=known_ids + recommended
+            ).order_by('id').values_list('id', flat=True)[:num_recommendations - len(recommended)]
+        return recommended
     
-    def _calculate_user_similarities(self, target_user_id, similar_users):
+    def _context(self, context):
+        return context if isinstance(context, UserContext) else UserContext.load(context)
+    
+    def _calculate_user_similarities(self, target_user_id, target_ratings):
         """
         Calculate similarity scores between target user and other users
-        based on their ratings.
+        based on their ratings of the movies the target user rated.
         """
         similarities = {}
-        target_ratings = dict(Rating.objects.filter(
+        
+        # Only ratings of the target user's movies matter for the correlation
+        other_ratings = Rating.objects.filter(
+            movie_id__in=list(target_ratings)
+        ).exclude(
             user_id=target_user_id
-        ).values_list('movie_id', 'rating'))
+        ).order_by('user_id').values_list('user_id', 'movie_id', 'rating').iterator()
         
-        for other_user_id in similar_users:
-            other_ratings = dict(Rating.objects.filter(
-                user_id=other_user_id
-            ).values_list('movie_id', 'rating'))
-            
-            # Find movies rated by both users
-            common_movies = set(target_ratings.keys()) & set(other_ratings.keys())
+        for other_user_id, ratings in groupby(other_ratings, key=itemgetter(0)):
+            common_ratings = [(movie_id, rating) for _, movie_id, rating in ratings]
             
-            if len(common_movies) < 2:
+            if len(common_ratings) < 2:
                 continue  # Need at least 2 movies in common
             
             # Get ratings vectors for common movies
-            target_vector = [target_ratings[movie_id] for movie_id in common_movies]
-            other_vector = [other_ratings[movie_id] for movie_id in common_movies]
+            target_vector = [target_ratings[movie_id] for movie_id, _ in common_ratings]
+            other_vector = [rating for _, rating in common_ratings]
             
             # Calculate Pearson correlation coefficient
             similarity = self._pearson_correlation(target_vector, other_vector)
@@ -161,6 +369,8 @@ class MovieRecommender:
         """
         Calculate Pearson correlation coefficient between two vectors.
         """
+        import numpy as np
+        
         x = np.array(x)
         y = np.array(y)
         
@@ -180,30 +390,18 @@ class MovieRecommender:
             
         return numerator / denominator
     
-    def _predict_rating(self, movie_id, user_id, user_similarities):
+    def _predict_rating(self, ratings, user_similarities):
         """
-        Predict a user's rating for a movie based on similar users' ratings.
+        Predict a user's rating for a movie from similar users' (user_id, rating)
+        pairs for it.
         """
-        if not user_similarities:
-            return 0
-            
-        # Get all ratings for this movie from similar users
-        similar_user_ids = list(user_similarities.keys())
-        similar_ratings = Rating.objects.filter(
-            movie_id=movie_id,
-            user_id__in=similar_user_ids
-        )
-        
-        if not similar_ratings.exists():
-            return 0
-            
         # Calculate weighted average of ratings
         weighted_sum = 0
         similarity_sum = 0
         
-        for rating in similar_ratings:
-            similarity = user_similarities[rating.user_id]
-            weighted_sum += rating.rating * similarity
+        for user_id, rating in ratings:
+            similarity = user_similarities[user_id]
+            weighted_sum += rating * similarity
             similarity_sum += similarity
             
         if similarity_sum == 0:
@@ -219,34 +417,28 @@ class MovieRecommender:
         combined = {}
         
         # Add content-based recommendations with weighting
-        for i, movie in enumerate(content_recs):
+        for i, movie_id in enumerate(content_recs):
             # Score inversely proportional to position
             score = (len(content_recs) - i) / len(content_recs) * self.content_weight
-            combined[movie.id] = {'movie': movie, 'score': score}
+            combined[movie_id] = score
         
         # Add collaborative filtering recommendations with weighting
-        for i, movie in enumerate(collab_recs):
+        for i, movie_id in enumerate(collab_recs):
             # Score inversely proportional to position
             score = (len(collab_recs) - i) / len(collab_recs) * self.collab_weight
-            if movie.id in combined:
-                combined[movie.id]['score'] += score
-            else:
-                combined[movie.id] = {'movie': movie, 'score': score}
+            combined[movie_id] = combined.get(movie_id, 0) + score
         
         # Sort results by total score
-        result = [info['movie'] for info in 
-                  sorted(combined.values(), key=lambda x: x['score'], reverse=True)]
-        
-        return result
+        return sorted(combined, key=combined.get, reverse=True)
     
     def _get_popular_movies(self, num_movies=10):
         """
-        Get popular movies based on average rating and number of ratings.
+        Get popular movie IDs based on average rating and number of ratings.
         Used as fallback when user has no ratings.
         """
         return list(Movie.objects.annotate(
-            avg_rating=Avg('rating__rating'),
-            num_ratings=Count('rating')
+            avg_rating=Avg('ratings__rating'),
+            num_ratings=Count('ratings')
         ).filter(
             num_ratings__gte=5  # At least 5 ratings
-        ).order_by('-avg_rating')[:num_movies])
+        ).order_by('-avg_rating', 'id').values_list('id', flat=True)[:num_movies])
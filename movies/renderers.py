@@ -0,0 +1,64 @@
+# movies/renderers.py
+
+import re
+import orjson
+from rest_framework.renderers import JSONRenderer
+
+# orjson and json.dumps agree on everything DRF emits except the notation of
+# very small and very large floats: orjson writes 1e16 and 0.00001 where
+# Python writes 1e+16 and 1e-05. Numbers are matched whole, between the
+# delimiters of compact JSON, so that no part of a larger number is taken
+# for one; JSON strings are matched too, so that digits inside them are
+# left alone.
+FLOAT_TOKEN = re.compile(
+    rb'"(?:[^"\\]|\\.)*"'
+    rb'|(?<![^\[,:])-?\d+(?:\.\d+)?(?:e[+-]?\d+)?(?![^,\]}])'
+)
+# Cheap pre-check, so the full scan only runs when such a float may be present
+MAYBE_EXPONENT = re.compile(rb'e-?\d')
+
+
+def _python_float(match):
+    token = match.group()
+    if token.startswith(b'"') or not (b'e' in token or token.lstrip(b'-').startswith(b'0.0000')):
+        return token
+    return repr(float(token)).encode()
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    Drop-in JSONRenderer that encodes with orjson. The output is byte for
+    byte what JSONRenderer produces with the default compact/unicode
+    settings; anything orjson cannot encode natively goes through DRF's
+    JSONEncoder, and indented output (e.g. for the browsable API) is left
+    to JSONRenderer.
+
+    Unlike JSONRenderer, NaN and infinite floats are written as null
+    instead of raising.
+    """
+    options = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        """
+        Render `data` into JSON, returning a bytestring.
+        """
+        if data is None:
+            return b''
+
+        renderer_context = renderer_context or {}
+        if (self.ensure_ascii or not self.compact
+                or self.get_indent(accepted_media_type, renderer_context) is not None):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(data, default=self.encoder_class().default, option=self.options)
+        except orjson.JSONEncodeError:
+            # e.g. integers beyond 64 bits
+            return super().render(data, accepted_media_type, renderer_context)
+
+        if b'0.0000' in ret or MAYBE_EXPONENT.search(ret):
+            ret = FLOAT_TOKEN.sub(_python_float, ret)
+
+        # Same escaping as JSONRenderer, which keeps the output a strict
+        # javascript subset
+        return ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
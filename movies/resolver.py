@@ -0,0 +1,258 @@
+# movies/resolver.py
+
+import time
+import uuid
+from django.core.cache import cache, caches
+from django.db import DEFAULT_DB_ALIAS, transaction
+from .conditional import make_etag
+from .models import Movie
+from .serializers import MovieSerializer, movie_dicts
+from . import db_router, tmdb_api
+
+# Per-process cache tier (CACHES['local']), checked before the database and Redis
+local_cache = caches['local']
+
+# Movie rows in every process's cache are keyed by a generation kept in the
+# shared cache, which any change to a movie replaces. Processes re-read it
+# at most every ROWS_GENERATION_CHECK_INTERVAL seconds, so other workers
+# stop serving a changed movie within that time. Generations are random, so
+# a lost key never brings back an old one.
+ROWS_GENERATION_KEY = 'movie_rows:generation'
+ROWS_GENERATION_CHECK_INTERVAL = 1.0
+_last_generation = {'value': None, 'checked_at': float('-inf')}
+
+
+def _new_generation():
+    return uuid.uuid4().hex
+
+
+def _rows_generation():
+    now = time.monotonic()
+    if now - _last_generation['checked_at'] >= ROWS_GENERATION_CHECK_INTERVAL:
+        _last_generation['value'] = cache.get_or_set(ROWS_GENERATION_KEY, _new_generation, None)
+        _last_generation['checked_at'] = now
+    return _last_generation['value']
+
+
+def _row_key(tmdb_id, generation):
+    return f'movie_row:{generation}:{tmdb_id}'
+
+
+def _hydrated_key(movie_id, generation):
+    return f'movie_row_by_id:{generation}:{movie_id}'
+
+
+def _details_key(tmdb_id):
+    return f'movie_details:{tmdb_id}'
+
+
+def resolve_movie(tmdb_id):
+    """
+    Resolve a TMDb ID to a local Movie, or None if TMDb does not know it either.
+    """
+    return resolve_movies([tmdb_id]).get(tmdb_id)
+
+
+def resolve_movies(tmdb_ids):
+    """
+    Resolve TMDb IDs to local Movie objects, trying each tier in turn:
+    the in-process cache, the Movie table, then TMDb (through the Redis
+    cached tmdb_api). Whatever a slower tier returns is written through to
+    the faster ones.
+
+    Returns:
+        Dict mapping each resolvable TMDb ID to its Movie
+    """
+    tmdb_ids = list(dict.fromkeys(tmdb_ids))
+    generation = _rows_generation()
+    rows = local_cache.get_many([_row_key(tmdb_id, generation) for tmdb_id in tmdb_ids])
+    movies = {row['tmdb_id']: _movie_from_row(row) for row in rows.values()}
+
+    missing = [tmdb_id for tmdb_id in tmdb_ids if tmdb_id not in movies]
+    if not missing:
+        return movies
+
+    resolved = {movie.tmdb_id: movie for movie in Movie.objects.filter(tmdb_id__in=missing)}
+
+    missing = [tmdb_id for tmdb_id in missing if tmdb_id not in resolved]
+    if missing:
+        details = tmdb_api.get_movie_details_many(missing)
+        resolved.update(store_movies(
+            [data for data in details.values() if 'error' not in data]
+        ))
+
+    _remember(resolved.values())
+    movies.update(resolved)
+    return movies
+
+
+def resolve_movie_details(tmdb_id):
+    """
+    Full TMDb details for one movie; see resolve_movie_details_many.
+    """
+    return resolve_movie_details_many([tmdb_id])[tmdb_id]
+
+
+def resolve_movie_details_with_etag(tmdb_id):
+    """
+    Full TMDb details for one movie and the ETag of that payload (None for
+    errors). The ETag is computed once, when the payload enters this
+    process's cache, and kept next to it, so it always matches the body
+    served and is not rehashed per request.
+    """
+    return _resolve_details([tmdb_id])[tmdb_id]
+
+
+def resolve_movie_details_many(tmdb_ids):
+    """
+    Full TMDb detail payloads, served from the in-process cache when possible
+    and otherwise from tmdb_api (Redis, then TMDb). The local Movie table only
+    holds a subset of the payload, so it cannot answer these on its own, but
+    every payload fetched here is written through to it so later favorites
+    and recommendations resolve without going upstream.
+
+    Returns:
+        Dict mapping each TMDb ID to its details, or to {'error': ...}
+    """
+    return {tmdb_id: data for tmdb_id, (data, etag) in _resolve_details(tmdb_ids).items()}
+
+
+def _resolve_details(tmdb_ids):
+    """
+    (details, ETag) for each TMDb ID; see resolve_movie_details_many.
+    """
+    tmdb_ids = list(dict.fromkeys(tmdb_ids))
+    cached = local_cache.get_many([_details_key(tmdb_id) for tmdb_id in tmdb_ids])
+    details = {data['id']: (data, etag) for data, etag in cached.values()}
+
+    missing = [tmdb_id for tmdb_id in tmdb_ids if tmdb_id not in details]
+    if missing:
+        fetched = tmdb_api.get_movie_details_many(missing)
+        found = {tmdb_id: data for tmdb_id, data in fetched.items() if 'error' not in data}
+
+        # Only movies missing from the Movie table are inserted (see store_movies)
+        generation = _rows_generation()
+        known = local_cache.get_many([_row_key(tmdb_id, generation) for tmdb_id in found])
+        _remember(store_movies(
+            [data for tmdb_id, data in found.items() if _row_key(tmdb_id, generation) not in known]
+        ).values())
+        entries = {tmdb_id: (data, make_etag(data)) for tmdb_id, data in found.items()}
+        local_cache.set_many({_details_key(tmdb_id): entry for tmdb_id, entry in entries.items()})
+        details.update((tmdb_id, entries.get(tmdb_id, (data, None))) for tmdb_id, data in fetched.items())
+
+    return details
+
+
+def serialize_movies(movies):
+    """
+    Serialize Movie objects to the same dicts MovieSerializer produces,
+    reusing the in-process rows where available and caching the rest.
+    """
+    generation = _rows_generation()
+    rows = local_cache.get_many([_row_key(movie.tmdb_id, generation) for movie in movies])
+    missing = [movie for movie in movies if _row_key(movie.tmdb_id, generation) not in rows]
+    if missing:
+        new_rows = _cache_rows(movie_dicts(missing), generation)
+        rows.update((_row_key(row['tmdb_id'], generation), row) for row in new_rows)
+    return [rows[_row_key(movie.tmdb_id, generation)] for movie in movies]
+
+
+def hydrate_movies(movie_ids):
+    """
+    Serialized rows (as MovieSerializer produces them) for local movie IDs,
+    in the given order. Rows come from the in-process cache, and only the
+    misses are loaded, with a single in_bulk() query. IDs of movies that no
+    longer exist are dropped.
+    """
+    generation = _rows_generation()
+    cached = local_cache.get_many([_hydrated_key(movie_id, generation) for movie_id in movie_ids])
+    rows = {row['id']: row for row in cached.values()}
+
+    missing = [movie_id for movie_id in movie_ids if movie_id not in rows]
+    if missing:
+        movies = Movie.objects.only(*MovieSerializer.Meta.fields).in_bulk(missing)
+        rows.update((row['id'], row) for row in _cache_rows(movie_dicts(movies.values()), generation))
+
+    return [rows[movie_id] for movie_id in movie_ids if movie_id in rows]
+
+
+def forget_movie(movie):
+    """
+    Drop a changed movie's rows from every process's cache, by moving the
+    shared generation on (and again once the change is committed, so that
+    rows read before then are dropped too).
+    """
+    _next_rows_generation()
+    transaction.on_commit(_next_rows_generation)
+
+
+def _next_rows_generation():
+    generation = _new_generation()
+    cache.set(ROWS_GENERATION_KEY, generation, None)
+    _last_generation.update(value=generation, checked_at=time.monotonic())
+
+
+def store_movies(payloads):
+    """
+    Insert Movie rows for TMDb payloads that are not stored yet and return
+    the stored movies keyed by TMDb ID. Movies already in the table are
+    only read, so writing a payload through twice costs no second INSERT.
+    """
+    if not payloads:
+        return {}
+
+    stored = {
+        movie.tmdb_id: movie
+        for movie in Movie.objects.filter(tmdb_id__in=[data['id'] for data in payloads])
+    }
+    new = [data for data in payloads if data['id'] not in stored]
+    if not new:
+        return stored
+
+    # Catalog data, not the client's own changes: the client stays on the replicas
+    with db_router.write_through():
+        Movie.objects.bulk_create([
+            Movie(
+                tmdb_id=data['id'],
+                title=data['title'],
+                overview=data.get('overview', ''),
+                poster_path=data.get('poster_path'),
+                release_date=data.get('release_date') or None,
+                vote_average=data.get('vote_average', 0.0),
+            )
+            for data in new
+        ], ignore_conflicts=True)
+
+    stored.update(
+        (movie.tmdb_id, movie)
+        for movie in Movie.objects.using(DEFAULT_DB_ALIAS).filter(tmdb_id__in=[data['id'] for data in new])
+    )
+    return stored
+
+
+def _remember(movies):
+    """
+    Write movies through to the in-process cache.
+    """
+    serialize_movies(list(movies))
+
+
+def _cache_rows(rows, generation):
+    """
+    Store serialized rows under both their TMDb and local IDs.
+    """
+    entries = {}
+    for row in rows:
+        entries[_row_key(row['tmdb_id'], generation)] = row
+        entries[_hydrated_key(row['id'], generation)] = row
+    local_cache.set_many(entries)
+    return rows
+
+
+def _movie_from_row(row):
+    """
+    Rebuild a Movie from a cached row without touching the database.
+    """
+    fields = [field for field in Movie._meta.concrete_fields if field.attname in row]
+    values = [field.to_python(row[field.attname]) for field in fields]
+    return Movie.from_db(DEFAULT_DB_ALIAS, [field.attname for field in fields], values)
@@ -0,0 +1,91 @@
+# movies/search.py
+
+import re
+import unicodedata
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramSimilarity
+from django.db import connection
+from django.db.models import F, Q
+from .models import Movie
+from . import resolver, tmdb_api
+
+PAGE_SIZE = 20  # Same page size as TMDb
+
+# Fields of a local search result, mirroring TMDb's (whose 'id' is our tmdb_id)
+RESULT_FIELDS = ('id', 'title', 'overview', 'poster_path', 'release_date', 'vote_average')
+
+
+def normalize_query(query):
+    """
+    Canonical form of a search query, so "Matrix" and "matrix " share a cache key.
+    """
+    query = unicodedata.normalize('NFKC', query).casefold()
+    return ' '.join(query.split())
+
+
+def parse_page(page):
+    """
+    Page number from a query parameter, defaulting to the first page.
+    """
+    try:
+        return max(int(page), 1)
+    except (TypeError, ValueError):
+        return 1
+
+
+def search_movies(query, page=1):
+    """
+    Search the local catalog first and only consult TMDb when it has fewer
+    than SEARCH_MIN_LOCAL_RESULTS matches. Movies found on TMDb are written
+    to the Movie table so later searches can be answered locally.
+
+    Returns a TMDb-shaped payload ('page', 'results', 'total_pages',
+    'total_results') whose results carry the TMDb ID as 'id'.
+    """
+    query = normalize_query(query)
+    page = parse_page(page)
+
+    matches = search_local(query)
+    total = matches.count()
+    if total >= settings.SEARCH_MIN_LOCAL_RESULTS:
+        offset = (page - 1) * PAGE_SIZE
+        return {
+            'page': page,
+            'results': [
+                dict(zip(RESULT_FIELDS, row))
+                for row in matches.values_list('tmdb_id', *RESULT_FIELDS[1:])[offset:offset + PAGE_SIZE]
+            ],
+            'total_pages': -(-total // PAGE_SIZE),
+            'total_results': total,
+            'source': 'local',
+        }
+
+    data = tmdb_api.search_movies(query, page)
+    if 'error' not in data:
+        resolver.store_movies([movie for movie in data.get('results', []) if movie.get('title')])
+    return data
+
+
+def search_local(query):
+    """
+    Movies matching a normalized query, best matches first.
+
+    On Postgres this combines the GIN-indexed full-text vector (with prefix
+    matching on every term) and the trigram index on title (for typos).
+    Other backends fall back to a case-insensitive title match.
+    """
+    if connection.vendor != 'postgresql':
+        return Movie.objects.filter(title__icontains=query).order_by('-vote_average', 'id')
+
+    terms = re.findall(r'\w+', query)
+    if not terms:
+        return Movie.objects.none()
+
+    search_query = SearchQuery(
+        ' & '.join(f'{term}:*' for term in terms), config='english', search_type='raw'
+    )
+    return Movie.objects.filter(
+        Q(search_vector=search_query) | Q(title__trigram_similar=query)
+    ).annotate(
+        rank=SearchRank(F('search_vector'), search_query) + TrigramSimilarity('title', query)
+    ).order_by('-rank', 'id')
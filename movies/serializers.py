@@ -11,6 +11,75 @@ class MovieSerializer(serializers.ModelSerializer):
         fields = ['id', 'tmdb_id', 'title', 'overview', 'poster_path', 'release_date', 'vote_average']
 
 
+def _date_representation(value):
+    """Same as serializers.DateField().to_representation(value)"""
+    if not value:
+        return None
+    if isinstance(value, str):
+        return value
+    return value.isoformat()
+
+
+# DRF's to_representation for the MovieSerializer fields that need converting
+_REPRESENTATIONS = {
+    'tmdb_id': int,
+    'release_date': _date_representation,
+    'vote_average': float,
+}
+
+
+def movie_values(queryset, fields=None):
+    """
+    Read-only fast path for MovieSerializer(queryset, many=True).data: a
+    .values() projection of the serializer's fields (or the given subset),
+    skipping model instances and DRF's per-field machinery. Produces
+    identical dicts. Used for pages of the movie list.
+    """
+    fields = fields or MovieSerializer.Meta.fields
+    rows = list(queryset.values(*fields))
+    if 'release_date' in fields:
+        for row in rows:
+            row['release_date'] = _date_representation(row['release_date'])
+    return rows
+
+
+def movie_dicts(movies, fields=None):
+    """
+    Same as movie_values() for Movie instances that are already loaded.
+    Unlike rows read by .values(), instance attributes may not have been
+    converted by the database yet, so values are coerced as DRF does.
+    """
+    fields = fields or MovieSerializer.Meta.fields
+    converters = [(field, _REPRESENTATIONS.get(field)) for field in fields]
+    return [
+        {
+            field: convert(getattr(movie, field)) if convert else getattr(movie, field)
+            for field, convert in converters
+        }
+        for movie in movies
+    ]
+
+
+def favorite_dicts(favorites, movies=None):
+    """
+    Same as FavoriteMovieSerializer(favorites, many=True).data for
+    favorites loaded with select_related('movie'). `movies` may hold the
+    movies' serialized rows, in the same order, if they are already known.
+    """
+    added_at = serializers.DateTimeField()
+    if movies is None:
+        movies = movie_dicts([favorite.movie for favorite in favorites])
+    return [
+        {
+            'id': favorite.id,
+            'user': favorite.user_id,
+            'movie': movie,
+            'added_at': added_at.to_representation(favorite.added_at),
+        }
+        for favorite, movie in zip(favorites, movies)
+    ]
+
+
 class UserSerializer(serializers.ModelSerializer):
     """Serializer for user registration with password validation"""
     
@@ -55,3 +124,22 @@ class FavoriteMovieSerializer(serializers.ModelSerializer):
         # Associate the movie with the authenticated user
         validated_data['user'] = request.user
         return super().create(validated_data)
+
+
+class RatingInputSerializer(serializers.Serializer):
+    """Serializer for one submitted rating"""
+    
+    movie_id = serializers.IntegerField()  # TMDb ID, like the other movie endpoints
+    rating = serializers.FloatField(min_value=0.5, max_value=5.0)
+
+
+class RatingBatchSerializer(serializers.Serializer):
+    """Serializer for a batch of ratings submitted in one call"""
+    
+    MAX_RATINGS = 500
+    
+    ratings = serializers.ListField(
+        child=RatingInputSerializer(),
+        allow_empty=False,
+        max_length=MAX_RATINGS
+    )
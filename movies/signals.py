@@ -1,12 +1,117 @@
-from django.db.models.signals import post_save
-from django.dispatch import receiver
 from django.contrib.auth.models import User
-from .models import UserProfile
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import Signal, receiver
+from .models import FavoriteMovie, Genre, Movie, Rating
+from . import authentication, favorites, recommendation, resolver, trending
 
-@receiver(post_save, sender=User)
-def create_user_profile(sender, instance, created, **kwargs):
+# Sent once per batch of rating writes (API batch or CSV import), never per row.
+# user_ids lists the users whose ratings changed, or is None for bulk imports;
+# movie_ids lists the rated movies of API batches.
+ratings_updated = Signal()
+
+
+@receiver(ratings_updated)
+def update_recommender_state(sender, user_ids=None, **kwargs):
+    """
+    Signal to invalidate recommender state derived from ratings, and the
+    cached contexts of the users whose ratings changed
+    """
+    recommendation.invalidate_rating_state()
+    if user_ids is None:
+        recommendation.UserContext.forget_all()
+    else:
+        for user_id in user_ids:
+            recommendation.UserContext.forget(user_id)
+
+
+@receiver(post_save, sender=Rating)
+@receiver(post_delete, sender=Rating)
+def forget_rating_state(sender, instance, **kwargs):
+    """
+    Signal to drop a user's cached recommender context when one of their
+    ratings is saved or deleted on its own (e.g. in the admin)
+    """
+    recommendation.UserContext.forget(instance.user_id)
+
+
+@receiver(ratings_updated)
+def count_trending_ratings(sender, movie_ids=None, **kwargs):
+    """
+    Signal to count users' new ratings towards local trending
+    """
+    if movie_ids:
+        trending.trending.record('rating', movie_ids)
+
+
+@receiver(post_save, sender=FavoriteMovie)
+@receiver(post_delete, sender=FavoriteMovie)
+def forget_favorite_state(sender, instance, **kwargs):
     """
-    Signal to automatically create a UserProfile when a User is created
+    Signal to drop a user's cached favorites listing and recommender context
+    when their favorites change
+    """
+    favorites.forget_favorites(instance.user_id)
+    recommendation.UserContext.forget(instance.user_id)
+
+
+@receiver(post_save, sender=FavoriteMovie)
+def count_trending_favorite(sender, instance, created, **kwargs):
+    """
+    Signal to count a new favorite towards local trending
     """
     if created:
-        UserProfile.objects.create(user=instance)
\ No newline at end of file
+        trending.trending.record('favorite', [instance.movie_id])
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def forget_authenticated_user(sender, instance, **kwargs):
+    """
+    Signal to drop a changed user (e.g. deactivated, or with a new password)
+    from the authentication cache
+    """
+    authentication.forget_user(instance.pk)
+
+
+@receiver(post_save, sender=Movie)
+@receiver(post_delete, sender=Movie)
+def invalidate_movie_rows(sender, instance, **kwargs):
+    """
+    Signal to drop a changed movie from every process's row cache
+    """
+    resolver.forget_movie(instance)
+
+
+@receiver(m2m_changed, sender=Movie.genres.through)
+def update_genre_masks(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Signal to keep Movie.genre_mask in sync with Movie.genres, from either side
+    """
+    if not reverse:
+        # movie.genres.add/remove/set/clear
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            Movie.objects.filter(pk=instance.pk).update_genre_masks()
+            instance.refresh_from_db(fields=['genre_mask'])
+    elif action == 'pre_clear':
+        # genre.movies.clear: remember the movies before the links go
+        instance._cleared_movie_ids = list(instance.movies.values_list('id', flat=True))
+    elif action == 'post_clear':
+        Movie.objects.filter(pk__in=instance._cleared_movie_ids).update_genre_masks()
+    elif action in ('post_add', 'post_remove'):
+        Movie.objects.filter(pk__in=pk_set).update_genre_masks()
+
+
+@receiver(pre_delete, sender=Genre)
+def remember_genre_movies(sender, instance, **kwargs):
+    """
+    Signal to note a genre's movies before deleting it removes their links
+    """
+    instance._deleted_movie_ids = list(instance.movies.values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=Genre)
+def release_genre_bit(sender, instance, **kwargs):
+    """
+    Signal to clear a deleted genre's bit from its movies' masks
+    """
+    Movie.objects.filter(pk__in=getattr(instance, '_deleted_movie_ids', [])).update_genre_masks()
@@ -0,0 +1,159 @@
+# movies/similar_movies.py
+
+import time
+import uuid
+from django.conf import settings
+from django.core.cache import cache
+from .models import Movie
+from .recommendation import genre_bits, rating_matrix
+from .search import PAGE_SIZE, RESULT_FIELDS, parse_page
+
+# Serving only needs the store; NumPy, SciPy and scikit-learn are imported
+# by the functions that build it.
+
+# The neighbor store is built offline and kept in Redis; every process holds
+# a copy in memory and looks for a newer build at most this often (seconds)
+STORE_CHECK_INTERVAL = 30
+
+STORE_KEY = 'similar_movies:store'
+STORE_VERSION_KEY = 'similar_movies:version'
+
+# In-memory copy of the store: version, build time, TMDb ID -> position, neighbor
+# positions per movie and TMDb-shaped result rows
+_store = {'version': None, 'built_at': None, 'index': {}, 'neighbors': [], 'results': []}
+_checked_at = float('-inf')
+
+
+def content_vectors(masks, overviews):
+    """
+    Unit-length content vectors of movies: their genres (from genre_mask)
+    and the TF-IDF terms of their overviews, weighted equally.
+    """
+    import numpy as np
+    from scipy import sparse
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.preprocessing import normalize
+    genres = normalize(sparse.csr_matrix(genre_bits(masks)))
+    try:
+        terms = TfidfVectorizer(
+            stop_words='english', sublinear_tf=True, max_df=0.5, max_features=50000, dtype=np.float32
+        ).fit_transform(overviews)
+    except ValueError:
+        # No usable terms at all (e.g. every overview is empty)
+        terms = sparse.csr_matrix((len(overviews), 0), dtype=np.float32)
+    return normalize(sparse.hstack([genres, terms]).tocsr())
+
+
+def collaborative_vectors(movie_ids):
+    """
+    Unit-length rating vectors (movies x users, mean-centered) of the given
+    movies, in the same order; movies nobody rated get an empty row.
+    """
+    import numpy as np
+    from scipy import sparse
+    from .similarity import normalize_rows
+    matrix, rated_ids = rating_matrix('item')
+    matrix = normalize_rows(matrix)
+    positions = np.searchsorted(movie_ids, rated_ids)
+    placement = sparse.csr_matrix(
+        (np.ones(len(rated_ids), dtype=np.float32), (positions, np.arange(len(rated_ids)))),
+        shape=(len(movie_ids), len(rated_ids)),
+    )
+    return (placement @ matrix).tocsr()
+
+
+def build_store(top_k=None, content_weight=None, workers=None):
+    """
+    Precompute the top-K most similar movies of every stored movie and
+    publish them to all processes.
+
+    A movie's vector concatenates its content vector and its collaborative
+    (rating) vector, scaled so that the dot product of two movies is
+    content_weight * content similarity + (1 - content_weight) * rating
+    similarity. Neighbors are found with the sharded similarity engine.
+
+    Returns the number of movies in the store.
+    """
+    import numpy as np
+    from scipy import sparse
+    from .similarity import LocalRunner, top_k_similarities
+    top_k = top_k or settings.SIMILAR_MOVIES_TOP_K
+    if content_weight is None:
+        content_weight = settings.SIMILAR_MOVIES_CONTENT_WEIGHT
+
+    # Each row is a TMDb-shaped result, with the TMDb ID as 'id'
+    movies = list(Movie.objects.order_by('id').values_list('id', 'genre_mask', 'tmdb_id', *RESULT_FIELDS[1:]))
+    if not movies:
+        return 0
+    movie_ids = np.array([movie[0] for movie in movies], dtype=np.int64)
+    rows = [movie[2:] for movie in movies]
+    overviews = [row[RESULT_FIELDS.index('overview')] or '' for row in rows]
+
+    vectors = sparse.hstack([
+        np.sqrt(content_weight) * content_vectors([movie[1] for movie in movies], overviews),
+        np.sqrt(1 - content_weight) * collaborative_vectors(movie_ids),
+    ]).tocsr().astype(np.float32)
+    neighbors, _ = top_k_similarities(vectors, top_k, LocalRunner(workers))
+
+    store = {
+        'version': uuid.uuid4().hex,
+        'built_at': time.time(),
+        'neighbors': neighbors.astype(np.int32),
+        'rows': rows,
+    }
+    # The version is written last, so readers never see it before the store
+    cache.set(STORE_KEY, store, None)
+    cache.set(STORE_VERSION_KEY, store['version'], None)
+    return len(movies)
+
+
+def _load(store):
+    global _store
+    _store = {
+        'version': store['version'],
+        'built_at': store['built_at'],
+        'index': {row[0]: position for position, row in enumerate(store['rows'])},
+        'neighbors': [[position for position in row if position >= 0] for row in store['neighbors'].tolist()],
+        'results': [dict(zip(RESULT_FIELDS, row)) for row in store['rows']],
+    }
+
+
+def current_store():
+    """
+    This process's copy of the neighbor store, reloaded when a newer build
+    has been published.
+    """
+    global _checked_at
+    now = time.monotonic()
+    if now - _checked_at >= STORE_CHECK_INTERVAL:
+        _checked_at = now
+        version = cache.get(STORE_VERSION_KEY)
+        if version != _store['version']:
+            store = cache.get(STORE_KEY)
+            if store is not None and store['version'] == version:
+                _load(store)
+    return _store
+
+
+def similar_movies(tmdb_id, page=1):
+    """
+    Locally computed similar movies of a movie, as a TMDb-shaped payload
+    whose results carry the TMDb ID as 'id', or None if the movie is not
+    in the neighbor store.
+    """
+    store = current_store()
+    position = store['index'].get(tmdb_id)
+    if position is None:
+        return None
+
+    page = parse_page(page)
+    neighbors = store['neighbors'][position]
+    offset = (page - 1) * PAGE_SIZE
+    results = store['results']
+    return {
+        'page': page,
+        'results': [results[neighbor] for neighbor in neighbors[offset:offset + PAGE_SIZE]],
+        'total_pages': -(-len(neighbors) // PAGE_SIZE),
+        'total_results': len(neighbors),
+        'source': 'local',
+    }
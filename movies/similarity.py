@@ -0,0 +1,243 @@
+# movies/similarity.py
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np # type: ignore
+from scipy import sparse # type: ignore
+
+# This module stays free of Django imports, so worker processes can run it
+# whatever the multiprocessing start method.
+
+# Rows of the matrix handled per shard
+DEFAULT_BLOCK_ROWS = 512
+# Columns scored at once inside a shard; bounds a worker's memory to
+# block_rows x COLUMN_BLOCK_SIZE dense scores
+COLUMN_BLOCK_SIZE = 8192
+
+
+def normalize_rows(matrix, center=True):
+    """
+    Prepare a sparse ratings matrix for cosine similarity: subtract each
+    row's mean rating from its stored ratings (so that similarity measures
+    agreement, like a Pearson correlation) and scale rows to unit length.
+
+    Returns a float32 CSR matrix; the dot product of two rows is their similarity.
+    """
+    matrix = sparse.csr_matrix(matrix, dtype=np.float32, copy=True)
+    counts = np.diff(matrix.indptr)
+    if center:
+        sums = np.asarray(matrix.sum(axis=1)).ravel()
+        matrix.data -= np.repeat(sums / np.maximum(counts, 1), counts).astype(np.float32)
+
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1
+    matrix.data /= np.repeat(norms, counts).astype(np.float32)
+    matrix.eliminate_zeros()
+    return matrix
+
+
+def plan_shards(n_rows, block_rows=DEFAULT_BLOCK_ROWS, column_shards=1):
+    """
+    Split the n_rows x n_rows similarity computation into shards, as
+    (row_start, row_stop, column_start, column_stop) tuples. Each shard
+    scores one block of rows against one range of columns; with several
+    column shards a row's neighbors are found by merging the top-K of
+    every shard covering it.
+    """
+    bounds = np.linspace(0, n_rows, column_shards + 1).astype(int).tolist()
+    return [
+        (row_start, min(row_start + block_rows, n_rows), column_start, column_stop)
+        for row_start in range(0, n_rows, block_rows)
+        for column_start, column_stop in zip(bounds, bounds[1:])
+        if column_stop > column_start
+    ]
+
+
+def top_k_rows(ids, scores, k):
+    """
+    Keep the k best (id, score) pairs of each row of two aligned 2-D arrays,
+    best first with ties going to the lower id.
+    """
+    if scores.shape[1] > k:
+        best = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top_ids = np.take_along_axis(ids, best, axis=1)
+        top_scores = np.take_along_axis(scores, best, axis=1)
+
+        # argpartition breaks ties at the k-th score arbitrarily; redo the
+        # rows where a tied pair was left out
+        kth = top_scores.min(axis=1, keepdims=True)
+        tied = (scores == kth).sum(axis=1) > (top_scores == kth).sum(axis=1)
+        for row in np.flatnonzero(tied & np.isfinite(kth[:, 0])):
+            candidates = np.flatnonzero(scores[row] >= kth[row])
+            keep = candidates[np.lexsort((ids[row, candidates], -scores[row, candidates]))[:k]]
+            top_ids[row], top_scores[row] = ids[row, keep], scores[row, keep]
+        ids, scores = top_ids, top_scores
+
+    order = np.lexsort((ids, -scores), axis=1)
+    return np.take_along_axis(ids, order, axis=1), np.take_along_axis(scores, order, axis=1)
+
+
+def shard_top_k(matrix, shard, k):
+    """
+    Compute one shard: the k most similar columns of each row in the row
+    block, among the shard's columns.
+
+    Args:
+        matrix: Row-normalized CSR matrix (see normalize_rows)
+        shard: (row_start, row_stop, column_start, column_stop)
+        k: Neighbors kept per row
+
+    Returns:
+        (rows, neighbors, scores): the shard's row indices, and per row the
+        column indices and similarities of its neighbors, best first. Only
+        positive similarities are kept; missing neighbors are -1 with a
+        score of -inf.
+    """
+    row_start, row_stop, column_start, column_stop = shard
+    rows = np.arange(row_start, row_stop)
+    block = matrix[row_start:row_stop]
+
+    neighbors = np.empty((len(rows), 0), dtype=np.int64)
+    scores = np.empty((len(rows), 0), dtype=np.float32)
+    for start in range(column_start, column_stop, COLUMN_BLOCK_SIZE):
+        stop = min(start + COLUMN_BLOCK_SIZE, column_stop)
+        block_scores = (block @ matrix[start:stop].T).toarray()
+        block_scores[block_scores <= 0] = -np.inf
+
+        # A row is not its own neighbor
+        own = rows[(rows >= start) & (rows < stop)]
+        block_scores[own - row_start, own - start] = -np.inf
+
+        columns = np.broadcast_to(np.arange(start, stop, dtype=np.int64), block_scores.shape)
+        neighbors, scores = top_k_rows(
+            np.hstack([neighbors, columns]), np.hstack([scores, block_scores]), k
+        )
+
+    neighbors[~np.isfinite(scores)] = -1
+    return rows, neighbors, scores
+
+
+def merge_shard_results(n_rows, k, results):
+    """
+    Merge per-shard top-K results, in any order, into (n_rows, k) arrays
+    of neighbor indices and similarities.
+    """
+    neighbors = np.full((n_rows, k), -1, dtype=np.int64)
+    scores = np.full((n_rows, k), -np.inf, dtype=np.float32)
+    for rows, shard_neighbors, shard_scores in results:
+        merged_neighbors, merged_scores = top_k_rows(
+            np.hstack([neighbors[rows], shard_neighbors]),
+            np.hstack([scores[rows], shard_scores]),
+            k,
+        )
+        neighbors[rows], scores[rows] = merged_neighbors[:, :k], merged_scores[:, :k]
+    neighbors[~np.isfinite(scores)] = -1
+    return neighbors, scores
+
+
+class SharedMatrix:
+    """
+    A CSR matrix copied once into shared memory, so that worker processes
+    attach to it by name instead of each receiving a pickled copy.
+    """
+
+    def __init__(self, matrix):
+        self.shape = matrix.shape
+        self._segments = []
+        self.spec = (self.shape, [
+            self._share(matrix.data),
+            self._share(matrix.indices),
+            self._share(matrix.indptr),
+        ])
+
+    def _share(self, array):
+        segment = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        np.ndarray(array.shape, dtype=array.dtype, buffer=segment.buf)[:] = array
+        self._segments.append(segment)
+        return segment.name, array.dtype.str, array.shape
+
+    @staticmethod
+    def attach(spec):
+        """
+        Open a shared matrix from its spec in another process. Returns the
+        matrix and the segments, which must stay referenced while it is used.
+        """
+        shape, arrays = spec
+        segments, views = [], []
+        for name, dtype, array_shape in arrays:
+            segment = shared_memory.SharedMemory(name=name)
+            segments.append(segment)
+            views.append(np.ndarray(array_shape, dtype=dtype, buffer=segment.buf))
+        return sparse.csr_matrix(tuple(views), shape=shape, copy=False), segments
+
+    def close(self):
+        for segment in self._segments:
+            segment.close()
+            segment.unlink()
+        self._segments = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+# Matrix attached by each worker process of LocalRunner
+_worker_matrix = None
+_worker_segments = None
+
+
+def _attach_worker(spec):
+    global _worker_matrix, _worker_segments
+    _worker_matrix, _worker_segments = SharedMatrix.attach(spec)
+
+
+def _run_shard(shard, k):
+    return shard_top_k(_worker_matrix, shard, k)
+
+
+class LocalRunner:
+    """
+    Run shards in a pool of worker processes on this machine, sharing the
+    matrix through shared memory. With one worker, shards run in-process.
+
+    Runners only need a run(matrix, shards, k) method yielding shard_top_k
+    results in any order, so shards can later be dispatched to other nodes
+    (e.g. as Celery tasks) behind the same interface.
+    """
+
+    def __init__(self, workers=None):
+        self.workers = workers or os.cpu_count() or 1
+
+    def run(self, matrix, shards, k):
+        if self.workers == 1:
+            for shard in shards:
+                yield shard_top_k(matrix, shard, k)
+            return
+
+        with SharedMatrix(matrix) as shared, ProcessPoolExecutor(
+            max_workers=self.workers, initializer=_attach_worker, initargs=(shared.spec,)
+        ) as executor:
+            # Sparse products are single-threaded, so one shard per process keeps every core busy
+            yield from executor.map(_run_shard, shards, [k] * len(shards))
+
+
+def top_k_similarities(matrix, k=20, runner=None, block_rows=DEFAULT_BLOCK_ROWS, column_shards=1):
+    """
+    The k most similar rows of every row of a row-normalized matrix.
+
+    Args:
+        matrix: CSR matrix from normalize_rows, e.g. movies x users ratings
+        k: Neighbors kept per row
+        runner: Shard runner (a LocalRunner using every core by default)
+        block_rows: Rows per shard
+        column_shards: Column ranges each row block is split into
+
+    Returns:
+        (neighbors, scores) arrays of shape (n_rows, k), best first; see shard_top_k
+    """
+    runner = runner or LocalRunner()
+    shards = plan_shards(matrix.shape[0], block_rows, column_shards)
+    return merge_shard_results(matrix.shape[0], k, runner.run(matrix, shards, k))
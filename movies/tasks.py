@@ -0,0 +1,42 @@
+from celery import shared_task
+from celery.signals import worker_ready
+from .cache_warmer import warm_cache
+from . import similar_movies, trending
+
+
+@shared_task
+def warm_tmdb_cache():
+    """
+    Pre-fetch trending pages and the details/recommendations of the movies
+    they contain. Scheduled by CELERY_BEAT_SCHEDULE ahead of the cache TTLs.
+    """
+    return warm_cache()
+
+
+@shared_task
+def build_similar_movies():
+    """
+    Rebuild the local similar-movies neighbor store from the current catalog
+    and ratings. Runs in-process: Celery's pool processes cannot start
+    worker processes of their own.
+    """
+    return similar_movies.build_store(workers=1)
+
+
+@shared_task
+def rebuild_local_trending():
+    """
+    Re-derive each local trending window from the activity counts it
+    spans, dropping movies that fell out of the window or the top and
+    re-basing the decayed scores on the current time.
+    """
+    return trending.trending.rebuild()
+
+
+@worker_ready.connect
+def warm_tmdb_cache_on_startup(sender, **kwargs):
+    """
+    Warm the cache as soon as a worker comes up, so a deploy or a Redis
+    flush does not leave the first users with cold-cache latency.
+    """
+    warm_tmdb_cache.delay()
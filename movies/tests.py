@@ -1,10 +1,10 @@
-from django.test import TestCase
+from django.test import TestCase, TransactionTestCase
 from django.urls import reverse
 from django.contrib.auth.models import User
 from rest_framework.test import APIClient
 from rest_framework import status
 from unittest.mock import patch, MagicMock
-from .models import Movie, UserProfile
+from .models import Movie, FavoriteMovie
 
 class UserRegistrationTests(TestCase):
     def setUp(self):
@@ -20,7 +20,7 @@ class UserRegistrationTests(TestCase):
         response = self.client.post(self.register_url, self.user_data, format='json')
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
         self.assertEqual(User.objects.count(), 1)
-        self.assertEqual(UserProfile.objects.count(), 1)
+        self.assertTrue(User.objects.get(username='testuser').check_password('testpass123'))
 
 class MovieAPITests(TestCase):
     def setUp(self):
@@ -81,9 +81,6 @@ class FavoriteMovieTests(TestCase):
             email='test@example.com',
             password='testpass123'
         )
-        # Ensure UserProfile is created manually
-        self.profile = UserProfile.objects.create(user=self.user)
-        
         self.client.force_authenticate(user=self.user)
             
         # Create a test movie
@@ -94,35 +91,1556 @@ class FavoriteMovieTests(TestCase):
             release_date='1999-10-15',
             vote_average=8.4
         )
-        
-        self.profile = UserProfile.objects.get(user=self.user)
-
-    @patch('movies.tmdb_api.get_trending_movies')
 
+    @patch('movies.tmdb_api.get_movie_details')
     def test_add_favorite_movie(self, mock_get_details):
-        # Mock the API response
-        mock_get_details.return_value = {
-            'id': 550,
-            'title': 'Fight Club',
-            'overview': 'An insomniac office worker...',
-            'release_date': '1999-10-15',
-            'vote_average': 8.4
-        }
-        
         url = reverse('favorite-movie', kwargs={'movie_id': 550})
         response = self.client.post(url)
         
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(FavoriteMovie.objects.filter(user=self.user).count(), 1)
+        self.assertEqual(FavoriteMovie.objects.get(user=self.user).movie, self.movie)
+        # The movie is already stored locally, so TMDb is not asked for it
+        mock_get_details.assert_not_called()
+
+        response = self.client.post(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(self.profile.favorite_movies.count(), 1)
-        self.assertEqual(self.profile.favorite_movies.first(), self.movie)
+        self.assertEqual(FavoriteMovie.objects.filter(user=self.user).count(), 1)
 
     def test_remove_favorite_movie(self):
         # Add movie to favorites first
-        self.profile.favorite_movies.add(self.movie)
-        self.assertEqual(self.profile.favorite_movies.count(), 1)
+        FavoriteMovie.objects.create(user=self.user, movie=self.movie)
         
         url = reverse('favorite-movie', kwargs={'movie_id': 550})
         response = self.client.delete(url)
         
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(self.profile.favorite_movies.count(), 0)
\ No newline at end of file
+        self.assertFalse(FavoriteMovie.objects.filter(user=self.user).exists())
+
+        response = self.client.delete(url)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+class CacheWarmerTests(TestCase):
+    @patch('movies.tmdb_api.get_movie_recommendations')
+    @patch('movies.tmdb_api.get_movie_details')
+    @patch('movies.tmdb_api.get_trending_movies')
+    def test_warms_trending_pages_and_their_movies(self, mock_trending, mock_details, mock_recs):
+        from .cache_warmer import warm_cache
+        mock_trending.return_value = {'results': [{'id': 550}, {'id': 680}]}
+        mock_details.return_value = {'id': 550}
+        mock_recs.return_value = {'results': []}
+
+        report = warm_cache(pages=2, max_workers=2, max_calls=100, calls_per_second=1000)
+
+        # 2 windows x 2 pages, then details + recommendations for 2 unique movies
+        self.assertEqual(mock_trending.call_count, 4)
+        self.assertEqual(mock_details.call_count, 2)
+        self.assertEqual(report['keys_warmed'], 8)
+        self.assertEqual(report['upstream_calls'], 8)
+
+    @patch('movies.tmdb_api.get_trending_movies')
+    def test_stops_at_rate_budget(self, mock_trending):
+        from .cache_warmer import warm_cache
+        mock_trending.return_value = {'results': []}
+
+        report = warm_cache(pages=3, max_calls=2, calls_per_second=1000)
+
+        self.assertEqual(mock_trending.call_count, 2)
+        self.assertEqual(report['keys_skipped'], 4)
+
+
+class MovieDetailsBatchTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.client.force_authenticate(user=self.user)
+
+    @patch('movies.tmdb_api._fetch_movie_details')
+    def test_batch_details_uses_cache_and_keeps_request_order(self, mock_fetch):
+        from django.core.cache import cache, caches
+        from . import tmdb_api
+        cache.clear()
+        caches['local'].clear()
+        cache.set(tmdb_api.details_cache_key(550), {'id': 550, 'title': 'Fight Club'})
+        mock_fetch.side_effect = lambda movie_id: (
+            {'error': 'Not Found'} if movie_id == 1 else {'id': movie_id, 'title': 'Dune'}
+        )
+
+        response = self.client.get(f"{reverse('movie-details-batch')}?ids=680,550,1")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([r['id'] for r in response.data['results']], [680, 550, 1])
+        self.assertEqual(response.data['results'][1]['data']['title'], 'Fight Club')
+        self.assertEqual(response.data['results'][2]['error'], 'Not Found')
+        self.assertEqual(sorted(call.args[0] for call in mock_fetch.call_args_list), [1, 680])
+        # Successful misses are written back, failures are not
+        self.assertIsNotNone(cache.get(tmdb_api.details_cache_key(680)))
+        self.assertIsNone(cache.get(tmdb_api.details_cache_key(1)))
+
+    def test_batch_details_rejects_too_many_ids(self):
+        ids = ','.join(str(i) for i in range(101))
+        response = self.client.get(f"{reverse('movie-details-batch')}?ids={ids}")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class MovieResolverTests(TestCase):
+    def setUp(self):
+        from django.core.cache import caches
+        caches['local'].clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.client.force_authenticate(user=self.user)
+        self.movie = Movie.objects.create(
+            tmdb_id=550,
+            title='Fight Club',
+            overview='An insomniac office worker...',
+            release_date='1999-10-15',
+            vote_average=8.4
+        )
+
+    @patch('movies.tmdb_api.get_movie_details_many')
+    def test_favorite_of_local_movie_skips_tmdb(self, mock_details):
+        url = reverse('favorite-movie', kwargs={'movie_id': 550})
+        response = self.client.post(url)
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        mock_details.assert_not_called()
+
+    @patch('movies.tmdb_api.get_movie_details_many')
+    def test_unknown_movie_is_fetched_once_and_stored(self, mock_details):
+        from .resolver import resolve_movie
+        mock_details.return_value = {680: {
+            'id': 680, 'title': 'Pulp Fiction', 'overview': '...', 'release_date': '1994-09-10'
+        }}
+
+        movie = resolve_movie(680)
+        self.assertEqual(movie.title, 'Pulp Fiction')
+        self.assertTrue(Movie.objects.filter(tmdb_id=680).exists())
+
+        # Second lookup is answered in-process, without the database
+        with self.assertNumQueries(0):
+            self.assertEqual(resolve_movie(680).pk, movie.pk)
+        mock_details.assert_called_once_with([680])
+
+    @patch('movies.resolver.ROWS_GENERATION_CHECK_INTERVAL', 0)
+    def test_rows_changed_by_another_worker_are_reloaded(self):
+        from django.core.cache import cache
+        from . import resolver
+        resolver.hydrate_movies([self.movie.id])
+        with self.assertNumQueries(0):
+            resolver.hydrate_movies([self.movie.id])
+
+        # Another worker saved the movie; here only the shared generation moves
+        Movie.objects.filter(pk=self.movie.pk).update(title='Fight Club (1999)')
+        cache.set(resolver.ROWS_GENERATION_KEY, 'another', None)
+        self.assertEqual(resolver.hydrate_movies([self.movie.id])[0]['title'], 'Fight Club (1999)')
+
+    @patch('movies.tmdb_api.get_movie_details_many')
+    def test_details_of_a_stored_movie_are_not_inserted_again(self, mock_details):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from .resolver import resolve_movie_details
+        mock_details.return_value = {550: {'id': 550, 'title': 'Fight Club', 'vote_average': 8.4}}
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(resolve_movie_details(550)['title'], 'Fight Club')
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('INSERT', queries[0]['sql'])
+
+
+class TMDbRateLimiterTests(TestCase):
+    def make_limiter(self):
+        from django.test import override_settings
+        from .rate_limiter import TokenBucketLimiter
+        with override_settings(TMDB_RATE_LIMIT=1, TMDB_RATE_BURST=3, TMDB_RATE_MAX_WAIT=0,
+                               TMDB_RATE_BACKGROUND_RESERVE=2, TMDB_RATE_BACKGROUND_MAX_WAIT=0):
+            return TokenBucketLimiter(key='test_tmdb_rate_limit')
+
+    def test_background_lane_leaves_reserve_for_interactive(self):
+        from .rate_limiter import BACKGROUND, INTERACTIVE, RateLimitExceeded
+        limiter = self.make_limiter()
+
+        limiter.acquire(BACKGROUND)
+        with self.assertRaises(RateLimitExceeded):
+            limiter.acquire(BACKGROUND)
+
+        # The reserved tokens are still available to user-facing calls
+        limiter.acquire(INTERACTIVE)
+        limiter.acquire(INTERACTIVE)
+        with self.assertRaises(RateLimitExceeded):
+            limiter.acquire(INTERACTIVE)
+
+    @patch('movies.rate_limiter.limiter.acquire')
+    @patch('movies.tmdb_api.requests.get')
+    def test_exhausted_budget_is_reported_as_error(self, mock_get, mock_acquire):
+        from . import tmdb_api
+        from .rate_limiter import RateLimitExceeded
+        mock_acquire.side_effect = RateLimitExceeded("TMDb rate limit exceeded")
+
+        data = tmdb_api.get_trending_movies('day', 99)
+
+        self.assertEqual(data['error'], "TMDb rate limit exceeded")
+        mock_get.assert_not_called()
+
+
+class LocalSearchTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.client.force_authenticate(user=self.user)
+        for tmdb_id in range(1, 7):
+            Movie.objects.create(tmdb_id=tmdb_id, title=f'The Matrix {tmdb_id}', overview='...')
+
+    def test_normalize_query(self):
+        from .search import normalize_query
+        self.assertEqual(normalize_query('  Matrix \t Reloaded '), 'matrix reloaded')
+        self.assertEqual(normalize_query('Matrix'), normalize_query('matrix '))
+
+    @patch('movies.tmdb_api.search_movies')
+    def test_enough_local_matches_skip_tmdb(self, mock_search):
+        url = f"{reverse('search-movies')}?query=MATRIX%20"
+        response = self.client.get(url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['source'], 'local')
+        self.assertEqual(response.data['total_results'], 6)
+        self.assertEqual(set(r['id'] for r in response.data['results']), set(range(1, 7)))
+        mock_search.assert_not_called()
+
+    @patch('movies.tmdb_api.search_movies')
+    def test_too_few_local_matches_fall_back_to_tmdb(self, mock_search):
+        mock_search.return_value = {'results': [{'id': 603, 'title': 'Inception', 'overview': '...'}]}
+
+        response = self.client.get(f"{reverse('search-movies')}?query=Inception")
+
+        self.assertEqual(len(response.data['results']), 1)
+        mock_search.assert_called_once_with('inception', 1)
+        # TMDb results feed the local index
+        self.assertTrue(Movie.objects.filter(tmdb_id=603).exists())
+
+
+class RatingStoreTests(TestCase):
+    def setUp(self):
+        from .models import Rating
+        self.users = [User.objects.create_user(username=f'user{i}') for i in range(3)]
+        self.movies = [Movie.objects.create(tmdb_id=i, title=f'Movie {i}', overview='...') for i in range(3)]
+        Rating.objects.upsert_many([
+            (user.id, movie.id, 3.0) for user in self.users for movie in self.movies
+        ])
+
+    def test_upsert_overwrites_existing_rating(self):
+        from .models import Rating
+        Rating.objects.upsert(self.users[0].id, self.movies[0].id, 5.0)
+
+        ratings = Rating.objects.filter(user=self.users[0], movie=self.movies[0])
+        self.assertEqual(ratings.count(), 1)
+        self.assertEqual(ratings.get().rating, 5.0)
+
+    def test_duplicate_rating_is_rejected(self):
+        from django.db import IntegrityError, transaction
+        from .models import Rating
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Rating.objects.create(user=self.users[0], movie=self.movies[0], rating=1.0)
+
+    def assertUsesIndex(self, queryset, index_name):
+        from django.db import connection
+        if connection.vendor != 'postgresql':
+            # SQLite names unique-constraint indexes itself; just rule out a full scan
+            self.assertRegex(queryset.explain(), r'SEARCH movies_rating USING (COVERING )?INDEX')
+            return
+        with connection.cursor() as cursor:
+            # Tiny test tables would otherwise always be sequentially scanned
+            cursor.execute('SET LOCAL enable_seqscan = off')
+        self.assertIn(index_name, queryset.explain())
+
+    def test_recommender_lookups_use_composite_indexes(self):
+        from .models import Rating
+        user_ratings = Rating.objects.filter(user_id=self.users[0].id, rating__gte=4)
+        self.assertUsesIndex(user_ratings.values_list('movie_id', 'rating'), 'movies_rating_user_movie_uniq')
+
+        movie_ratings = Rating.objects.filter(movie_id=self.movies[0].id)
+        self.assertUsesIndex(movie_ratings.values_list('user_id', 'rating'), 'movies_rating_movie_user_idx')
+
+
+class RatingIngestionTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.client.force_authenticate(user=self.user)
+        self.movie = Movie.objects.create(tmdb_id=550, title='Fight Club', overview='...')
+
+    @patch('movies.signals.recommendation.invalidate_rating_state')
+    @patch('movies.tmdb_api.get_movie_details_many')
+    def test_batch_ratings_upsert_once_per_batch(self, mock_details, mock_invalidate):
+        from .models import Rating
+        mock_details.return_value = {1: {'error': 'Not Found'}}
+        payload = {'ratings': [
+            {'movie_id': 550, 'rating': 3.0},
+            {'movie_id': 550, 'rating': 4.5},
+            {'movie_id': 1, 'rating': 2.0},
+        ]}
+
+        response = self.client.post(reverse('rating-batch'), payload, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {'count': 1, 'missing': [1]})
+        self.assertEqual(Rating.objects.get(user=self.user, movie=self.movie).rating, 4.5)
+        mock_invalidate.assert_called_once_with()
+
+    def test_lost_ratings_version_is_never_reused(self):
+        from django.core.cache import cache
+        from .recommendation import RATINGS_VERSION_KEY, invalidate_rating_state, ratings_version
+        seen = {ratings_version()}
+        invalidate_rating_state()
+        seen.add(ratings_version())
+        cache.delete(RATINGS_VERSION_KEY)
+        invalidate_rating_state()
+        self.assertNotIn(ratings_version(), seen)
+        self.assertEqual(len(seen), 2)
+
+    def test_batch_ratings_validates_scale(self):
+        payload = {'ratings': [{'movie_id': 550, 'rating': 7}]}
+        response = self.client.post(reverse('rating-batch'), payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_import_movielens_csv(self):
+        import os
+        import tempfile
+        import unittest
+        from django.core.management import call_command
+        from django.db import connection
+        from .models import Rating
+        if connection.vendor != 'postgresql':
+            raise unittest.SkipTest("COPY import requires PostgreSQL")
+
+        files = {
+            'ratings.csv': "userId,movieId,rating,timestamp\n1,1,4.0,964982703\n1,2,5.0,964982224\n2,1,3.5,964982931\n2,3,1.0,964982931\n",
+            'links.csv': "movieId,imdbId,tmdbId\n1,0114709,862\n2,0113497,550\n3,0113228,\n",
+            'movies.csv': 'movieId,title,genres\n1,Toy Story (1995),Adventure|Animation\n2,"Fight Club (1999)",Drama\n3,Grumpier Old Men (1995),Comedy\n',
+        }
+        with tempfile.TemporaryDirectory() as directory:
+            for name, content in files.items():
+                with open(os.path.join(directory, name), 'w') as csv_file:
+                    csv_file.write(content)
+            call_command(
+                'import_movielens', os.path.join(directory, 'ratings.csv'),
+                links=os.path.join(directory, 'links.csv'),
+                movies=os.path.join(directory, 'movies.csv'),
+                stdout=open(os.devnull, 'w'),
+            )
+
+        # Movie 3 has no TMDb link, so its rating is skipped
+        self.assertEqual(Rating.objects.count(), 3)
+        self.assertEqual(Rating.objects.get(user__username='ml_1', movie__tmdb_id=550).rating, 5.0)
+        self.assertEqual(
+            list(Movie.objects.get(tmdb_id=862).genres.values_list('name', flat=True).order_by('name')),
+            ['Adventure', 'Animation']
+        )
+
+
+class FastSerializationTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.client.force_authenticate(user=self.user)
+        Movie.objects.create(tmdb_id=550, title='Fight Club', overview='Mischief. Mayhem.',
+                             release_date='1999-10-15', vote_average=8.4)
+        Movie.objects.create(tmdb_id=680, title='Pulp Fiction', overview='', poster_path='/p.jpg')
+
+    def test_movie_values_match_serializer(self):
+        from .serializers import MovieSerializer, movie_dicts, movie_values
+        movies = Movie.objects.order_by('id')
+        expected = MovieSerializer(movies, many=True).data
+        self.assertEqual(movie_values(movies), expected)
+        self.assertEqual(movie_dicts(list(movies)), expected)
+        self.assertEqual(list(movie_values(movies)[0]), MovieSerializer.Meta.fields)
+
+    def test_orjson_renderer_matches_json_renderer(self):
+        import datetime
+        import decimal
+        from rest_framework.renderers import JSONRenderer
+        from .renderers import ORJSONRenderer
+        data = {
+            'floats': [0.0, -0.0, 0.1, 8.4, 1e-05, 2.5e-07, 0.0001, 1e16, 1.5e15, 1.2345678901234568e+17],
+            'strings': ['', 'café', '  ', '\x00\x1f"\\/', 'Se7en 1e16 0.00001'],
+            'ints': [0, -1, 2 ** 63 - 1],
+            1: None,
+            'when': datetime.datetime(2024, 1, 2, 3, 4, 5, 678901, tzinfo=datetime.timezone.utc),
+            'day': datetime.date(2024, 1, 2),
+            'price': decimal.Decimal('1.10'),
+            'nested': [{'a': True, 'b': False}],
+        }
+        self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data))
+        self.assertEqual(ORJSONRenderer().render({'big': 2 ** 70}), JSONRenderer().render({'big': 2 ** 70}))
+        self.assertEqual(
+            ORJSONRenderer().render(data, 'application/json; indent=2'),
+            JSONRenderer().render(data, 'application/json; indent=2')
+        )
+
+    def test_orjson_renderer_rewrites_whole_numbers_only(self):
+        from rest_framework.renderers import JSONRenderer
+        from .renderers import ORJSONRenderer
+        data = {
+            'x': 10.00001,
+            'values': [20.00003, -3.00002, 100.000012, 1e16, {'small': -2e-05, 'list': [1e-05, 7.00004]}],
+            'scalars': [{'v': 1e16}, [[-3.00002]]],
+        }
+        for value in (data, [data], 10.00001, 1e16):
+            self.assertEqual(ORJSONRenderer().render(value), JSONRenderer().render(value))
+
+    def test_movie_list_output_unchanged(self):
+        from rest_framework.renderers import JSONRenderer
+        from .serializers import MovieSerializer
+        response = self.client.get(reverse('movie-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            response.content,
+            JSONRenderer().render({
+                'next': None, 'previous': None,
+                'results': MovieSerializer(Movie.objects.order_by('id'), many=True).data
+            })
+        )
+
+
+class RecommendationHydrationTests(TestCase):
+    def setUp(self):
+        from django.core.cache import caches
+        from .models import Genre, Rating
+        caches['local'].clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.client.force_authenticate(user=self.user)
+        drama, comedy = Genre.objects.create(name='Drama'), Genre.objects.create(name='Comedy')
+        self.movies = []
+        for i in range(6):
+            movie = Movie.objects.create(tmdb_id=100 + i, title=f'Movie {i}', overview='')
+            movie.genres.add(drama if i % 2 == 0 else comedy)
+            self.movies.append(movie)
+        # The user likes dramas; two other users agree with them on two movies
+        Rating.objects.create(user=self.user, movie=self.movies[0], rating=5)
+        Rating.objects.create(user=self.user, movie=self.movies[1], rating=1)
+        for name in ('other1', 'other2'):
+            other = User.objects.create_user(username=name, password='testpass123')
+            Rating.objects.create(user=other, movie=self.movies[0], rating=4.5)
+            Rating.objects.create(user=other, movie=self.movies[1], rating=2)
+            Rating.objects.create(user=other, movie=self.movies[3], rating=5)
+
+    def test_recommendations_are_movie_ids(self):
+        from .recommendation import MovieRecommender
+        recommender = MovieRecommender()
+        self.assertEqual(
+            recommender.content_based_recommendations(self.user.id, 2),
+            [self.movies[2].id, self.movies[4].id]
+        )
+        self.assertEqual(
+            recommender.collaborative_filtering_recommendations(self.user.id, 2),
+            [self.movies[3].id, self.movies[2].id]
+        )
+        recommendations = recommender.get_recommendations(self.user.id, 3)
+        self.assertEqual(recommendations[0], self.movies[2].id)
+        self.assertTrue(all(isinstance(movie_id, int) for movie_id in recommendations))
+
+    def test_popular_movies_fallback(self):
+        from .models import Rating
+        from .recommendation import MovieRecommender
+        for i in range(5):
+            rater = User.objects.create_user(username=f'rater{i}', password='testpass123')
+            Rating.objects.create(user=rater, movie=self.movies[5], rating=4)
+        newcomer = User.objects.create_user(username='newcomer', password='testpass123')
+        self.assertEqual(
+            MovieRecommender().get_recommendations(newcomer.id, 3), [self.movies[5].id]
+        )
+
+    def test_query_count_does_not_grow_with_catalog(self):
+        from .recommendation import MovieRecommender
+        with self.assertNumQueries(7):
+            MovieRecommender().get_recommendations(self.user.id, 3)
+        for i in range(50):
+            Movie.objects.create(tmdb_id=1000 + i, title=f'Extra {i}', overview='')
+        with self.assertNumQueries(7):
+            MovieRecommender().get_recommendations(self.user.id, 3)
+
+    def test_only_top_movies_are_hydrated_and_cached(self):
+        from .resolver import hydrate_movies
+        ids = [self.movies[3].id, self.movies[2].id, 999999]
+        with self.assertNumQueries(1):
+            rows = hydrate_movies(ids)
+        self.assertEqual([row['tmdb_id'] for row in rows], [103, 102])
+        with self.assertNumQueries(0):
+            self.assertEqual(hydrate_movies(ids[:2]), rows)
+
+        # Saving or deleting a movie drops its cached row
+        self.movies[3].title = 'Renamed'
+        self.movies[3].save()
+        self.assertEqual(hydrate_movies(ids[:1])[0]['title'], 'Renamed')
+        self.movies[3].delete()
+        self.assertEqual(hydrate_movies(ids[:1]), [])
+
+    def test_recommendation_view_returns_serialized_rows(self):
+        from .serializers import MovieSerializer
+        response = self.client.get(reverse('movie-recommendations'), {'count': 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 2)
+        self.assertEqual(
+            response.data['recommendations'][0],
+            MovieSerializer(self.movies[2]).data
+        )
+
+
+class MovieListPaginationTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.client.force_authenticate(user=self.user)
+        for i in range(5):
+            Movie.objects.create(tmdb_id=100 + i, title=f'Movie {i}', overview='Long text')
+
+    def test_cursor_pagination_walks_the_catalog(self):
+        url, seen = reverse('movie-list') + '?page_size=2', []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            seen += [movie['tmdb_id'] for movie in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(seen, [100, 101, 102, 103, 104])
+
+    def test_fields_projection(self):
+        from .serializers import MovieSerializer
+        response = self.client.get(reverse('movie-list'), {'fields': 'title,id'})
+        self.assertEqual(response.data['results'][0], {'id': Movie.objects.order_by('id')[0].id, 'title': 'Movie 0'})
+        response = self.client.get(reverse('movie-list'), {'fields': 'title,tmdb_id'})
+        self.assertEqual(response.data['results'][0], {'tmdb_id': 100, 'title': 'Movie 0'})
+        response = self.client.get(reverse('movie-list'))
+        self.assertEqual(response.data['results'], MovieSerializer(Movie.objects.order_by('id'), many=True).data)
+        
+        movie = Movie.objects.get(tmdb_id=100)
+        with self.assertNumQueries(1):
+            # .only() keeps overview out of the detail query
+            response = self.client.get(reverse('movie-detail', args=[movie.id]), {'fields': 'tmdb_id'})
+        self.assertEqual(response.data, {'tmdb_id': 100})
+        
+        response = self.client.get(reverse('movie-list'), {'fields': 'title,password'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_conditional_get(self):
+        url = reverse('movie-list') + '?page_size=2'
+        response = self.client.get(url)
+        etag = response['ETag']
+        # Pages are validated by ETag only; a Last-Modified would miss deletions
+        self.assertNotIn('Last-Modified', response)
+        
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.content, b'')
+        
+        # A change to a movie on the page changes its ETag, other pages keep theirs
+        movie = Movie.objects.order_by('id')[0]
+        detail_url = reverse('movie-detail', args=[movie.id])
+        response = self.client.get(detail_url)
+        detail_etag, last_modified = response['ETag'], response['Last-Modified']
+        self.assertEqual(
+            self.client.get(detail_url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code,
+            status.HTTP_304_NOT_MODIFIED
+        )
+        movie.title = 'Renamed'
+        movie.save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_200_OK)
+        self.assertEqual(self.client.get(detail_url, HTTP_IF_NONE_MATCH=detail_etag).status_code, status.HTTP_200_OK)
+        
+        # So does a deletion, which moves the next movie onto the page
+        etag = self.client.get(url)['ETag']
+        Movie.objects.order_by('id')[1].delete()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_200_OK)
+        
+        # Projections are separate representations
+        self.assertNotEqual(self.client.get(url + '&fields=id')['ETag'], self.client.get(url)['ETag'])
+
+
+class TMDbConditionalGetTests(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.client.force_authenticate(user=self.user)
+
+    @patch('movies.rate_limiter.limiter.acquire')
+    @patch('movies.tmdb_api.requests.get')
+    def test_trending_etag_is_stored_and_honoured(self, mock_get, mock_acquire):
+        from django.core.cache import cache
+        from . import tmdb_api
+        mock_get.return_value.json.return_value = {'page': 1, 'results': [{'id': 550, 'title': 'Fight Club'}]}
+        url = reverse('trending-movies') + '?time_window=day'
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Cache-Control'], f'private, max-age={tmdb_api.TRENDING_CACHE_TIMEOUT}')
+        etag = response['ETag']
+        self.assertEqual(cache.get(tmdb_api.etag_cache_key(tmdb_api.trending_cache_key('day', 1))), etag)
+
+        # The ETag is checked without reading or rehashing the payload
+        with patch('movies.tmdb_api.get_trending_movies') as mock_trending, \
+                patch('movies.views.make_etag') as mock_make_etag:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['ETag'], etag)
+        mock_trending.assert_not_called()
+        mock_make_etag.assert_not_called()
+        self.assertEqual(mock_get.call_count, 1)
+
+        # A refreshed payload gets a new ETag
+        mock_get.return_value.json.return_value = {'page': 1, 'results': []}
+        tmdb_api.get_trending_movies('day', 1, refresh=True)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+    @patch('movies.tmdb_api._fetch_movie_details')
+    def test_details_not_modified(self, mock_fetch):
+        from . import tmdb_api
+        mock_fetch.return_value = {'id': 550, 'title': 'Fight Club', 'overview': ''}
+        url = reverse('movie-details', args=[550])
+
+        etag = self.client.get(url)['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['Cache-Control'], f'private, max-age={tmdb_api.DETAILS_CACHE_TIMEOUT}')
+
+        mock_fetch.return_value = {'error': 'Not found'}
+        response = self.client.get(reverse('movie-details', args=[1]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertFalse(response.has_header('ETag'))
+
+    @patch('movies.tmdb_api._fetch_movie_details')
+    def test_details_etag_matches_the_body_served(self, mock_fetch):
+        from django.core.cache import caches
+        from . import tmdb_api
+        caches['local'].clear()
+        mock_fetch.return_value = {'id': 550, 'title': 'Fight Club', 'vote_average': 8.0}
+        url = reverse('movie-details', args=[550])
+        old = self.client.get(url)
+
+        # Another worker refreshed the payload; this one still holds the old one
+        mock_fetch.return_value = {'id': 550, 'title': 'Fight Club', 'vote_average': 8.4}
+        tmdb_api.get_movie_details(550, refresh=True)
+        # The ETag kept with this process's copy is served, not rehashed
+        with patch('movies.conditional.hashlib.md5') as mock_md5:
+            response = self.client.get(url)
+        mock_md5.assert_not_called()
+        self.assertEqual(response.data['vote_average'], 8.0)
+        self.assertEqual(response['ETag'], old['ETag'])
+        self.assertNotEqual(response['ETag'], tmdb_api.stored_etag(tmdb_api.details_cache_key(550)))
+
+    def test_local_search_results_are_conditional(self):
+        for i in range(5):
+            Movie.objects.create(tmdb_id=100 + i, title=f'Matrix {i}', overview='')
+        url = reverse('search-movies') + '?query=matrix'
+
+        response = self.client.get(url)
+        self.assertEqual(response.data['source'], 'local')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+
+class GenreMaskTests(TestCase):
+    def setUp(self):
+        from .models import Genre
+        self.drama, self.comedy, self.horror = (
+            Genre.objects.create(name=name) for name in ('Drama', 'Comedy', 'Horror')
+        )
+        self.movie = Movie.objects.create(tmdb_id=550, title='Fight Club', overview='')
+
+    def mask(self, *genres):
+        return sum(1 << genre.bit for genre in genres)
+
+    def test_genres_get_stable_distinct_bits(self):
+        from .models import Genre
+        self.assertEqual([self.drama.bit, self.comedy.bit, self.horror.bit], [0, 1, 2])
+        self.comedy.delete()
+        self.assertEqual(Genre.objects.create(name='Crime').bit, 1)
+        self.drama.name = 'Dramas'
+        self.drama.save()
+        self.assertEqual(Genre.objects.get(pk=self.drama.pk).bit, 0)
+
+    def test_concurrent_genres_retry_a_taken_bit(self):
+        from .models import Genre
+        # As if another genre had claimed bit 2 after this one read the free bits
+        with patch('movies.models.GenreQuerySet.free_bits', side_effect=[[2], [3]]):
+            self.assertEqual(Genre.objects.create(name='Crime').bit, 3)
+
+    def test_mask_follows_m2m_changes(self):
+        self.movie.genres.add(self.drama, self.horror)
+        self.assertEqual(self.movie.genre_mask, self.mask(self.drama, self.horror))
+        self.movie.genres.remove(self.horror)
+        self.assertEqual(self.movie.genre_mask, self.mask(self.drama))
+
+        # From the genre side, and through a stale instance being saved
+        self.comedy.movies.add(self.movie)
+        self.movie.title = 'Fight Club (1999)'
+        self.movie.save()
+        self.movie.refresh_from_db()
+        self.assertEqual(self.movie.genre_mask, self.mask(self.drama, self.comedy))
+
+        self.drama.movies.clear()
+        self.movie.refresh_from_db()
+        self.assertEqual(self.movie.genre_mask, self.mask(self.comedy))
+        self.comedy.delete()
+        self.movie.refresh_from_db()
+        self.assertEqual(self.movie.genre_mask, 0)
+
+    def test_backfill_command(self):
+        import io
+        from django.core.management import call_command
+        self.movie.genres.add(self.drama, self.comedy)
+        Movie.objects.update(genre_mask=0)
+        call_command('backfill_genre_masks', stdout=io.StringIO())
+        self.movie.refresh_from_db()
+        self.assertEqual(self.movie.genre_mask, self.mask(self.drama, self.comedy))
+
+
+class ReplicaRouterTests(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        from django.test import override_settings
+        from . import db_router
+        cache.clear()
+        settings_override = override_settings(DATABASE_REPLICAS=['replica_0'], REPLICA_STICKY_SECONDS=5)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        # Start each test unpinned
+        token = db_router._pinned_until.set(0.0)
+        self.addCleanup(db_router._pinned_until.reset, token)
+
+    def test_reads_go_to_replicas_until_a_write(self):
+        self.assertEqual(Movie.objects.all().db, 'replica_0')
+        self.assertEqual(User.objects.all().db, 'default')
+
+        Movie.objects.create(tmdb_id=550, title='Fight Club', overview='')
+        self.assertEqual(Movie.objects.all().db, 'default')
+
+    def test_explicit_primary_reads_and_expiring_window(self):
+        from django.test import override_settings
+        from .db_router import use_primary
+        with use_primary():
+            self.assertEqual(Movie.objects.all().db, 'default')
+        with override_settings(REPLICA_STICKY_SECONDS=0):
+            Movie.objects.create(tmdb_id=550, title='Fight Club', overview='')
+        self.assertEqual(Movie.objects.all().db, 'replica_0')
+
+    def test_writes_pin_the_client_for_its_next_requests(self):
+        from django.http import HttpResponse
+        from django.test import RequestFactory
+        from .db_router import ReplicaPinningMiddleware
+        seen = []
+
+        def write(request):
+            Movie.objects.create(tmdb_id=550, title='Fight Club', overview='')
+            return HttpResponse()
+
+        def read(request):
+            seen.append(Movie.objects.all().db)
+            return HttpResponse()
+
+        factory = RequestFactory()
+        client_a, client_b = {'HTTP_AUTHORIZATION': 'Bearer a'}, {'HTTP_AUTHORIZATION': 'Bearer b'}
+        ReplicaPinningMiddleware(read)(factory.get('/', **client_a))
+        ReplicaPinningMiddleware(write)(factory.post('/', **client_a))
+        ReplicaPinningMiddleware(read)(factory.get('/', **client_a))
+        ReplicaPinningMiddleware(read)(factory.get('/', **client_b))
+        self.assertEqual(seen, ['replica_0', 'default', 'replica_0'])
+
+    @patch('movies.tmdb_api.get_movie_details_many')
+    def test_storing_tmdb_data_does_not_pin(self, mock_details):
+        from django.core.cache import caches
+        from django.test import override_settings
+        from . import db_router
+        from .resolver import resolve_movie_details_many
+        caches['local'].clear()
+        Movie.objects.create(tmdb_id=550, title='Fight Club', overview='')
+        db_router._pinned_until.set(0.0)
+        token = db_router._wrote.set(False)
+        self.addCleanup(db_router._wrote.reset, token)
+        mock_details.return_value = {
+            550: {'id': 550, 'title': 'Fight Club'},
+            680: {'id': 680, 'title': 'Pulp Fiction'},
+        }
+
+        # The primary stands in for a replica, so that reads can run
+        with override_settings(DATABASE_REPLICAS=['default']):
+            resolve_movie_details_many([550, 680])
+            self.assertFalse(db_router.is_pinned())
+            self.assertFalse(db_router._wrote.get())
+            self.assertTrue(Movie.objects.filter(tmdb_id=680).exists())
+
+
+class ReplicaMigrationTests(TransactionTestCase):
+    def test_migrations_run_on_the_primary(self):
+        from django.core.management import call_command
+        from django.test import override_settings
+        # replica_0 is not even a configured database here, so any read
+        # routed to it (e.g. from a RunPython function) fails
+        with override_settings(DATABASE_REPLICAS=['replica_0']):
+            call_command('migrate', 'movies', '0003', verbosity=0)
+            call_command('migrate', 'movies', verbosity=0)
+
+
+class SimilarityEngineTests(TestCase):
+    def brute_force(self, matrix, k):
+        import numpy as np
+        scores = (matrix @ matrix.T).toarray()
+        np.fill_diagonal(scores, -np.inf)
+        scores[scores <= 0] = -np.inf
+        columns = np.broadcast_to(np.arange(scores.shape[1]), scores.shape)
+        order = np.lexsort((columns, -scores), axis=1)[:, :k]
+        best = np.take_along_axis(scores, order, axis=1)
+        return np.where(np.isfinite(best), order, -1), best
+
+    def test_sharded_runs_match_brute_force(self):
+        import numpy as np
+        from scipy import sparse
+        from .similarity import LocalRunner, normalize_rows, top_k_similarities
+        ratings = sparse.random(300, 80, density=0.1, format='csr', random_state=7)
+        ratings.data = np.ceil(ratings.data * 5)
+        matrix = normalize_rows(ratings)
+        expected_neighbors, expected_scores = self.brute_force(matrix, 5)
+
+        for runner, block_rows, column_shards in [
+            (LocalRunner(1), 512, 1), (LocalRunner(1), 64, 3), (LocalRunner(2), 50, 2),
+        ]:
+            neighbors, scores = top_k_similarities(matrix, 5, runner, block_rows, column_shards)
+            np.testing.assert_array_equal(neighbors, expected_neighbors)
+            np.testing.assert_allclose(scores, expected_scores)
+
+    def test_rating_matrix(self):
+        from .models import Rating
+        from .recommendation import rating_matrix
+        users = [User.objects.create_user(username=f'user{i}', password='testpass123') for i in range(2)]
+        movies = [Movie.objects.create(tmdb_id=100 + i, title=f'Movie {i}', overview='') for i in range(3)]
+        Rating.objects.create(user=users[0], movie=movies[2], rating=3.5)
+        Rating.objects.create(user=users[1], movie=movies[0], rating=5)
+
+        matrix, movie_ids = rating_matrix('item')
+        self.assertEqual(movie_ids.tolist(), [movies[0].id, movies[2].id])
+        self.assertEqual(matrix.toarray().tolist(), [[0, 5], [3.5, 0]])
+        matrix, user_ids = rating_matrix('user')
+        self.assertEqual(user_ids.tolist(), [users[0].id, users[1].id])
+        self.assertEqual(matrix.toarray().tolist(), [[0, 3.5], [5, 0]])
+
+
+class SimilarMoviesTests(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        from .models import Genre, Rating
+        from . import similar_movies
+        cache.clear()
+        similar_movies._checked_at = float('-inf')
+        self.addCleanup(setattr, similar_movies, '_store', similar_movies._store)
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.client.force_authenticate(user=self.user)
+
+        space, romance = Genre.objects.create(name='Science Fiction'), Genre.objects.create(name='Romance')
+        overviews = [
+            'Astronauts travel through a wormhole in space',
+            'A crew travels through space to a distant wormhole',
+            'Two strangers fall in love in Paris',
+            'A love story on a summer holiday in Paris',
+        ]
+        self.movies = []
+        for i, overview in enumerate(overviews):
+            movie = Movie.objects.create(tmdb_id=100 + i, title=f'Movie {i}', overview=overview)
+            movie.genres.add(space if i < 2 else romance)
+            self.movies.append(movie)
+        # Fans of the first movie also like the second
+        for name in ('fan1', 'fan2'):
+            fan = User.objects.create_user(username=name, password='testpass123')
+            Rating.objects.create(user=fan, movie=self.movies[0], rating=5)
+            Rating.objects.create(user=fan, movie=self.movies[1], rating=5)
+            Rating.objects.create(user=fan, movie=self.movies[2], rating=1)
+
+    def url(self, tmdb_id, mode='local'):
+        return reverse('movie-recommendations', args=[tmdb_id]) + f'?mode={mode}'
+
+    def test_local_mode_answers_from_memory(self):
+        from .similar_movies import build_store
+        self.assertEqual(build_store(top_k=2, workers=1), 4)
+
+        self.client.get(self.url(100))
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url(100))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['source'], 'local')
+        self.assertEqual([movie['id'] for movie in response.data['results']][:1], [101])
+        self.assertEqual(response.data['results'][0]['title'], 'Movie 1')
+
+        response = self.client.get(self.url(102), HTTP_IF_NONE_MATCH=self.client.get(self.url(102))['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    @patch('movies.tmdb_api.get_movie_recommendations')
+    def test_unknown_movies_fall_back_to_tmdb(self, mock_recommendations):
+        from .similar_movies import build_store
+        build_store(top_k=2, workers=1)
+        mock_recommendations.return_value = {'page': 1, 'results': [{'id': 7}]}
+
+        response = self.client.get(self.url(999))
+        self.assertEqual(response.data['results'], [{'id': 7}])
+        mock_recommendations.assert_called_once_with(999, 1)
+
+        self.client.get(self.url(100, mode='tmdb'))
+        self.assertEqual(mock_recommendations.call_count, 2)
+        self.assertEqual(self.client.get(self.url(100, mode='nearest')).status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ProfilingMiddlewareTests(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.staff = User.objects.create_user(username='staff', password='testpass123', is_staff=True)
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        Movie.objects.create(tmdb_id=550, title='Fight Club', overview='')
+
+    def client_for(self, user):
+        from rest_framework_simplejwt.tokens import AccessToken
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+        return client
+
+    def test_staff_can_profile_a_request_and_download_it(self):
+        import marshal
+        client = self.client_for(self.staff)
+        response = client.get(reverse('movie-list'), HTTP_X_PROFILE='1', HTTP_X_REQUEST_ID='req-1')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['X-Profile-Id'], 'req-1')
+
+        profile = client.get(reverse('request-profile', args=['req-1'])).data
+        self.assertEqual((profile['user'], profile['trigger'], profile['status']), ('staff', 'header', 200))
+        self.assertGreater(profile['query_count'], 0)
+        self.assertTrue(any('movies_movie' in query['sql'] for query in profile['queries']))
+        self.assertIn('cumulative', profile['summary'])
+
+        download = client.get(reverse('request-profile-stats', args=['req-1']))
+        self.assertEqual(download['Content-Disposition'], 'attachment; filename="req-1.prof"')
+        self.assertTrue(marshal.loads(download.content))
+
+        self.assertEqual(client.get(reverse('request-profile', args=['missing'])).status_code, 404)
+
+    def test_other_requests_are_not_profiled_unless_sampled(self):
+        from django.test import override_settings
+        client = self.client_for(self.user)
+        response = client.get(reverse('movie-list'), HTTP_X_PROFILE='1')
+        self.assertNotIn('X-Profile-Id', response)
+        self.assertNotIn('X-Profile-Id', self.client_for(self.staff).get(reverse('movie-list')))
+        # Only "X-Profile: 1" opts in
+        for value in ('0', 'false'):
+            response = self.client_for(self.staff).get(reverse('movie-list'), HTTP_X_PROFILE=value)
+            self.assertNotIn('X-Profile-Id', response)
+
+        with override_settings(PROFILING_SAMPLE_RATE=1.0):
+            request_id = self.client_for(self.user).get(reverse('movie-list'))['X-Profile-Id']
+        profile_url = reverse('request-profile', args=[request_id])
+        self.assertEqual(client.get(profile_url).status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(self.client_for(self.staff).get(profile_url).data['trigger'], 'sample')
+
+
+class LoadTestHarnessTests(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+
+    @patch('movies.rate_limiter.limiter.acquire')
+    def test_fake_tmdb_answers_the_tmdb_client(self, mock_acquire):
+        from . import tmdb_api
+        from .loadtest.fake_tmdb import FakeTMDb, fake_movie
+        with FakeTMDb(catalog_size=100) as fake, patch('movies.tmdb_api.BASE_URL', fake.url):
+            self.assertEqual(tmdb_api.get_movie_details(5), fake_movie(5))
+            self.assertIn('error', tmdb_api.get_movie_details(101))
+            trending = tmdb_api.get_trending_movies('day', 2)
+            self.assertEqual((trending['page'], len(trending['results'])), (2, 20))
+
+            fake.error_rate = 1
+            self.assertIn('error', tmdb_api.search_movies('heist'))
+        self.assertEqual(fake.requests['details', 200], 1)
+        self.assertEqual(fake.requests['search', 500], 1)
+
+    def test_summary_reports_throughput_and_percentiles(self):
+        from .loadtest.runner import summarize
+        samples = [('details', 200, ms / 1000) for ms in range(1, 101)] + [('search', 503, 0.5)]
+        summary = summarize(samples, elapsed=10)
+        self.assertEqual(summary['details']['throughput'], 10)
+        self.assertEqual(
+            [summary['details'][key] for key in ('p50_ms', 'p90_ms', 'p99_ms', 'max_ms', 'errors')],
+            [50, 90, 99, 100, 0],
+        )
+        self.assertEqual((summary['search']['errors'], summary['all']['requests']), (1, 101))
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.client.force_authenticate(user=self.user)
+
+    def sample(self, name, **labels):
+        from prometheus_client import REGISTRY
+        return REGISTRY.get_sample_value(name, labels) or 0
+
+    @patch('movies.rate_limiter.limiter.acquire')
+    @patch('movies.tmdb_api.requests.get')
+    def test_tmdb_cache_results_and_call_latency(self, mock_get, mock_acquire):
+        from . import tmdb_api
+        mock_get.return_value = MagicMock(status_code=200, json=lambda: {'id': 5, 'title': 'Five'})
+        before = {
+            result: self.sample('tmdb_cache_requests_total', function='get_movie_details', result=result)
+            for result in ('hit', 'miss', 'stale')
+        }
+        calls = self.sample('tmdb_request_duration_seconds_count', endpoint='/movie/{id}', status='200')
+
+        tmdb_api.get_movie_details(5)
+        tmdb_api.get_movie_details(5)
+        tmdb_api.get_movie_details(5, refresh=True)
+
+        for result in ('hit', 'miss', 'stale'):
+            self.assertEqual(
+                self.sample('tmdb_cache_requests_total', function='get_movie_details', result=result),
+                before[result] + 1,
+            )
+        self.assertEqual(
+            self.sample('tmdb_request_duration_seconds_count', endpoint='/movie/{id}', status='200'), calls + 2
+        )
+
+    def test_request_metrics_are_exposed(self):
+        from django.test import override_settings
+        observed = self.sample('http_request_db_queries_count', view='movie-list')
+        self.client.get(reverse('movie-list'))
+        self.assertEqual(self.sample('http_request_db_queries_count', view='movie-list'), observed + 1)
+
+        self.client.get(reverse('movie-recommendations'))
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        body = response.content.decode()
+        self.assertIn('recommender_stage_duration_seconds_count{stage="hydrate"}', body)
+        self.assertIn('http_request_duration_seconds_bucket{le="0.005",method="GET",status="200",view="movie-list"}', body)
+        from .recommendation import ratings_version
+        self.assertIn(f'model_artifact_info{{artifact="ratings",version="{ratings_version()}"}} 1.0', body)
+
+        with override_settings(METRICS_TOKEN='secret'):
+            self.assertEqual(self.client.get(reverse('metrics')).status_code, status.HTTP_403_FORBIDDEN)
+            response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer secret')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class WarmupTests(TestCase):
+    def test_web_processes_do_not_import_scientific_libraries(self):
+        import subprocess
+        import sys
+        script = (
+            "import django, sys; django.setup(); import movies.views, movie_recommendation.urls; "
+            "print(sorted(m for m in ('numpy', 'scipy', 'sklearn') if m in sys.modules))"
+        )
+        result = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, check=True)
+        self.assertEqual(result.stdout.strip(), '[]')
+
+    def test_readiness_probe_reports_warm_workers(self):
+        from . import warmup
+        warmup._ready.clear()
+        self.addCleanup(warmup._ready.set)
+
+        response = self.client.get(reverse('readiness'))
+        self.assertEqual(response.status_code, 503)
+        warmup._background.join(timeout=30)
+
+        response = self.client.get(reverse('readiness'))
+        self.assertEqual((response.status_code, response.json()), (200, {'ready': True}))
+
+
+    def test_warm_up_opens_no_database_connection(self):
+        import threading
+        from django.db import connections
+        from . import warmup
+        warmup._ready.clear()
+        self.addCleanup(warmup._ready.set)
+        opened = []
+
+        def warm_up():
+            warmup.warm_up()
+            opened.append(connections['default'].connection is not None)
+            connections.close_all()
+
+        thread = threading.Thread(target=warm_up)
+        thread.start()
+        thread.join(timeout=30)
+        self.assertEqual(opened, [False])
+
+
+class LocalTrendingTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.client.force_authenticate(user=self.user)
+        self.movies = [Movie.objects.create(tmdb_id=100 + i, title=f'Movie {i}') for i in range(3)]
+
+    def redis(self):
+        import unittest
+        from django_redis import get_redis_connection
+        try:
+            redis = get_redis_connection('default')
+        except NotImplementedError:
+            raise unittest.SkipTest("Local trending requires Redis")
+        redis.delete(*redis.keys('trending:local:*') or ['trending:local:epoch'])
+        return redis
+
+    def test_recent_activity_outranks_older_activity(self):
+        import math
+        from .trending import WINDOWS, trending
+        self.redis()
+        now = 1_700_000_000
+        old, recent, favorite = (movie.id for movie in self.movies)
+
+        trending.record('rating', [old], now=now - WINDOWS['day'] / 2)
+        trending.record('rating', [old, recent], now=now)
+        trending.record('rating', [recent], now=now)
+        ids, scores, total = trending.top('week', now=now)
+        self.assertEqual((ids, total), ([recent, old], 2))
+        # The old rating decayed by half a day of the week's half-life
+        self.assertAlmostEqual(scores[1], 1 + math.pow(2, -0.5 / 7))
+        self.assertAlmostEqual(scores[0], 2)
+        # Decay keeps applying while no new events arrive
+        ids, scores, _ = trending.top('week', now=now + WINDOWS['week'] / 2)
+        self.assertAlmostEqual(scores[0], 2 * math.pow(2, -0.5))
+
+        # Rebuilding from the buckets keeps the ranking and the scores
+        # (up to the dating of events at the middle of their bucket)
+        trending.record('favorite', [favorite], now=now)
+        before = trending.top('week', now=now)
+        self.assertGreater(trending.rebuild(now=now), 0)
+        after = trending.top('week', now=now)
+        self.assertEqual(after[0], before[0])
+        self.assertEqual(after[0][0], favorite)
+        for score_before, score_after in zip(before[1], after[1]):
+            self.assertAlmostEqual(score_after, score_before, delta=score_before * 0.01)
+
+    def test_activity_older_than_the_window_is_left_out(self):
+        from .trending import WINDOWS, trending
+        self.redis()
+        now = 1_700_000_000
+        stale, recent = self.movies[0].id, self.movies[1].id
+        trending.record('favorite', [stale], now=now - 2 * WINDOWS['hour'])
+        trending.record('rating', [recent], now=now)
+
+        self.assertEqual(trending.top('hour', now=now), ([recent], [1.0], 1))
+        self.assertEqual(trending.top('day', now=now)[0], [stale, recent])
+        # Rebuilt windows only read the buckets they span
+        trending.rebuild(now=now)
+        self.assertEqual(trending.top('hour', now=now)[0], [recent])
+        self.assertEqual(trending.top('day', now=now)[0], [stale, recent])
+        # and reads drop movies as they fall out of the window
+        self.assertEqual(trending.top('day', now=now + WINDOWS['day'] - WINDOWS['hour'])[0], [recent])
+
+    def test_local_mode_counts_favorites_and_ratings(self):
+        self.redis()
+        self.client.post(reverse('favorite-movie', args=[101]))
+        self.client.post(reverse('rating-batch'), {'ratings': [{'movie_id': 100, 'rating': 4}]}, format='json')
+
+        response = self.client.get(reverse('trending-movies') + '?mode=local&time_window=hour')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['source'], 'local')
+        self.assertEqual([movie['id'] for movie in response.data['results']], [101, 100])
+        self.assertEqual(response.data['results'][0]['title'], 'Movie 1')
+        self.assertEqual(response.data['total_results'], 2)
+
+    @patch('movies.tmdb_api.get_trending_movies')
+    def test_local_mode_falls_back_to_tmdb_without_redis(self, mock_trending):
+        mock_trending.return_value = {'page': 1, 'results': [{'id': 7}]}
+        url = reverse('trending-movies')
+        with patch('movies.trending.trending.top', return_value=None):
+            response = self.client.get(url + '?mode=local&time_window=day')
+        self.assertEqual(response.data['results'], [{'id': 7}])
+        mock_trending.assert_called_once_with('day', 1)
+
+        self.assertEqual(self.client.get(url + '?mode=local&time_window=year').status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get(url + '?mode=popular').status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class OfflineEvaluationTests(TestCase):
+    def test_temporal_split_holds_out_the_latest_likes(self):
+        from .evaluation import temporal_split
+        # users 1 and 2 rate movies 10-13 at times 0-7
+        holdout = temporal_split(
+            user_ids=[1, 1, 1, 1, 2, 2, 2, 2],
+            movie_ids=[10, 11, 12, 13, 10, 11, 12, 13],
+            ratings=[5, 4, 5, 2, 3, 5, 1, 4],
+            times=[0, 1, 6, 7, 2, 3, 4, 5],
+            test_fraction=0.25,
+        )
+        self.assertEqual(holdout.train.nnz, 6)
+        # Of user 1's ratings after the cutoff only the 5 counts as liked
+        self.assertEqual(holdout.test.toarray().tolist(), [[0, 0, 1, 0], [0, 0, 0, 0]])
+        self.assertEqual(holdout.users.tolist(), [0])
+
+    def test_temporal_split_needs_ratings_on_both_sides(self):
+        from .evaluation import temporal_split
+        # Every rating made at the same time leaves nothing before the cutoff
+        with self.assertRaises(ValueError):
+            temporal_split(user_ids=[1, 1, 2], movie_ids=[10, 11, 10], ratings=[5, 4, 5], times=[7, 7, 7])
+        with self.assertRaises(ValueError):
+            temporal_split(user_ids=[], movie_ids=[], ratings=[], times=[])
+
+    def test_user_pearson_engine_matches_the_recommender(self):
+        import numpy as np
+        from scipy import sparse
+        from .evaluation import Holdout, UserNeighborEngine
+        from .recommendation import MovieRecommender
+        rng = np.random.default_rng(0)
+        ratings = np.where(rng.random((30, 20)) < 0.4, rng.integers(1, 11, (30, 20)) / 2, 0)
+        train = sparse.csr_matrix(ratings)
+        engine = UserNeighborEngine()
+        engine.fit(Holdout(train, train, np.arange(30), np.arange(20), 0))
+        scores = engine.score(train[:5])
+
+        recommender = MovieRecommender()
+        for user in range(5):
+            similarities = {}
+            for other in range(30):
+                common = (ratings[user] > 0) & (ratings[other] > 0)
+                if other != user and common.sum() >= 2:
+                    similarity = recommender._pearson_correlation(ratings[user][common], ratings[other][common])
+                    if similarity > 0:
+                        similarities[other] = similarity
+            for movie in np.flatnonzero(ratings[user] == 0):
+                pairs = [(other, ratings[other, movie]) for other in similarities if ratings[other, movie]]
+                if pairs:
+                    self.assertAlmostEqual(scores[user, movie], recommender._predict_rating(pairs, similarities))
+                else:
+                    self.assertLess(scores[user, movie], 0)
+
+    def test_ratings_without_a_time_are_left_out(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        from .evaluation import load_holdout
+        from .models import Rating
+        user = User.objects.create_user(username='testuser', password='testpass123')
+        movies = [Movie.objects.create(tmdb_id=100 + i, title=f'Movie {i}') for i in range(3)]
+        start = timezone.now() - timedelta(days=30)
+        Rating.objects.create(user=user, movie=movies[0], rating=5, rated_at=None)
+        for day, movie in enumerate(movies[1:]):
+            Rating.objects.create(user=user, movie=movie, rating=5, rated_at=start + timedelta(days=day))
+
+        holdout = load_holdout(test_fraction=0.5)
+        self.assertEqual(holdout.item_ids.tolist(), [movie.id for movie in movies[1:]])
+
+    def test_ranking_metrics(self):
+        import numpy as np
+        from scipy import sparse
+        from .evaluation import ranking_metrics
+        relevant = sparse.csr_matrix(np.array([[1, 0, 1, 0, 0], [0, 0, 0, 0, 1]], dtype=np.float32))
+        precision, recall, ndcg = ranking_metrics(np.array([[2, 1], [0, -1]]), relevant)
+        self.assertEqual(precision.tolist(), [0.5, 0])
+        self.assertEqual(recall.tolist(), [0.5, 0])
+        self.assertAlmostEqual(ndcg[0], 1 / (1 + 1 / np.log2(3)))
+        self.assertEqual(ndcg[1], 0)
+
+    def test_engines_are_compared_on_the_holdout(self):
+        import json
+        import os
+        import tempfile
+        from datetime import timedelta
+        from io import StringIO
+        from django.core.management import CommandError, call_command
+        from django.utils import timezone
+        from .models import Rating
+        movies = [Movie.objects.create(tmdb_id=100 + i, title=f'Movie {i}') for i in range(4)]
+        start = timezone.now() - timedelta(days=30)
+        # Everyone who liked movies 0 and 1 went on to like movie 2
+        for index in range(6):
+            user = User.objects.create_user(username=f'user{index}', password='testpass123')
+            for week, (movie, rating) in enumerate([(0, 5), (1, 5), (3, 1), (2, 5)]):
+                Rating.objects.create(user=user, movie=movies[movie], rating=rating,
+                                      rated_at=start + timedelta(weeks=week, hours=index))
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'results.json')
+            call_command('evaluate_recommenders', '--engines', 'popular', 'item_knn', 'user_pearson', '--k', '1',
+                         '--test-fraction', '0.2', '--output', path, stdout=StringIO())
+            with open(path) as results_file:
+                results = json.load(results_file)['results']
+        self.assertEqual([result['engine'] for result in results], ['popular', 'item_knn', 'user_pearson'])
+        for result in results[1:]:
+            self.assertEqual(
+                (result['users'], result['precision@1'], result['recall@1'], result['ndcg@1']),
+                (results[0]['users'], 1.0, 1.0, 1.0)
+            )
+            self.assertGreater(result['ms_per_user'], 0)
+
+        # Ratings all made at one time cannot be split
+        Rating.objects.update(rated_at=start)
+        with self.assertRaisesMessage(CommandError, 'distinct times'):
+            call_command('evaluate_recommenders', stdout=StringIO())
+
+
+class UserContextTests(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        from .models import Genre
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.client.force_authenticate(user=self.user)
+        drama, comedy = Genre.objects.create(name='Drama'), Genre.objects.create(name='Comedy')
+        self.movies = []
+        for i in range(60):
+            movie = Movie.objects.create(tmdb_id=100 + i, title=f'Movie {i}', overview='')
+            movie.genres.add(drama if i % 2 == 0 else comedy)
+            self.movies.append(movie)
+
+    def rate(self, user, movies):
+        from .models import Rating
+        # Like an import: written in bulk, without per-row signals
+        Rating.objects.bulk_create(
+            Rating(user=user, movie=movie, rating=5 if i % 2 == 0 else 2) for i, movie in enumerate(movies)
+        )
+
+    def test_query_count_does_not_grow_with_history(self):
+        from .recommendation import MovieRecommender, UserContext
+        newcomer = User.objects.create_user(username='newcomer', password='testpass123')
+        neighbor = User.objects.create_user(username='neighbor', password='testpass123')
+        self.rate(newcomer, self.movies[:2])
+        self.rate(self.user, self.movies[:40])
+        self.rate(neighbor, self.movies[:2] + self.movies[50:])
+
+        with self.assertNumQueries(2):
+            context = UserContext.load(self.user.id)
+        self.assertEqual(len(context.ratings), 40)
+        self.assertEqual(context.rated_ids, {movie.id for movie in self.movies[:40]})
+        self.assertEqual(context.genre_weights.argmax(), self.movies[0].genres.get().bit)
+
+        with self.assertNumQueries(5):
+            short = MovieRecommender().get_recommendations(newcomer.id, 3)
+        with self.assertNumQueries(5):
+            long = MovieRecommender().get_recommendations(self.user.id, 3)
+        self.assertEqual(len(short), 3)
+        self.assertFalse(context.rated_ids & set(long))
+
+    def test_context_is_shared_across_counts_until_favorites_or_ratings_change(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from .models import FavoriteMovie
+        from .recommendation import UserContext
+        self.rate(self.user, self.movies[:4])
+        url = reverse('movie-recommendations')
+        self.client.get(url, {'count': 2})
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, {'count': 5})
+        self.assertEqual(response.data['count'], 5)
+        self.assertFalse([query for query in queries if 'movies_favoritemovie' in query['sql']])
+
+        # A new favorite is never recommended again
+        FavoriteMovie.objects.create(user=self.user, movie=self.movies[4])
+        self.assertEqual(UserContext.cached(self.user.id).favorite_ids, {self.movies[4].id})
+        response = self.client.get(url, {'count': 5})
+        self.assertNotIn(104, [movie['tmdb_id'] for movie in response.data['recommendations']])
+
+        self.client.post(reverse('rating-batch'), {'ratings': [{'movie_id': 105, 'rating': 4}]}, format='json')
+        self.assertIn(self.movies[5].id, UserContext.cached(self.user.id).rated_ids)
+
+    def test_contexts_are_dropped_only_for_users_whose_ratings_change(self):
+        from django.core.cache import cache
+        from .models import Rating
+        from .recommendation import UserContext, user_context_key
+        from .signals import ratings_updated
+        other = User.objects.create_user(username='other', password='testpass123')
+        self.rate(self.user, self.movies[:4])
+        context = UserContext.cached(self.user.id)
+        cache.delete(user_context_key(other.id))
+
+        # Another user's ratings leave this user's context cached
+        other_client = APIClient()
+        other_client.force_authenticate(user=other)
+        other_client.post(reverse('rating-batch'), {'ratings': [{'movie_id': 105, 'rating': 4}]}, format='json')
+        Rating.objects.create(user=other, movie=self.movies[6], rating=3)
+        with self.assertNumQueries(0):
+            self.assertEqual(UserContext.cached(self.user.id).rated_ids, context.rated_ids)
+
+        # Their own single rating drops it
+        Rating.objects.create(user=self.user, movie=self.movies[7], rating=3)
+        self.assertIn(self.movies[7].id, UserContext.cached(self.user.id).rated_ids)
+
+        # A bulk import drops every context
+        cache.delete(user_context_key(self.user.id))
+        UserContext.cached(self.user.id)
+        self.rate(self.user, self.movies[8:9])
+        ratings_updated.send(sender=Rating, user_ids=None)
+        self.assertIn(self.movies[8].id, UserContext.cached(self.user.id).rated_ids)
+
+    def test_a_context_loaded_before_a_change_is_not_cached_after_it(self):
+        from .models import FavoriteMovie
+        from .recommendation import UserContext
+        stale = UserContext.load(self.user.id)
+        FavoriteMovie.objects.create(user=self.user, movie=self.movies[0])
+
+        # A request that loaded the context before the favorite was added
+        with patch.object(UserContext, 'load', return_value=stale):
+            UserContext.cached(self.user.id)
+        self.assertEqual(UserContext.cached(self.user.id).favorite_ids, {self.movies[0].id})
+
+
+class CachedJWTAuthenticationTests(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        cache.clear()
+        self.client = APIClient()
+
+    def authenticate(self, password='testpass123'):
+        response = self.client.post(reverse('token_obtain_pair'), {'username': 'testuser', 'password': password})
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.data['access']}")
+
+    @patch('movies.tmdb_api.get_trending_movies')
+    def test_user_is_resolved_from_the_cache(self, mock_trending):
+        mock_trending.return_value = {'page': 1, 'results': []}
+        self.authenticate()
+        url = reverse('trending-movies')
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK)
+
+        # A password change drops the cached user
+        self.user.set_password('newpass456')
+        self.user.save()
+        with self.assertNumQueries(1):
+            self.client.get(url)
+
+        # and so does deactivation, after which the token is refused
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    @patch('movies.tmdb_api.get_trending_movies')
+    def test_changes_cannot_be_overwritten_by_a_stale_read(self, mock_trending):
+        from django.core.cache import cache
+        from .authentication import forget_user, user_cache_key
+        mock_trending.return_value = {'page': 1, 'results': []}
+        self.authenticate()
+        url = reverse('trending-movies')
+
+        # A request that read the user before a change was committed cannot
+        # cache them again until the tombstone expires
+        forget_user(self.user.id)
+        for _ in range(2):
+            with self.assertNumQueries(1):
+                self.client.get(url)
+
+        cache.delete(user_cache_key(self.user.id))
+        self.client.get(url)
+        entry = cache.get(user_cache_key(self.user.id))
+        self.assertEqual(set(entry), {'id', 'username', 'is_active', 'is_staff', 'is_superuser', 'password_hash'})
+        self.assertNotIn(self.user.password, entry.values())
+
+    def test_cached_users_cannot_be_saved(self):
+        from rest_framework_simplejwt.tokens import AccessToken
+        from .authentication import CachedJWTAuthentication
+        authentication = CachedJWTAuthentication()
+        token = AccessToken.for_user(self.user)
+        authentication.get_user(token)
+        cached = authentication.get_user(token)
+        self.assertEqual((cached.pk, cached.username, cached.email), (self.user.id, 'testuser', ''))
+        with self.assertRaises(NotImplementedError):
+            cached.save()
+        with self.assertRaises(NotImplementedError):
+            cached.delete()
+        self.assertTrue(User.objects.get(pk=self.user.id).check_password('testpass123'))
+
+
+class FavoriteListTests(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        from .resolver import local_cache
+        cache.clear()
+        local_cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse('favorite-list')
+
+    def favorite(self, count, start=0):
+        from .models import FavoriteMovie
+        for i in range(start, start + count):
+            movie = Movie.objects.create(tmdb_id=100 + i, title=f'Movie {i}', overview='')
+            FavoriteMovie.objects.create(user=self.user, movie=movie)
+        self.expire_tombstones()
+
+    def expire_tombstones(self):
+        from django.core.cache import cache
+        from . import favorites
+        cache.delete_many([favorites.first_page_cache_key(self.user.id), favorites.ids_cache_key(self.user.id)])
+
+    def test_pages_are_read_with_one_query(self):
+        from .models import FavoriteMovie
+        from .serializers import FavoriteMovieSerializer
+        self.favorite(3)
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, {'page_size': 2})
+        self.assertEqual([favorite['movie']['tmdb_id'] for favorite in response.data['results']], [102, 101])
+        self.assertEqual(
+            response.data['results'],
+            FavoriteMovieSerializer(FavoriteMovie.objects.order_by('-added_at', '-id')[:2], many=True).data
+        )
+
+        # The next page costs the same, however many favorites there are
+        self.favorite(30, start=3)
+        response = self.client.get(self.url, {'page_size': 2})
+        with self.assertNumQueries(1):
+            response = self.client.get(response.data['next'])
+        self.assertEqual([favorite['movie']['tmdb_id'] for favorite in response.data['results']], [130, 129])
+
+    def test_first_page_and_ids_are_cached_until_favorites_change(self):
+        self.favorite(2)
+        self.client.get(self.url)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertEqual(len(response.data['results']), 2)
+
+        self.assertEqual(self.client.get(self.url, {'mode': 'ids'}).data, {'ids': [101, 100]})
+        with self.assertNumQueries(0):
+            self.client.get(self.url, {'mode': 'ids'})
+
+        self.client.delete(reverse('favorite-movie', args=[101]))
+        self.assertEqual(len(self.client.get(self.url).data['results']), 1)
+        self.assertEqual(self.client.get(self.url, {'mode': 'ids'}).data, {'ids': [100]})
+        self.favorite(1, start=5)
+        self.assertEqual(self.client.get(self.url, {'mode': 'ids'}).data, {'ids': [105, 100]})
+        self.assertEqual(self.client.get(self.url, {'mode': 'titles'}).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_changes_cannot_be_overwritten_by_a_stale_read(self):
+        from .favorites import forget_favorites
+        self.favorite(2)
+
+        # Reads that raced a change are served, but not cached, until the
+        # tombstones expire
+        forget_favorites(self.user.id)
+        for _ in range(2):
+            with self.assertNumQueries(1):
+                self.client.get(self.url, {'mode': 'ids'})
+            with self.assertNumQueries(1):
+                self.client.get(self.url)
+
+        self.expire_tombstones()
+        self.client.get(self.url)
+        with self.assertNumQueries(0):
+            self.client.get(self.url)
+
+    def test_cached_first_page_shows_movie_changes_and_links_for_this_host(self):
+        self.favorite(25)
+        first = self.client.get(self.url, HTTP_HOST='localhost')
+        self.assertTrue(first.data['next'].startswith('http://localhost/'))
+
+        movie = Movie.objects.get(tmdb_id=124)
+        movie.title = 'Renamed'
+        movie.save()
+        response = self.client.get(self.url, HTTP_HOST='127.0.0.1')
+        self.assertEqual(response.data['results'][0]['movie']['title'], 'Renamed')
+        self.assertEqual(response.data['next'], first.data['next'].replace('localhost', '127.0.0.1'))
+        self.assertEqual(response.data['results'][1:], first.data['results'][1:])
@@ -1,72 +1,107 @@
 from logging import config
+import time
 import requests
+from concurrent.futures import ThreadPoolExecutor
 from django.core.cache import cache
 import logging
 from decouple import config  
+from . import metrics, rate_limiter
+from .conditional import make_etag
+from .rate_limiter import RateLimitExceeded
 
 logger = logging.getLogger(__name__)
 
 TMDB_API_KEY = config('TMDB_API_KEY')
-BASE_URL = 'https://api.themoviedb.org/3'
+# Overridable to point load tests at a fake TMDb (python manage.py fake_tmdb)
+BASE_URL = config('TMDB_BASE_URL', default='https://api.themoviedb.org/3')
 
-def get_trending_movies(time_window='week', page=1):
+# Upper bound on concurrent TMDb requests made by get_movie_details_many
+BATCH_MAX_WORKERS = config('TMDB_BATCH_MAX_WORKERS', default=8, cast=int)
+
+# Cache lifetimes in seconds; the cache warmer schedules itself against these
+TRENDING_CACHE_TIMEOUT = 60 * 60 * 6
+RECOMMENDATIONS_CACHE_TIMEOUT = 60 * 60 * 24
+SEARCH_CACHE_TIMEOUT = 60 * 60 * 6
+DETAILS_CACHE_TIMEOUT = 60 * 60 * 24 * 7
+
+def trending_cache_key(time_window, page):
+    return f'trending_movies:{time_window}:{page}'
+
+def recommendations_cache_key(movie_id, page):
+    return f'movie_recommendations:{movie_id}:{page}'
+
+def details_cache_key(movie_id):
+    return f'movie_details:{movie_id}'
+
+def search_cache_key(query, page):
+    return f'movie_search:{query}:{page}'
+
+def etag_cache_key(cache_key):
+    return f'etag:{cache_key}'
+
+def stored_etag(cache_key):
+    """
+    ETag of the payload cached under cache_key, or None if it is not cached
+    """
+    return cache.get(etag_cache_key(cache_key))
+
+def _cache_payloads(payloads, timeout):
+    """
+    Cache payloads (a dict of cache key to payload) together with their
+    ETags, so views can answer conditional requests without rehashing them
+    """
+    entries = {}
+    for cache_key, data in payloads.items():
+        entries[cache_key] = data
+        entries[etag_cache_key(cache_key)] = make_etag(data)
+    cache.set_many(entries, timeout)
+
+def get_trending_movies(time_window='week', page=1, refresh=False):
     """
     Fetch trending movies from TMDb
     time_window: 'day' or 'week'
+    refresh: bypass the cache and re-fetch (used by the cache warmer)
     """
-    cache_key = f'trending_movies:{time_window}:{page}'
-    cached_data = cache.get(cache_key)
+    cache_key = trending_cache_key(time_window, page)
+    cached_data = None if refresh else cache.get(cache_key)
     
     if cached_data:
+        metrics.record_cache('get_trending_movies', 'hit')
         return cached_data
+    metrics.record_cache('get_trending_movies', 'stale' if refresh else 'miss')
     
     try:
-        url = f"{BASE_URL}/trending/movie/{time_window}"
-        response = requests.get(
-            url,
-            params={
-                'api_key': TMDB_API_KEY,
-                'page': page
-            }
-        )
-        response.raise_for_status()
-        data = response.json()
+        data = _get(f"/trending/movie/{time_window}", page=page)
         
         # Cache data for 6 hours
-        cache.set(cache_key, data, 60 * 60 * 6)
+        _cache_payloads({cache_key: data}, TRENDING_CACHE_TIMEOUT)
         
         return data
-    except requests.exceptions.RequestException as e:
+    except (requests.exceptions.RequestException, RateLimitExceeded) as e:
         logger.error(f"Error fetching trending movies: {e}")
         return {'results': [], 'error': str(e)}
 
-def get_movie_recommendations(movie_id, page=1):
+def get_movie_recommendations(movie_id, page=1, refresh=False):
     """
     Get movie recommendations based on a movie ID
+    refresh: bypass the cache and re-fetch (used by the cache warmer)
     """
-    cache_key = f'movie_recommendations:{movie_id}:{page}'
-    cached_data = cache.get(cache_key)
+    cache_key = recommendations_cache_key(movie_id, page)
+    cached_data = None if refresh else cache.get(cache_key)
     
     if cached_data:
+        metrics.record_cache('get_movie_recommendations', 'hit')
         return cached_data
+    metrics.record_cache('get_movie_recommendations', 'stale' if refresh else 'miss')
     
     try:
-        url = f"{BASE_URL}/movie/{movie_id}/recommendations"
-        response = requests.get(
-            url,
-            params={
-                'api_key': TMDB_API_KEY,
-                'page': page
-            }
-        )
-        response.raise_for_status()
-        data = response.json()
+        data = _get(f"/movie/{movie_id}/recommendations", page=page)
         
         # Cache data for 24 hours - recommendations change less frequently
-        cache.set(cache_key, data, 60 * 60 * 24)
+        _cache_payloads({cache_key: data}, RECOMMENDATIONS_CACHE_TIMEOUT)
         
         return data
-    except requests.exceptions.RequestException as e:
+    except (requests.exceptions.RequestException, RateLimitExceeded) as e:
         logger.error(f"Error fetching movie recommendations: {e}")
         return {'results': [], 'error': str(e)}
 
@@ -74,58 +109,112 @@ def search_movies(query, page=1):
     """
     Search for movies by title
     """
-    cache_key = f'movie_search:{query}:{page}'
+    cache_key = search_cache_key(query, page)
     cached_data = cache.get(cache_key)
     
     if cached_data:
+        metrics.record_cache('search_movies', 'hit')
         return cached_data
+    metrics.record_cache('search_movies', 'miss')
     
     try:
-        url = f"{BASE_URL}/search/movie"
-        response = requests.get(
-            url,
-            params={
-                'api_key': TMDB_API_KEY,
-                'query': query,
-                'page': page
-            }
-        )
-        response.raise_for_status()
-        data = response.json()
+        data = _get("/search/movie", query=query, page=page)
         
         # Cache search results for 6 hours
-        cache.set(cache_key, data, 60 * 60 * 6)
+        _cache_payloads({cache_key: data}, SEARCH_CACHE_TIMEOUT)
         
         return data
-    except requests.exceptions.RequestException as e:
+    except (requests.exceptions.RequestException, RateLimitExceeded) as e:
         logger.error(f"Error searching movies: {e}")
         return {'results': [], 'error': str(e)}
 
-def get_movie_details(movie_id):
+def get_movie_details(movie_id, refresh=False):
     """
     Get detailed information about a specific movie
+    refresh: bypass the cache and re-fetch (used by the cache warmer)
     """
-    cache_key = f'movie_details:{movie_id}'
-    cached_data = cache.get(cache_key)
+    cache_key = details_cache_key(movie_id)
+    cached_data = None if refresh else cache.get(cache_key)
     
     if cached_data:
+        metrics.record_cache('get_movie_details', 'hit')
         return cached_data
+    metrics.record_cache('get_movie_details', 'stale' if refresh else 'miss')
+    
+    data = _fetch_movie_details(movie_id)
+    
+    if 'error' not in data:
+        # Cache movie details for 7 days
+        _cache_payloads({cache_key: data}, DETAILS_CACHE_TIMEOUT)
+    
+    return data
+
+def get_movie_details_many(movie_ids):
+    """
+    Get details for several movies with one cache round trip.
+    Misses are fetched from TMDb concurrently and written back in one go.
+    
+    Returns a dict mapping each movie ID to its details, or to
+    {'error': ...} when TMDb could not provide them.
+    """
+    cache_keys = {movie_id: details_cache_key(movie_id) for movie_id in movie_ids}
+    cached = cache.get_many(list(cache_keys.values()))
+    
+    missing = [movie_id for movie_id, key in cache_keys.items() if not cached.get(key)]
+    metrics.record_cache('get_movie_details_many', 'hit', len(cache_keys) - len(missing))
+    metrics.record_cache('get_movie_details_many', 'miss', len(missing))
+    fetched = {}
+    if missing:
+        lane = rate_limiter.current_lane()
+        
+        def fetch(movie_id):
+            # Worker threads do not inherit the caller's rate limiter lane
+            with rate_limiter.lane(lane):
+                return _fetch_movie_details(movie_id)
+        
+        with ThreadPoolExecutor(max_workers=min(BATCH_MAX_WORKERS, len(missing))) as executor:
+            fetched = dict(zip(missing, executor.map(fetch, missing)))
+        
+        # Cache movie details for 7 days
+        _cache_payloads({
+            cache_keys[movie_id]: data
+            for movie_id, data in fetched.items() if 'error' not in data
+        }, DETAILS_CACHE_TIMEOUT)
     
+    return {
+        movie_id: fetched[movie_id] if movie_id in fetched else cached[key]
+        for movie_id, key in cache_keys.items()
+    }
+
+def _fetch_movie_details(movie_id):
+    """
+    Fetch movie details from TMDb, bypassing the cache
+    """
+    try:
+        return _get(f"/movie/{movie_id}")
+    except (requests.exceptions.RequestException, RateLimitExceeded) as e:
+        logger.error(f"Error fetching movie details: {e}")
+        return {'error': str(e)}
+
+def _get(path, **params):
+    """
+    GET a TMDb endpoint once the shared rate limiter grants a token
+    """
+    rate_limiter.limiter.acquire()
+    started = time.perf_counter()
+    status = 'error'  # No response at all
     try:
-        url = f"{BASE_URL}/movie/{movie_id}"
         response = requests.get(
-            url,
+            f"{BASE_URL}{path}",
             params={
                 'api_key': TMDB_API_KEY,
+                **params
             }
         )
-        response.raise_for_status()
-        data = response.json()
-        
-        # Cache movie details for 7 days
-        cache.set(cache_key, data, 60 * 60 * 24 * 7)
-        
-        return data
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Error fetching movie details: {e}")
-        return {'error': str(e)}
\ No newline at end of file
+        status = response.status_code
+    finally:
+        metrics.TMDB_REQUEST_DURATION.labels(metrics.tmdb_endpoint(path), status).observe(
+            time.perf_counter() - started
+        )
+    response.raise_for_status()
+    return response.json()
\ No newline at end of file
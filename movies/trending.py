@@ -0,0 +1,290 @@
+# movies/trending.py
+
+import logging
+import math
+import time
+from django_redis import get_redis_connection
+from redis.exceptions import RedisError
+from . import resolver
+from .search import PAGE_SIZE, RESULT_FIELDS, parse_page
+
+logger = logging.getLogger(__name__)
+
+# Trending windows and the half-life of an event's weight in each (seconds)
+WINDOWS = {
+    'hour': 60 * 60,
+    'day': 60 * 60 * 24,
+    'week': 60 * 60 * 24 * 7,
+}
+
+# How much each kind of user activity counts towards trending
+EVENT_WEIGHTS = {
+    'favorite': 3.0,
+    'rating': 1.0,
+}
+
+# Raw activity is also counted per 5 minutes, kept long enough to rebuild
+# the weekly window from it
+BUCKET_SECONDS = 60 * 5
+BUCKET_RETENTION = WINDOWS['week'] + 2 * BUCKET_SECONDS
+
+# Movies kept per window when it is rebuilt
+MAX_TRENDING = 1000
+# Rebuilt scores (relative to the rebuild time) below this are dropped
+MIN_SCORE = 1e-3
+
+# Rebuild before scores grow too large to be exact; normally the hourly
+# rebuild_local_trending task runs long before this
+REBASE_AFTER = 60 * 60 * 24
+
+# Seconds clients may cache a page of local trending
+CACHE_MAX_AGE = 60
+
+EPOCH_KEY = 'trending:local:epoch'
+
+
+def window_key(window):
+    return f'trending:local:{window}'
+
+
+def last_activity_key(window):
+    return f'trending:local:{window}:last'
+
+
+def bucket_key(bucket_start):
+    return f'trending:local:bucket:{bucket_start}'
+
+
+# Windows slide: each one also keeps the time of every movie's latest
+# event, and movies whose latest event is older than the window are removed
+# (with that entry) whenever the window is written or read, so each
+# removal happens once.
+PRUNE = """
+local function prune(window_key, last_key, before)
+    local stale = redis.call('ZRANGEBYSCORE', last_key, '-inf', '(' .. before)
+    for i = 1, #stale, 5000 do
+        local chunk = {unpack(stale, i, math.min(i + 4999, #stale))}
+        redis.call('ZREM', window_key, unpack(chunk))
+        redis.call('ZREM', last_key, unpack(chunk))
+    end
+end
+"""
+
+# Scores use forward decay: an event at time t adds weight * 2^((t - epoch) / half_life)
+# to its movie's score, which never has to be updated again. Every score
+# would be multiplied by the same 2^(-(now - epoch) / half_life) to get its
+# value today, so the sorted set order already is the decayed ranking.
+# Recording an event is two sorted set writes per window plus one for the
+# bucket; reading the top K is one ZREVRANGE. Between rebuilds, a movie
+# still active in a window keeps its decayed older activity as well.
+# KEYS: epoch, bucket, then each window's set and last-activity set.
+# ARGV: now, weight, retention, window count, half-lives, window lengths,
+# then the movie IDs.
+RECORD_SCRIPT = PRUNE + """
+local now = tonumber(ARGV[1])
+local weight = tonumber(ARGV[2])
+local retention = tonumber(ARGV[3])
+local windows = tonumber(ARGV[4])
+local first_movie = 5 + 2 * windows
+
+local epoch = tonumber(redis.call('GET', KEYS[1]))
+if not epoch then
+    epoch = now
+    redis.call('SET', KEYS[1], tostring(now))
+end
+
+for i = 1, windows do
+    local half_life = tonumber(ARGV[4 + i])
+    local window_key, last_key = KEYS[1 + 2 * i], KEYS[2 + 2 * i]
+    local decayed = weight * math.pow(2, (now - epoch) / half_life)
+    for j = first_movie, #ARGV do
+        redis.call('ZINCRBY', window_key, decayed, ARGV[j])
+        redis.call('ZADD', last_key, 'GT', now, ARGV[j])
+    end
+    prune(window_key, last_key, now - tonumber(ARGV[4 + windows + i]))
+end
+for j = first_movie, #ARGV do
+    redis.call('ZINCRBY', KEYS[2], weight, ARGV[j])
+end
+redis.call('EXPIRE', KEYS[2], retention)
+return tostring(now - epoch)
+"""
+
+# Re-derive every window with a new epoch (now) from the buckets that
+# overlap it, dating each bucket's events at its middle. Movies whose
+# latest event is outside the window or whose score is negligible are
+# dropped, and only the MAX_TRENDING best are kept.
+# KEYS: epoch, each window's set and last-activity set, then the buckets
+# newest first. ARGV: now, max movies, min score, window count, then per
+# window its half-life, length and number of buckets, then the start
+# time of each bucket.
+REBUILD_SCRIPT = PRUNE + """
+local now = tonumber(ARGV[1])
+local keep = tonumber(ARGV[2])
+local min_score = ARGV[3]
+local windows = tonumber(ARGV[4])
+local first_bucket = 2 + 2 * windows
+local first_start = 5 + 3 * windows
+
+for i = 1, windows do
+    local half_life = tonumber(ARGV[2 + 3 * i])
+    local length = tonumber(ARGV[3 + 3 * i])
+    local buckets = tonumber(ARGV[4 + 3 * i])
+    local window_key, last_key = KEYS[2 * i], KEYS[1 + 2 * i]
+
+    local args = {'ZUNIONSTORE', window_key, buckets}
+    for b = 0, buckets - 1 do
+        table.insert(args, KEYS[first_bucket + b])
+    end
+    table.insert(args, 'WEIGHTS')
+    for b = 0, buckets - 1 do
+        local middle = tonumber(ARGV[first_start + b]) + tonumber(ARGV[#ARGV]) / 2
+        table.insert(args, tostring(math.pow(2, (middle - now) / half_life)))
+    end
+    redis.call(unpack(args))
+
+    -- Keep the movies still active in the window
+    prune(window_key, last_key, now - length)
+    redis.call('ZINTERSTORE', window_key, 2, window_key, last_key, 'WEIGHTS', 1, 0)
+    redis.call('ZREMRANGEBYSCORE', window_key, '-inf', '(' .. min_score)
+    redis.call('ZREMRANGEBYRANK', window_key, 0, -keep - 1)
+end
+redis.call('SET', KEYS[1], tostring(now))
+return #KEYS - first_bucket + 1
+"""
+
+# Prune a window, then read a page of it. KEYS: epoch, the window's set
+# and last-activity set. ARGV: now, window length, first and last rank.
+TOP_SCRIPT = PRUNE + """
+prune(KEYS[2], KEYS[3], tonumber(ARGV[1]) - tonumber(ARGV[2]))
+return {
+    redis.call('GET', KEYS[1]) or false,
+    redis.call('ZREVRANGE', KEYS[2], ARGV[3], ARGV[4], 'WITHSCORES'),
+    redis.call('ZCARD', KEYS[2]),
+}
+"""
+
+
+def _window_keys():
+    return [key for window in WINDOWS for key in (window_key(window), last_activity_key(window))]
+
+
+class LocalTrending:
+    """
+    Trending movies computed from our own users' favorites and ratings, kept
+    in Redis. Does nothing (and serves nothing) when the default cache is
+    not Redis, e.g. in tests.
+    """
+
+    def __init__(self):
+        self._redis = None
+        self._scripts = None
+
+    def _connection(self):
+        if self._redis is None:
+            try:
+                redis = get_redis_connection('default')
+            except NotImplementedError:
+                # Default cache is not django-redis
+                self._redis = False
+            else:
+                self._scripts = tuple(
+                    redis.register_script(script) for script in (RECORD_SCRIPT, REBUILD_SCRIPT, TOP_SCRIPT)
+                )
+                self._redis = redis
+        return self._redis or None
+
+    def record(self, event, movie_ids, now=None):
+        """
+        Count an event (a key of EVENT_WEIGHTS) for each of the local movie IDs.
+        """
+        redis = self._connection()
+        if redis is None or not movie_ids:
+            return
+        now = time.time() if now is None else now
+        bucket_start = int(now // BUCKET_SECONDS * BUCKET_SECONDS)
+        try:
+            age = float(self._scripts[0](
+                keys=[EPOCH_KEY, bucket_key(bucket_start), *_window_keys()],
+                args=[now, EVENT_WEIGHTS[event], BUCKET_RETENTION, len(WINDOWS),
+                      *WINDOWS.values(), *WINDOWS.values(), *movie_ids],
+            ))
+            if age > REBASE_AFTER:
+                self.rebuild(now)
+        except RedisError as e:
+            logger.warning(f"Could not record {event} events for local trending: {e}")
+
+    def rebuild(self, now=None):
+        """
+        Recompute every window from the buckets it spans, which re-bases
+        the scores on the current time and drops movies that fell out of
+        the window or out of the top MAX_TRENDING. Returns the number of
+        buckets read, or None without Redis.
+        """
+        redis = self._connection()
+        if redis is None:
+            return None
+        now = time.time() if now is None else now
+        newest = int(now // BUCKET_SECONDS * BUCKET_SECONDS)
+        # Newest first; a window reads every bucket overlapping it
+        starts = list(range(newest, int(now - max(WINDOWS.values())) - BUCKET_SECONDS, -BUCKET_SECONDS))
+        window_args = []
+        for length in WINDOWS.values():
+            buckets = sum(1 for start in starts if start + BUCKET_SECONDS > now - length)
+            window_args += [length, length, buckets]
+        return self._scripts[1](
+            keys=[EPOCH_KEY, *_window_keys(), *map(bucket_key, starts)],
+            args=[now, MAX_TRENDING, MIN_SCORE, len(WINDOWS), *window_args, *starts, BUCKET_SECONDS],
+        )
+
+    def top(self, window, offset=0, count=PAGE_SIZE, now=None):
+        """
+        (movie IDs, decayed scores, total movies) of the movies active in
+        the window, best first, or None without Redis.
+        """
+        redis = self._connection()
+        if redis is None:
+            return None
+        now = time.time() if now is None else now
+        try:
+            epoch, entries, total = self._scripts[2](
+                keys=[EPOCH_KEY, window_key(window), last_activity_key(window)],
+                args=[now, WINDOWS[window], offset, offset + count - 1],
+            )
+        except RedisError as e:
+            logger.warning(f"Could not read local trending: {e}")
+            return None
+        decay = math.pow(2, -(now - float(epoch or now)) / WINDOWS[window])
+        movie_ids = [int(movie_id) for movie_id in entries[::2]]
+        return movie_ids, [float(score) * decay for score in entries[1::2]], total
+
+
+trending = LocalTrending()
+
+
+def trending_movies(window='week', page=1):
+    """
+    A page of locally trending movies as a TMDb-shaped payload, whose
+    results carry the TMDb ID as 'id' and the decayed activity score as
+    'trending_score'. None when local trending is unavailable (no Redis).
+    """
+    page = parse_page(page)
+    top = trending.top(window, (page - 1) * PAGE_SIZE, PAGE_SIZE)
+    if top is None:
+        return None
+    movie_ids, scores, total = top
+    scores = dict(zip(movie_ids, scores))
+    return {
+        'page': page,
+        'results': [
+            {
+                'id': row['tmdb_id'],
+                **{field: row[field] for field in RESULT_FIELDS[1:]},
+                'trending_score': round(scores[row['id']], 4),
+            }
+            for row in resolver.hydrate_movies(movie_ids)
+        ],
+        'total_pages': -(-total // PAGE_SIZE),
+        'total_results': total,
+        'source': 'local',
+    }
@@ -2,7 +2,7 @@ from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 from . import views
-from .views import MovieRecommendationView, FavoriteMovieView
+from .views import MovieRecommendationView, FavoriteMovieView, RatingBatchView
 
 # Create a router for ViewSets
 router = DefaultRouter()
@@ -25,7 +25,16 @@ urlpatterns = [
     path('trending/', views.get_trending_movies, name='trending-movies'),
     path('search/', views.search_movies, name='search-movies'),
     path('details/<int:movie_id>/', views.get_movie_details, name='movie-details'),
+    path('details/batch/', views.get_movie_details_batch, name='movie-details-batch'),
+
+    # Ratings
+    path('ratings/', RatingBatchView.as_view(), name='rating-batch'),
+
+    # Request profiles (admins only)
+    path('profiles/<str:request_id>/', views.get_request_profile, name='request-profile'),
+    path('profiles/<str:request_id>/stats/', views.download_request_profile, name='request-profile-stats'),
 
     # Favorite Movies (Replaces User Profile)
+    path('favorites/', views.FavoriteListView.as_view(), name='favorite-list'),
     path('favorites/<int:movie_id>/', FavoriteMovieView.as_view(), name='favorite-movie'),
 ]
@@ -1,21 +1,133 @@
-from rest_framework import viewsets, status, permissions
+from urllib.parse import parse_qs, urlsplit
+from rest_framework import generics, viewsets, status, permissions
 from rest_framework.decorators import api_view, permission_classes
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 from rest_framework.views import APIView
+from django.http import Http404, HttpResponse
 from django.shortcuts import get_object_or_404
-from .recommendation import MovieRecommender
-from .serializers import MovieSerializer, UserSerializer, FavoriteMovieSerializer
-from .models import Movie, FavoriteMovie
-from . import tmdb_api
+from django.core.cache import cache
+from django.utils.cache import patch_cache_control
+from .recommendation import MovieRecommender, UserContext
+from .serializers import (
+    MovieSerializer, UserSerializer, FavoriteMovieSerializer, RatingBatchSerializer,
+    favorite_dicts, movie_dicts, movie_values
+)
+from .models import Movie, FavoriteMovie, Rating
+from .signals import ratings_updated
+from .conditional import make_etag, not_modified, set_validators
+from .metrics import RECOMMENDER_STAGE_DURATION
+from .pagination import FavoriteCursorPagination, MovieCursorPagination
+from . import favorites, profiling, resolver, search, similar_movies, tmdb_api, trending
 
 
 class MovieViewSet(viewsets.ModelViewSet):
     """
     ViewSet for managing movies.
+    
+    Lists are cursor-paginated on id. Both list and detail accept a
+    `fields` query parameter (comma-separated MovieSerializer fields) that
+    limits the columns read, and answer conditional requests with 304.
     """
     queryset = Movie.objects.all()
     serializer_class = MovieSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = MovieCursorPagination
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ('list', 'retrieve'):
+            queryset = queryset.only(*self.requested_fields(), 'updated_at')
+        return queryset
+
+    def requested_fields(self):
+        """
+        Fields selected with ?fields=, in MovieSerializer order.
+        """
+        fields = MovieSerializer.Meta.fields
+        requested = self.request.query_params.get('fields')
+        if not requested:
+            return fields
+        
+        requested = {field.strip() for field in requested.split(',') if field.strip()}
+        unknown = requested.difference(fields)
+        if unknown or not requested:
+            raise ValidationError({'fields': f"Choose from {', '.join(fields)}"})
+        return [field for field in fields if field in requested]
+
+    def list(self, request, *args, **kwargs):
+        """
+        List one page of movies. Page membership and the ETag come from an
+        (id, updated_at) scan, so an unchanged page is answered with 304
+        before any other column is read. Pages get no Last-Modified: a
+        deleted or shifted row would not move it forward, so only the
+        ETag, which covers membership, is sent.
+        """
+        fields = self.requested_fields()
+        queryset = self.filter_queryset(self.get_queryset())
+        
+        page = self.paginate_queryset(queryset.only('id', 'updated_at'))
+        etag = make_etag(
+            fields, [(movie.id, movie.updated_at) for movie in page],
+            self.paginator.has_next, self.paginator.has_previous
+        )
+        
+        response = not_modified(request, etag)
+        if response is not None:
+            return response
+        
+        # Rows come from a .values() projection, keyed by ID to keep the page order
+        ids = [movie.id for movie in page]
+        read_fields = fields if 'id' in fields else ['id', *fields]
+        rows = {row['id']: row for row in movie_values(queryset.filter(id__in=ids), read_fields)}
+        data = [rows[movie_id] for movie_id in ids if movie_id in rows]
+        if 'id' not in fields:
+            for row in data:
+                del row['id']
+        return set_validators(self.get_paginated_response(data), etag)
+
+    def retrieve(self, request, *args, **kwargs):
+        """
+        Retrieve one movie, or 304 if the client's copy is current.
+        """
+        fields = self.requested_fields()
+        movie = self.get_object()
+        
+        etag = make_etag(fields, movie.id, movie.updated_at)
+        response = not_modified(request, etag, movie.updated_at)
+        if response is not None:
+            return response
+        
+        return set_validators(Response(movie_dicts([movie], fields)[0]), etag, movie.updated_at)
+
+
+def _not_modified_from_cache(request, cache_key, max_age):
+    """
+    Answer a conditional request from the ETag stored next to a cached TMDb
+    payload, without reading the payload itself. Returns None when the
+    client's copy is not current (or it sent no If-None-Match).
+    """
+    if 'HTTP_IF_NONE_MATCH' not in request.META:
+        return None
+    etag = tmdb_api.stored_etag(cache_key)
+    response = not_modified(request, etag) if etag else None
+    if response is not None:
+        patch_cache_control(response, private=True, max_age=max_age)
+    return response
+
+
+def _cacheable_response(request, data, max_age, cache_key=None, etag=None):
+    """
+    Response for a payload clients may cache for max_age seconds (the
+    payload's cache TTL). The ETag is the one stored with the cached
+    payload, so it is not rehashed per request; payloads without one are
+    hashed on the spot.
+    """
+    etag = etag or (cache_key and tmdb_api.stored_etag(cache_key)) or make_etag(data)
+    response = not_modified(request, etag) or set_validators(Response(data), etag)
+    patch_cache_control(response, private=True, max_age=max_age)
+    return response
 
 
 @api_view(['GET'])
@@ -23,12 +135,33 @@ class MovieViewSet(viewsets.ModelViewSet):
 def get_trending_movies(request):
     """
     Fetch trending movies from TMDb.
+    
+    With ?mode=local, trending is computed from this site's own favorites
+    and ratings (see movies/trending.py) and time_window may also be 'hour';
+    without Redis it falls back to TMDb.
     """
     time_window = request.query_params.get('time_window', 'week')
     page = request.query_params.get('page', 1)
+    mode = request.query_params.get('mode', 'tmdb')
+    if mode not in ('tmdb', 'local'):
+        raise ValidationError({'mode': "Expected 'tmdb' or 'local'."})
+    
+    if mode == 'local':
+        if time_window not in trending.WINDOWS:
+            raise ValidationError({'time_window': f"Expected one of: {', '.join(trending.WINDOWS)}."})
+        data = trending.trending_movies(time_window, page)
+        if data is not None:
+            return _cacheable_response(request, data, trending.CACHE_MAX_AGE)
+    
+    cache_key = tmdb_api.trending_cache_key(time_window, page)
+    response = _not_modified_from_cache(request, cache_key, tmdb_api.TRENDING_CACHE_TIMEOUT)
+    if response is not None:
+        return response
     
     data = tmdb_api.get_trending_movies(time_window, page)
-    return Response(data)
+    if 'error' in data:
+        return Response(data)
+    return _cacheable_response(request, data, tmdb_api.TRENDING_CACHE_TIMEOUT, cache_key)
 
 
 @api_view(['GET'])
@@ -36,17 +169,38 @@ def get_trending_movies(request):
 def get_movie_recommendations(request, movie_id):
     """
     Fetch movie recommendations based on a given movie ID.
+    
+    With ?mode=local, similar movies come from the locally precomputed
+    neighbor store (see movies/similar_movies.py); movies it does not know
+    fall back to TMDb's recommendations.
     """
     page = request.query_params.get('page', 1)
+    mode = request.query_params.get('mode', 'tmdb')
+    if mode not in ('tmdb', 'local'):
+        raise ValidationError({'mode': "Expected 'tmdb' or 'local'."})
+    
+    if mode == 'local':
+        data = similar_movies.similar_movies(movie_id, page)
+        if data is not None:
+            etag = make_etag('similar', similar_movies.current_store()['version'], movie_id, data['page'])
+            return _cacheable_response(request, data, similar_movies.STORE_CHECK_INTERVAL, etag=etag)
+    
+    cache_key = tmdb_api.recommendations_cache_key(movie_id, page)
+    response = _not_modified_from_cache(request, cache_key, tmdb_api.RECOMMENDATIONS_CACHE_TIMEOUT)
+    if response is not None:
+        return response
+    
     data = tmdb_api.get_movie_recommendations(movie_id, page)
-    return Response(data)
+    if 'error' in data:
+        return Response(data)
+    return _cacheable_response(request, data, tmdb_api.RECOMMENDATIONS_CACHE_TIMEOUT, cache_key)
 
 
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
 def search_movies(request):
     """
-    Search for movies in TMDb.
+    Search for movies, locally first and in TMDb when there are too few matches.
     """
     query = request.query_params.get('query', '').strip()
     page = request.query_params.get('page', 1)
@@ -57,8 +211,15 @@ def search_movies(request):
             status=status.HTTP_400_BAD_REQUEST
         )
     
-    data = tmdb_api.search_movies(query, page)
-    return Response(data)
+    data = search.search_movies(query, page)
+    if 'error' in data:
+        return Response(data)
+    
+    # Local answers are not cached, so only TMDb results have a stored ETag
+    cache_key = None
+    if data.get('source') != 'local':
+        cache_key = tmdb_api.search_cache_key(search.normalize_query(query), search.parse_page(page))
+    return _cacheable_response(request, data, tmdb_api.SEARCH_CACHE_TIMEOUT, cache_key)
 
 
 @api_view(['GET'])
@@ -67,12 +228,97 @@ def get_movie_details(request, movie_id):
     """
     Retrieve detailed information about a specific movie.
     """
-    data = tmdb_api.get_movie_details(movie_id)
+    cache_key = tmdb_api.details_cache_key(movie_id)
+    response = _not_modified_from_cache(request, cache_key, tmdb_api.DETAILS_CACHE_TIMEOUT)
+    if response is not None:
+        return response
+    
+    # The body may come from this process's details cache, which can lag the
+    # payload stored in Redis, so the ETag is the one kept with that body
+    data, etag = resolver.resolve_movie_details_with_etag(movie_id)
     
     if 'error' in data:
         return Response({"error": data['error']}, status=status.HTTP_404_NOT_FOUND)
     
-    return Response(data)
+    return _cacheable_response(request, data, tmdb_api.DETAILS_CACHE_TIMEOUT, etag=etag)
+
+
+def _stored_profile(request_id):
+    profile = profiling.get_profile(request_id)
+    if profile is None:
+        raise Http404("No profile is stored for this request id")
+    return profile
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAdminUser])
+def get_request_profile(request, request_id):
+    """
+    Summary and database query timings of a profiled request.
+    """
+    profile = _stored_profile(request_id)
+    return Response({key: value for key, value in profile.items() if key != 'stats'})
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAdminUser])
+def download_request_profile(request, request_id):
+    """
+    Download the cProfile stats of a profiled request, for pstats or snakeviz.
+    """
+    profile = _stored_profile(request_id)
+    return HttpResponse(
+        profile['stats'],
+        content_type='application/octet-stream',
+        headers={'Content-Disposition': f'attachment; filename="{request_id}.prof"'},
+    )
+
+
+MAX_DETAILS_BATCH = 100
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def get_movie_details_batch(request):
+    """
+    Retrieve details for up to MAX_DETAILS_BATCH movies in one call.
+    Takes a comma-separated `ids` query parameter and returns the results
+    in request order, with an error entry for each movie that failed.
+    """
+    try:
+        movie_ids = [
+            int(movie_id) for movie_id in request.query_params.get('ids', '').split(',')
+            if movie_id.strip()
+        ]
+    except ValueError:
+        return Response(
+            {"error": "ids must be a comma-separated list of integers"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    if not movie_ids:
+        return Response(
+            {"error": "Query parameter ids is required"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    if len(movie_ids) > MAX_DETAILS_BATCH:
+        return Response(
+            {"error": f"At most {MAX_DETAILS_BATCH} ids are allowed per request"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    details = resolver.resolve_movie_details_many(movie_ids)
+    
+    results = []
+    for movie_id in movie_ids:
+        data = details[movie_id]
+        if 'error' in data:
+            results.append({"id": movie_id, "error": data['error']})
+        else:
+            results.append({"id": movie_id, "data": data})
+    
+    return Response({"results": results})
 
 
 class UserRegistrationView(APIView):
@@ -92,6 +338,58 @@ class UserRegistrationView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+class FavoriteListView(generics.ListAPIView):
+    """
+    API view to list the user's favorite movies, newest first.
+    
+    Pages are keyset-paginated on added_at and read with one query; the
+    favorites on the first page are cached per user until their favorites
+    change. With ?mode=ids the response is just the TMDb IDs of all their
+    favorites.
+    """
+    serializer_class = FavoriteMovieSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = FavoriteCursorPagination
+
+    def get_queryset(self):
+        return FavoriteMovie.objects.filter(user=self.request.user).select_related('movie')
+
+    def list(self, request, *args, **kwargs):
+        mode = request.query_params.get('mode', 'full')
+        if mode not in ('full', 'ids'):
+            raise ValidationError({'mode': "Expected 'full' or 'ids'."})
+        if mode == 'ids':
+            return Response({'ids': favorites.favorite_tmdb_ids(request.user.id)})
+        
+        # Only the default first page is cached, as favorite rows that
+        # reference their movies by ID and the cursor of the next page.
+        # Movies are hydrated through the resolver, whose rows are dropped
+        # when a movie changes, and links are built for this request.
+        first_page = set(request.query_params) <= {'mode'}
+        key = favorites.first_page_cache_key(request.user.id)
+        cached = cache.get(key) if first_page else None
+        if isinstance(cached, tuple):
+            rows, next_cursor = cached
+            movies = {movie['id']: movie for movie in resolver.hydrate_movies([row['movie'] for row in rows])}
+            return Response({
+                'next': next_cursor and replace_query_param(
+                    request.build_absolute_uri(), self.paginator.cursor_query_param, next_cursor
+                ),
+                'previous': None,
+                'results': [{**row, 'movie': movies[row['movie']]} for row in rows if row['movie'] in movies],
+            })
+        
+        page = self.paginate_queryset(self.get_queryset())
+        rows = favorite_dicts(page, resolver.serialize_movies([favorite.movie for favorite in page]))
+        response = self.get_paginated_response(rows)
+        if first_page:
+            next_link = response.data['next']
+            next_cursor = next_link and parse_qs(urlsplit(next_link).query)[self.paginator.cursor_query_param][0]
+            rows = [{**row, 'movie': row['movie']['id']} for row in rows]
+            cache.add(key, (rows, next_cursor), favorites.FAVORITES_CACHE_TIMEOUT)
+        return response
+
+
 class FavoriteMovieView(APIView):
     """
     API view to manage user's favorite movies.
@@ -102,23 +400,11 @@ class FavoriteMovieView(APIView):
         """
         Add a movie to the user's favorites.
         """
-        # Fetch movie details from TMDb API
-        movie_data = tmdb_api.get_movie_details(movie_id)
-        
-        if 'error' in movie_data:
-            return Response({"error": movie_data['error']}, status=status.HTTP_404_NOT_FOUND)
-        
-        # Create or retrieve movie instance
-        movie, created = Movie.objects.get_or_create(
-            tmdb_id=movie_data['id'],
-            defaults={
-                'title': movie_data['title'],
-                'overview': movie_data['overview'],
-                'poster_path': movie_data.get('poster_path'),
-                'release_date': movie_data.get('release_date'),
-                'vote_average': movie_data.get('vote_average', 0.0)
-            }
-        )
+        # Resolve locally first, only asking TMDb for movies we have never seen
+        movie = resolver.resolve_movie(movie_id)
+        
+        if movie is None:
+            return Response({"error": "Movie not found"}, status=status.HTTP_404_NOT_FOUND)
 
         # Add movie to favorites
         favorite, created = FavoriteMovie.objects.get_or_create(user=request.user, movie=movie)
@@ -144,6 +430,46 @@ class FavoriteMovieView(APIView):
             )
 
 
+class RatingBatchView(APIView):
+    """
+    API view to submit many ratings at once.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        """
+        Rate up to RatingBatchSerializer.MAX_RATINGS movies (by TMDb ID) in one
+        upsert, then update the recommender state once for the whole batch.
+        """
+        serializer = RatingBatchSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        
+        ratings = serializer.validated_data['ratings']
+        movies = resolver.resolve_movies([item['movie_id'] for item in ratings])
+        
+        # One row per movie; the last rating submitted for a movie wins
+        rows = {}
+        missing = set()
+        for item in ratings:
+            movie = movies.get(item['movie_id'])
+            if movie is None:
+                missing.add(item['movie_id'])
+            else:
+                rows[movie.id] = item['rating']
+        
+        if rows:
+            Rating.objects.upsert_many(
+                [(request.user.id, movie_id, rating) for movie_id, rating in rows.items()]
+            )
+            ratings_updated.send(sender=Rating, user_ids=[request.user.id], movie_ids=list(rows))
+        
+        return Response({
+            'count': len(rows),
+            'missing': sorted(missing)
+        })
+
+
 class MovieRecommendationView(APIView):
     """
     API view to get personalized movie recommendations.
@@ -163,14 +489,16 @@ class MovieRecommendationView(APIView):
         except ValueError:
             count = 10
         
-        # Generate recommendations
+        # Generate recommendations, from the user's context shared by every count
         recommender = MovieRecommender()
-        recommended_movies = recommender.get_recommendations(user_id, count)
-        
-        # Serialize the recommendations
-        serializer = MovieSerializer(recommended_movies, many=True)
+        with RECOMMENDER_STAGE_DURATION.labels('user_context').time():
+            context = UserContext.cached(user_id)
+        recommended_ids = recommender.get_recommendations(user_id, count, context)
         
+        # Hydrate only the final recommendations
+        with RECOMMENDER_STAGE_DURATION.labels('hydrate').time():
+            recommended_movies = resolver.hydrate_movies(recommended_ids)
         return Response({
             'count': len(recommended_movies),
-            'recommendations': serializer.data
+            'recommendations': recommended_movies
         })
@@ -0,0 +1,77 @@
+# movies/warmup.py
+
+import logging
+import threading
+import time
+from django.http import JsonResponse
+from django.urls import get_resolver
+
+logger = logging.getLogger(__name__)
+
+_ready = threading.Event()
+_lock = threading.Lock()
+_background = None
+
+
+def warm_up():
+    """
+    Do in advance what the first requests of a fresh worker would otherwise
+    pay for: import the URLconf (and with it every view), load NumPy for
+    the recommender, read the recommender's rating version and load the
+    similar-movies store into memory. Database connections are left to the
+    threads that serve requests, since Django keeps one per thread.
+
+    Called by gunicorn's post_worker_init hook (gunicorn.conf.py), so each
+    worker is warm before it accepts requests. Safe to call repeatedly.
+    """
+    with _lock:
+        if _ready.is_set():
+            return
+        started = time.perf_counter()
+
+        get_resolver().url_patterns
+        from . import recommendation, similar_movies
+        # Imports NumPy and runs a first vectorized operation
+        recommendation.genre_bits([0])
+
+        recommendation.ratings_version()
+        similar_movies.current_store()
+
+        _ready.set()
+        logger.info("Worker warmed up in %.0f ms", (time.perf_counter() - started) * 1000)
+
+
+def is_ready():
+    return _ready.is_set()
+
+
+def warm_up_in_background():
+    """
+    Start warming this process up in a thread, unless it is warm or already warming.
+    """
+    global _background
+    with _lock:
+        if _ready.is_set() or (_background is not None and _background.is_alive()):
+            return
+        _background = threading.Thread(target=_warm_up_logging_errors, daemon=True)
+        _background.start()
+
+
+def _warm_up_logging_errors():
+    try:
+        warm_up()
+    except Exception:
+        # The next readiness probe starts another attempt
+        logger.exception("Warm-up failed")
+
+
+def readiness_view(request):
+    """
+    Readiness probe: 200 once this worker is warm, 503 until then. Workers
+    that were not warmed at boot (e.g. under runserver) start warming up on
+    the first probe.
+    """
+    if not is_ready():
+        warm_up_in_background()
+        return JsonResponse({'ready': False}, status=503)
+    return JsonResponse({'ready': True})